@@ -5,6 +5,8 @@ from .routes_fleet_sync import router as fleet_sync_router
 from .routes_fleet_direct import router as fleet_direct_router
 from .routes_fleet_supabase import router as fleet_supabase_router
 from .routes_auth import router as auth_router
+from .routes_jobs import router as jobs_router
+from .routes_fleet_events import router as fleet_events_router
 
 api_router = APIRouter()
 # Router public sans prefix pour que /.well-known soit accessible directement
@@ -13,4 +15,6 @@ api_router.include_router(auth_router, prefix="", tags=["auth"])
 api_router.include_router(fleet_router, prefix="", tags=["fleet"])
 api_router.include_router(fleet_sync_router, prefix="", tags=["fleet-sync"])
 api_router.include_router(fleet_direct_router, prefix="", tags=["fleet-direct"])
-api_router.include_router(fleet_supabase_router, prefix="", tags=["fleet-supabase"])
\ No newline at end of file
+api_router.include_router(fleet_supabase_router, prefix="", tags=["fleet-supabase"])
+api_router.include_router(jobs_router, prefix="", tags=["fleet-jobs"])
+api_router.include_router(fleet_events_router, prefix="", tags=["fleet-events"])
@@ -27,7 +27,7 @@ async def auth_callback(request: Request):
     Stocke le token dans Supabase avec une clé temporaire basée sur le state.
     """
     from fastapi.responses import RedirectResponse
-    from app.auth.supabase_store import get_supabase_store
+    from app.auth.pending_links import get_pending_link_store
     
     code = request.query_params.get("code")
     state = request.query_params.get("state")
@@ -57,16 +57,13 @@ async def auth_callback(request: Request):
         # Stocker dans TPStore pour la rétrocompatibilité
         TPStore.set_token(token)
         
-        # Stocker aussi dans Supabase avec une clé temporaire basée sur le state
+        # Stocker aussi le token en attente de liaison, indexé par le state
         # Le token sera lié à l'utilisateur lors de la première requête authentifiée
-        if state and settings.TOKEN_STORE_TYPE == "supabase":
+        if state:
             try:
-                store = get_supabase_store()
-                temp_key = f"temp_token:{state}"
-                expires_in = token.get("expires_in", 3600)
-                store.set(temp_key, token, ttl=expires_in)
+                get_pending_link_store().put(state, token)
             except Exception as e:
-                logger.warning(f"Impossible de stocker le token temporaire dans Supabase: {e}")
+                logger.warning(f"Impossible de stocker le token en attente de liaison: {e}")
         
         # Rediriger vers le frontend avec succès
         return RedirectResponse(
@@ -222,6 +219,8 @@ async def link_tesla_token(
     Cette route doit être appelée après le callback OAuth pour associer le token Tesla à l'utilisateur Supabase.
     """
     from app.auth.supabase_store import get_supabase_store
+    from app.auth.pending_links import get_pending_link_store
+    from app.auth.token_refresher import token_refresher
     
     user_id = user_info.get("user_id")
     if not user_id:
@@ -232,8 +231,7 @@ async def link_tesla_token(
     
     try:
         store = get_supabase_store()
-        temp_key = f"temp_token:{state}"
-        temp_token_data = store.get(temp_key)
+        temp_token_data = get_pending_link_store().take(state)
         
         if not temp_token_data:
             raise HTTPException(
@@ -245,9 +243,7 @@ async def link_tesla_token(
         user_key = f"user_token:{user_id}"
         expires_in = temp_token_data.get("expires_in", 3600)
         store.set(user_key, temp_token_data, ttl=expires_in)
-        
-        # Supprimer le token temporaire
-        store.delete(temp_key)
+        token_refresher.track(user_key, store.get(user_key))
         
         return {
             "success": True,
@@ -9,8 +9,8 @@ from app.core.settings import settings
 from app.auth.store_factory import get_token_store
 from app.auth.token_store import TokenStore
 from app.auth.supabase_store import SupabaseTokenStore
-from typing import Union
-from app.auth.partner_tokens import get_partner_token_cached
+from typing import Optional, Union
+from app.auth.partner_tokens import get_partner_token_cached, partner_cache_key
 from app.tesla.client import TeslaClient
 
 router = APIRouter(
@@ -28,20 +28,23 @@ def user_client_or_401(token: str | None):
     return TeslaClient(access_token=token)
 
 @router.get("/status")
-async def fleet_status(store: TokenStore = Depends(get_store)):
+async def fleet_status(
+    region: Optional[str] = Query(default=None, description="Région Fleet (eu/na, défaut: TESLA_REGION)."),
+    store: TokenStore = Depends(get_store),
+):
     """
     Statut de l'API Fleet (utilise le token partenaire).
     """
     try:
         try:
-            token = await get_partner_token_cached(store)
+            token = await get_partner_token_cached(store, region=region)
         except RuntimeError as e:
             raise HTTPException(
                 status_code=502,
                 detail=f"Impossible d'obtenir le token partenaire: {str(e)}"
             )
         
-        client = TeslaClient(access_token=token)
+        client = TeslaClient(base_url=settings.tesla_audience_for(region), access_token=token)
         return await client.status()
     except HTTPException:
         raise
@@ -57,7 +60,10 @@ async def fleet_status(store: TokenStore = Depends(get_store)):
 # ============================================================================
 
 @router.get("/partner/telemetry-errors")
-async def partner_telemetry_errors(store: TokenStore = Depends(get_store)):
+async def partner_telemetry_errors(
+    region: Optional[str] = Query(default=None, description="Région Fleet (eu/na, défaut: TESLA_REGION)."),
+    store: TokenStore = Depends(get_store),
+):
     """
     Récupère les erreurs de télémétrie de la flotte partenaire.
     Note: Cet endpoint nécessite un token partenaire (client_credentials) ET que l'application
@@ -70,14 +76,14 @@ async def partner_telemetry_errors(store: TokenStore = Depends(get_store)):
     """
     try:
         try:
-            token = await get_partner_token_cached(store)  # partner token requis
+            token = await get_partner_token_cached(store, region=region)  # partner token requis
         except RuntimeError as e:
             raise HTTPException(
                 status_code=502,
                 detail=f"Impossible d'obtenir le token partenaire: {str(e)}"
             )
         
-        client = TeslaClient(access_token=token)
+        client = TeslaClient(base_url=settings.tesla_audience_for(region), access_token=token)
         
         # Utiliser un timeout plus long pour cet endpoint qui peut être lent
         try:
@@ -113,7 +119,10 @@ async def partner_telemetry_errors(store: TokenStore = Depends(get_store)):
 
 # DEBUG: te permet de vérifier ton token partenaire
 @router.get("/partner/token-debug")
-async def partner_token_debug(store: TokenStore = Depends(get_store)):
+async def partner_token_debug(
+    region: Optional[str] = Query(default=None, description="Région Fleet (eu/na, défaut: TESLA_REGION)."),
+    store: TokenStore = Depends(get_store),
+):
     """
     Debug: Affiche les infos du token partenaire (scopes, audience, etc.)
     """
@@ -126,16 +135,16 @@ async def partner_token_debug(store: TokenStore = Depends(get_store)):
             "tesla_client_id_set": bool(settings.TESLA_CLIENT_ID),
             "tesla_client_secret_set": bool(settings.TESLA_CLIENT_SECRET),
             "auth_base": settings.TESLA_AUTH_BASE,
-            "audience": settings.tesla_audience_for(),
+            "audience": settings.tesla_audience_for(region),
         }
     
     try:
         # Essayer d'obtenir un token depuis le cache
-        cached_token = store.get("tesla:partner_token:eu")
+        cached_token = store.get(partner_cache_key(region))
         if cached_token and store.valid(cached_token):
             return {
                 "access_token_preview": cached_token.get("access_token", "")[:12] + "...",
-                "audience": settings.tesla_audience_for(),
+                "audience": settings.tesla_audience_for(region),
                 "auth_base": settings.TESLA_AUTH_BASE,
                 "scopes": cached_token.get("scope"),
                 "expires_in": cached_token.get("expires_in"),
@@ -150,14 +159,14 @@ async def partner_token_debug(store: TokenStore = Depends(get_store)):
             "tp_client_id_set": bool(settings.TP_CLIENT_ID),
             "tp_client_secret_set": bool(settings.TP_CLIENT_SECRET),
             "auth_base": settings.TESLA_AUTH_BASE,
-            "audience": settings.tesla_audience_for(),
+            "audience": settings.tesla_audience_for(region),
             "expected_client_id": "cacad6ff-48dd-4e8f-b521-8180d0865b94",
         }
         
         # Essayer avec TESLA_CLIENT_ID d'abord
         if settings.TESLA_CLIENT_ID and settings.TESLA_CLIENT_SECRET:
             try:
-                token_obj = await fetch_partner_token(use_tp_credentials=False)
+                token_obj = await fetch_partner_token(use_tp_credentials=False, region=region)
                 result.update({
                     "access_token_preview": token_obj.access_token[:12] + "...",
                     "scopes": token_obj.scope,
@@ -175,7 +184,7 @@ async def partner_token_debug(store: TokenStore = Depends(get_store)):
         # Si TESLA_CLIENT_ID échoue, essayer avec TP_CLIENT_ID
         if settings.TP_CLIENT_ID and settings.TP_CLIENT_SECRET:
             try:
-                token_obj = await fetch_partner_token(use_tp_credentials=True)
+                token_obj = await fetch_partner_token(use_tp_credentials=True, region=region)
                 result.update({
                     "access_token_preview": token_obj.access_token[:12] + "...",
                     "scopes": token_obj.scope,
@@ -203,7 +212,7 @@ async def partner_token_debug(store: TokenStore = Depends(get_store)):
             "tp_client_id_set": bool(settings.TP_CLIENT_ID),
             "tp_client_secret_set": bool(settings.TP_CLIENT_SECRET),
             "auth_base": settings.TESLA_AUTH_BASE,
-            "audience": settings.tesla_audience_for(),
+            "audience": settings.tesla_audience_for(region),
             "expected_client_id": "cacad6ff-48dd-4e8f-b521-8180d0865b94",
         }
     except Exception as e:
@@ -215,14 +224,17 @@ async def partner_token_debug(store: TokenStore = Depends(get_store)):
             "tp_client_id_set": bool(settings.TP_CLIENT_ID),
             "tp_client_secret_set": bool(settings.TP_CLIENT_SECRET),
             "auth_base": settings.TESLA_AUTH_BASE,
-            "audience": settings.tesla_audience_for(),
+            "audience": settings.tesla_audience_for(region),
             "expected_client_id": "cacad6ff-48dd-4e8f-b521-8180d0865b94",
         }
 
 @router.post("/partner/register")
-async def partner_register(store: TokenStore = Depends(get_store)):
+async def partner_register(
+    region: Optional[str] = Query(default=None, description="Région Fleet (eu/na, défaut: TESLA_REGION)."),
+    store: TokenStore = Depends(get_store),
+):
     """
-    Enregistre l'application dans la région courante (résout le 412).
+    Enregistre l'application dans la région demandée (défaut: TESLA_REGION, résout le 412).
     Nécessite un partner token (client-credentials).
     
     Note: Le domaine doit être un vrai domaine (pas localhost) pour être accepté par Tesla.
@@ -238,7 +250,7 @@ async def partner_register(store: TokenStore = Depends(get_store)):
         # Essayer d'obtenir le token partenaire depuis le cache d'abord
         token = None
         try:
-            token = await get_partner_token_cached(store)
+            token = await get_partner_token_cached(store, region=region)
         except RuntimeError as e:
             # Si le cache échoue, essayer avec TP credentials (au cas où vous utilisez le même CLIENT_ID)
             error_msg = str(e)
@@ -246,10 +258,10 @@ async def partner_register(store: TokenStore = Depends(get_store)):
                 # Essayer avec TP credentials si disponibles
                 if settings.TP_CLIENT_ID and settings.TP_CLIENT_SECRET:
                     try:
-                        token_obj = await fetch_partner_token(use_tp_credentials=True)
+                        token_obj = await fetch_partner_token(use_tp_credentials=True, region=region)
                         # Mettre en cache
                         ttl = max(60, int(token_obj.expires_in) - 60)
-                        store.set("tesla:partner_token:eu", token_obj.model_dump(), ttl=ttl)
+                        store.set(partner_cache_key(region), token_obj.model_dump(), ttl=ttl)
                         token = token_obj.access_token
                     except Exception as e2:
                         raise HTTPException(
@@ -285,7 +297,7 @@ async def partner_register(store: TokenStore = Depends(get_store)):
                 detail="Impossible d'obtenir un token partenaire valide"
             )
         
-        client = TeslaClient(access_token=token)
+        client = TeslaClient(base_url=settings.tesla_audience_for(region), access_token=token)
 
         domain = (getattr(settings, "APP_DOMAIN", None) or "").strip()
         if not domain:
@@ -378,7 +390,10 @@ async def partner_register(store: TokenStore = Depends(get_store)):
         )
 
 @router.get("/partner/public-key")
-async def partner_public_key(store: TokenStore = Depends(get_store)):
+async def partner_public_key(
+    region: Optional[str] = Query(default=None, description="Région Fleet (eu/na, défaut: TESLA_REGION)."),
+    store: TokenStore = Depends(get_store),
+):
     """
     Récupère la clé publique enregistrée pour le domaine partenaire.
     Note: Cet endpoint nécessite des scopes que le token partenaire (client_credentials)
@@ -386,14 +401,14 @@ async def partner_public_key(store: TokenStore = Depends(get_store)):
     """
     try:
         try:
-            token = await get_partner_token_cached(store)
+            token = await get_partner_token_cached(store, region=region)
         except RuntimeError as e:
             raise HTTPException(
                 status_code=502,
                 detail=f"Impossible d'obtenir le token partenaire: {str(e)}"
             )
         
-        client = TeslaClient(access_token=token)
+        client = TeslaClient(base_url=settings.tesla_audience_for(region), access_token=token)
         domain = (getattr(settings, "APP_DOMAIN", None) or "").strip()
         if not domain:
             raise HTTPException(status_code=400, detail="APP_DOMAIN manquant dans la configuration")
@@ -3,12 +3,26 @@ Endpoints DIRECT - Appels directs à l'API Tesla sans cache.
 Ces endpoints sont utilisés pour les actions qui nécessitent une réponse en temps réel.
 """
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException, Path
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from app.auth.supabase_auth import require_supabase_user
 from app.auth.oauth_third_party import ensure_user_access_token
+from app.core.settings import settings
+from app.core.streaming import NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE, STREAMING_HEADERS, ndjson_line, sse_event, wants_sse
+from app.schemas.fleet_batch import BatchCommandRequest, StreamFormat
+from app.services.idempotency import HEADER as IDEMPOTENCY_HEADER, run_idempotent
+from app.services.proxy_cache import CachedProxyResponse, proxy_cache
+from app.services.vehicle_cache import VehicleCacheService
 from app.tesla.client import TeslaClient
+from app.tesla.commands import run_batch
 from app.tesla.vcp import VCPError
 import httpx
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/fleet/direct",
@@ -36,125 +50,295 @@ async def get_tesla_client(user_info: dict) -> TeslaClient:
 # ACTIONS VÉHICULE (Wake, Lock, Unlock, Charge)
 # ============================================================================
 
+# Une relance avec la même clé rejoue le résultat au lieu de renvoyer la commande
+IdempotencyKey = Header(default=None, alias=IDEMPOTENCY_HEADER, description="Clé d'idempotence choisie par le client (relances)")
+
+
+async def _vehicle_command(
+    user_info: dict,
+    idempotency_key: Optional[str],
+    response: Response,
+    vehicle_id: str,
+    command: str,
+    call: Callable[[TeslaClient], Awaitable[dict]],
+    label: str,
+    **request_params,
+) -> dict:
+    async def run() -> dict:
+        try:
+            client = await get_tesla_client(user_info)
+            return await call(client)
+        except VCPError as e:
+            raise HTTPException(status_code=502, detail=f"Erreur {label}: {e}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+    request_parts = {"command": command, "vehicle_id": vehicle_id, **request_params}
+    return await run_idempotent(user_info.get("user_id"), idempotency_key, request_parts, response, run)
+
+
 @router.post("/vehicles/{vehicle_id}/wake")
 async def direct_wake(
+    response: Response,
     vehicle_id: str = Path(...),
+    wait: bool = Query(default=False, description="Attendre que le véhicule soit online"),
+    idempotency_key: Optional[str] = IdempotencyKey,
     user_info: dict = Depends(require_supabase_user),
 ):
     """
     Réveille un véhicule Tesla.
-    Appel direct à l'API Tesla (pas de cache).
+    Appel direct à l'API Tesla (pas de cache). Un seul réveil est envoyé à la fois
+    par véhicule ; avec wait=true la réponse arrive quand le véhicule est online.
     """
-    try:
-        client = await get_tesla_client(user_info)
-        return await client.wake_up(vehicle_id)
-    except VCPError as e:
-        raise HTTPException(status_code=502, detail=f"Erreur wake: {e}")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+    return await _vehicle_command(
+        user_info, idempotency_key, response, vehicle_id, "wake_up",
+        lambda client: client.wake_up(vehicle_id, wait=wait), "wake", wait=wait,
+    )
 
 
 @router.post("/vehicles/{vehicle_id}/lock")
 async def direct_lock(
+    response: Response,
     vehicle_id: str = Path(...),
+    idempotency_key: Optional[str] = IdempotencyKey,
     user_info: dict = Depends(require_supabase_user),
 ):
     """
     Verrouille un véhicule Tesla.
     Appel direct à l'API Tesla (pas de cache).
     """
-    try:
-        client = await get_tesla_client(user_info)
-        return await client.door_lock(vehicle_id)
-    except VCPError as e:
-        raise HTTPException(status_code=502, detail=f"Erreur lock: {e}")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+    return await _vehicle_command(
+        user_info, idempotency_key, response, vehicle_id, "door_lock",
+        lambda client: client.door_lock(vehicle_id), "lock",
+    )
 
 
 @router.post("/vehicles/{vehicle_id}/unlock")
 async def direct_unlock(
+    response: Response,
     vehicle_id: str = Path(...),
+    idempotency_key: Optional[str] = IdempotencyKey,
     user_info: dict = Depends(require_supabase_user),
 ):
     """
     Déverrouille un véhicule Tesla.
     Appel direct à l'API Tesla (pas de cache).
     """
-    try:
-        client = await get_tesla_client(user_info)
-        return await client.door_unlock(vehicle_id)
-    except VCPError as e:
-        raise HTTPException(status_code=502, detail=f"Erreur unlock: {e}")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+    return await _vehicle_command(
+        user_info, idempotency_key, response, vehicle_id, "door_unlock",
+        lambda client: client.door_unlock(vehicle_id), "unlock",
+    )
 
 
 @router.post("/vehicles/{vehicle_id}/charge/start")
 async def direct_charge_start(
+    response: Response,
     vehicle_id: str = Path(...),
+    idempotency_key: Optional[str] = IdempotencyKey,
     user_info: dict = Depends(require_supabase_user),
 ):
     """
     Démarre la charge d'un véhicule Tesla.
     Appel direct à l'API Tesla (pas de cache).
     """
-    try:
-        client = await get_tesla_client(user_info)
-        return await client.charge_start(vehicle_id)
-    except VCPError as e:
-        raise HTTPException(status_code=502, detail=f"Erreur charge start: {e}")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+    return await _vehicle_command(
+        user_info, idempotency_key, response, vehicle_id, "charge_start",
+        lambda client: client.charge_start(vehicle_id), "charge start",
+    )
 
 
 @router.post("/vehicles/{vehicle_id}/charge/stop")
 async def direct_charge_stop(
+    response: Response,
     vehicle_id: str = Path(...),
+    idempotency_key: Optional[str] = IdempotencyKey,
     user_info: dict = Depends(require_supabase_user),
 ):
     """
     Arrête la charge d'un véhicule Tesla.
     Appel direct à l'API Tesla (pas de cache).
     """
+    return await _vehicle_command(
+        user_info, idempotency_key, response, vehicle_id, "charge_stop",
+        lambda client: client.charge_stop(vehicle_id), "charge stop",
+    )
+
+
+# ============================================================================
+# COMMANDES GROUPÉES
+# ============================================================================
+
+def _batch_targets(
+    request: BatchCommandRequest,
+    user_id: str,
+) -> Tuple[List[Tuple[str, str]], Dict[str, str]]:
+    """
+    Résout les cibles d'une commande groupée : [(région, tesla_id)] et {tesla_id: vehicle_id interne}.
+    Les vehicle_id internes connus du cache Supabase évitent un GET /vehicles/{id} par véhicule.
+    """
+    default_region = settings.tesla_region_for(None)
+    targets: List[Tuple[str, str]] = []
+    internal_ids: Dict[str, str] = {}
+
+    cache: Optional[VehicleCacheService] = None
+    account_id: Optional[str] = None
     try:
-        client = await get_tesla_client(user_info)
-        return await client.charge_stop(vehicle_id)
-    except VCPError as e:
-        raise HTTPException(status_code=502, detail=f"Erreur charge stop: {e}")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+        cache = VehicleCacheService()
+        account_name = request.filter.account_name if request.filter else None
+        account_id = cache.get_active_tesla_account(user_id, account_name)
+    except Exception as exc:
+        if request.filter is not None:
+            raise HTTPException(status_code=503, detail=f"Cache véhicules indisponible: {exc}")
+        logger.debug("Cache véhicules indisponible pour la commande groupée: %s", exc)
+
+    if request.filter is not None:
+        if not account_id:
+            raise HTTPException(status_code=404, detail="Aucun compte Tesla trouvé. Utilisez /fleet/sync/sync pour synchroniser d'abord.")
+        vehicles = cache.get_cached_vehicles(
+            account_id,
+            max_age_minutes=request.filter.max_age_minutes,
+            state=request.filter.state,
+        ) or []
+        for vehicle in vehicles:
+            tesla_id = str(vehicle.get("id"))
+            targets.append((default_region, tesla_id))
+            if vehicle.get("vehicle_id"):
+                internal_ids[tesla_id] = str(vehicle["vehicle_id"])
+
+    if request.targets:
+        explicit = [(settings.tesla_region_for(t.region), t.vehicle_id) for t in request.targets]
+        targets.extend(explicit)
+        if cache is not None and account_id:
+            try:
+                internal_ids.update(cache.get_internal_vehicle_ids(account_id, [vid for _, vid in explicit]))
+            except Exception as exc:
+                logger.debug("Résolution des vehicle_id depuis le cache impossible: %s", exc)
+
+    # Un véhicule listé deux fois ne reçoit la commande qu'une fois
+    return list(dict.fromkeys(targets)), internal_ids
+
+
+@router.post("/batch/command")
+async def direct_batch_command(
+    request: BatchCommandRequest,
+    format: Optional[StreamFormat] = Query(default=None, description="ndjson (défaut) ou sse"),
+    accept: Optional[str] = Header(default=None),
+    user_info: dict = Depends(require_supabase_user),
+):
+    """
+    Envoie la même commande VCP à plusieurs véhicules (liste explicite ou filtre sur le cache).
+    Les résultats sont streamés au fil de l'eau (NDJSON ou SSE), un par véhicule,
+    suivis d'un résumé. Concurrence bornée par BATCH_COMMAND_CONCURRENCY, avec
+    au plus BATCH_COMMAND_MAX_PER_REGION commandes simultanées par région.
+    """
+    user_id = user_info.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=400, detail="ID utilisateur introuvable")
+    user_token = await ensure_user_access_token(user_id=user_id)
+    if not user_token:
+        raise HTTPException(status_code=401, detail="Token Tesla utilisateur non trouvé.")
+
+    targets, internal_ids = _batch_targets(request, user_id)
+    if not targets:
+        raise HTTPException(status_code=404, detail="Aucun véhicule ciblé")
+    if len(targets) > settings.BATCH_COMMAND_MAX_TARGETS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop de véhicules ciblés ({len(targets)} > {settings.BATCH_COMMAND_MAX_TARGETS})",
+        )
+
+    clients = {
+        region: TeslaClient(base_url=settings.tesla_audience_for(region), access_token=user_token)
+        for region in {region for region, _ in targets}
+    }
+
+    async def execute(region: str, vehicle_id: str) -> dict:
+        if request.command == "wake_up":
+            # Les réveils passent par le WakeCoordinator, pas par VCP
+            return {"vehicle_id": vehicle_id, **await clients[region].wake_up(vehicle_id, wait=True)}
+        status = await clients[region].run_vcp(
+            vehicle_id,
+            request.command,
+            request.command_params,
+            internal_id=internal_ids.get(vehicle_id),
+            timeout=settings.BATCH_COMMAND_TIMEOUT_SECONDS,
+        )
+        return {"vehicle_id": vehicle_id, "success": status.success, "error": status.error, "response": status.raw}
+
+    sse = wants_sse(accept, format)
+
+    async def stream():
+        succeeded = failed = 0
+        async for result in run_batch(
+            targets,
+            execute,
+            concurrency=settings.BATCH_COMMAND_CONCURRENCY,
+            per_region=settings.BATCH_COMMAND_MAX_PER_REGION,
+        ):
+            if result.get("success"):
+                succeeded += 1
+            else:
+                failed += 1
+            yield sse_event(result, event="result") if sse else ndjson_line({"type": "result", **result})
+        summary = {"command": request.command, "total": len(targets), "succeeded": succeeded, "failed": failed}
+        yield sse_event(summary, event="done") if sse else ndjson_line({"type": "summary", **summary})
+
+    return StreamingResponse(
+        stream(),
+        media_type=SSE_MEDIA_TYPE if sse else NDJSON_MEDIA_TYPE,
+        headers=STREAMING_HEADERS,
+    )
 
 
 # ============================================================================
 # PROXY GÉNÉRIQUE
 # ============================================================================
 
+# En-têtes propres à une connexion (RFC 9110 §7.6.1) : jamais relayés tels quels.
+# date/server sont réécrits par notre serveur ; les garder produirait des doublons.
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "proxy-connection", "te", "trailer", "transfer-encoding", "upgrade",
+    "date", "server",
+}
+
+
+def _passthrough_headers(headers: httpx.Headers) -> Dict[str, str]:
+    """En-têtes de la réponse Tesla à relayer au client (hop-by-hop retirés)."""
+    dropped = set(HOP_BY_HOP_HEADERS)
+    # Les en-têtes listés dans Connection sont eux aussi propres au saut
+    for value in headers.get_list("connection"):
+        dropped.update(token.strip().lower() for token in value.split(",") if token.strip())
+    return {k: v for k, v in headers.items() if k.lower() not in dropped}
+
+
 @router.post("/proxy")
 async def direct_proxy(
+    request: Request,
+    response: Response,
     method: str,
     path: str,
     json_body: dict = None,
     params: dict = None,
     region: str = None,
+    stream: bool = Query(default=False, description="Relaie le corps Tesla tel quel, sans enveloppe JSON"),
     user_info: dict = Depends(require_supabase_user),
 ):
     """
     Proxy générique vers l'API Tesla.
     Permet d'appeler n'importe quel endpoint Tesla directement.
     Appel direct (pas de cache).
+
+    Avec stream=true, le statut, les en-têtes (hors hop-by-hop) et les octets de
+    la réponse Tesla sont relayés tels quels au fil de l'eau : pas de parsing JSON,
+    pas de mise en mémoire du corps (adapté aux grosses réponses). Le corps reste
+    dans l'encodage négocié par le client (Accept-Encoding transmis à Tesla).
+
+    Hors flux, les GET couverts par une règle de cache (PROXY_CACHE_RULES) sont
+    servis depuis le cache partagé ; l'en-tête X-Proxy-Cache vaut HIT ou MISS.
     """
-    from app.core.settings import settings
     from app.schemas.fleet_proxy import FleetProxyResponse
     
     user_id = user_info.get("user_id")
@@ -167,6 +351,19 @@ async def direct_proxy(
     
     audience = settings.tesla_audience_for(region)
     client = TeslaClient(base_url=audience, access_token=user_token)
+
+    if stream:
+        return await _stream_proxy(request, client, method, path, json_body, params)
+
+    cache_key = None
+    matched = proxy_cache.rule_for(method, path, params)
+    if matched is not None:
+        rule, vehicle_id = matched
+        cache_key = proxy_cache.key(rule, vehicle_id, user_id=user_id, region=audience, path=path, params=params)
+        cached = proxy_cache.get(cache_key, rule)
+        if cached is not None:
+            response.headers["X-Proxy-Cache"] = "HIT"
+            return FleetProxyResponse(**cached.__dict__)
     
     try:
         resp = await client.request(
@@ -178,11 +375,16 @@ async def direct_proxy(
         )
     except httpx.RequestError as e:
         raise HTTPException(status_code=502, detail=f"Erreur proxy: {e}")
+    proxy_cache.request_sent(method, path)
     
     try:
         body: object = resp.json()
     except ValueError:
         body = resp.text
+
+    if cache_key is not None:
+        proxy_cache.set(cache_key, rule, CachedProxyResponse(resp.status_code, dict(resp.headers), body))
+        response.headers["X-Proxy-Cache"] = "MISS"
     
     return FleetProxyResponse(
         status_code=resp.status_code,
@@ -190,3 +392,41 @@ async def direct_proxy(
         body=body,
     )
 
+
+async def _stream_proxy(
+    request: Request,
+    client: TeslaClient,
+    method: str,
+    path: str,
+    json_body: Optional[dict],
+    params: Optional[dict],
+) -> StreamingResponse:
+    # La réponse amont reste ouverte jusqu'à la fin de l'envoi : fermée par le
+    # générateur, ou par la tâche de fond si le client part avant le premier octet
+    upstream = AsyncExitStack()
+    try:
+        resp = await upstream.enter_async_context(client.stream(
+            method,
+            path,
+            json=json_body,
+            params=params,
+            headers={"Accept-Encoding": request.headers.get("accept-encoding", "identity")},
+        ))
+    except httpx.RequestError as e:
+        await upstream.aclose()
+        raise HTTPException(status_code=502, detail=f"Erreur proxy: {e}")
+    proxy_cache.request_sent(method, path)
+
+    async def body():
+        try:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+        finally:
+            await upstream.aclose()
+
+    return StreamingResponse(
+        body(),
+        status_code=resp.status_code,
+        headers=_passthrough_headers(resp.headers),
+        background=BackgroundTask(upstream.aclose),
+    )
@@ -0,0 +1,100 @@
+"""
+Endpoints EVENTS - Flux SSE des changements véhicule (remplace le polling du frontend).
+Les événements sont publiés à l'écriture du cache Supabase (synchronisations,
+données d'endpoints) ; voir app/services/vehicle_events.py.
+"""
+from __future__ import annotations
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.auth.stream_tickets import VEHICLE_EVENTS, issue_stream_ticket, require_vehicle_events_principal
+from app.auth.supabase_auth import require_supabase_user
+from app.core.settings import settings
+from app.core.streaming import SSE_MEDIA_TYPE, STREAMING_HEADERS, sse_event
+from app.services.vehicle_cache import VehicleCacheService
+from app.services.vehicle_events import vehicle_events
+
+router = APIRouter(
+    prefix="/fleet/events",
+    tags=["fleet-events"],
+)
+
+# Délai de reconnexion conseillé à EventSource (ms)
+RETRY_MS = 3000
+
+
+def get_cache_service() -> VehicleCacheService:
+    """Retourne le service de cache des véhicules."""
+    return VehicleCacheService()
+
+
+@router.post("/ticket")
+async def vehicle_events_ticket(user_info: dict = Depends(require_supabase_user)):
+    """
+    Ticket pour ouvrir le flux depuis EventSource (GET /stream?ticket=...), qui ne peut
+    pas envoyer d'en-tête Authorization. Valable STREAM_TICKET_TTL_SECONDS, pour ce flux seulement.
+    """
+    if not user_info.get("user_id"):
+        raise HTTPException(status_code=400, detail="ID utilisateur introuvable")
+    return {
+        "ticket": issue_stream_ticket(user_info, VEHICLE_EVENTS),
+        "expires_in": settings.STREAM_TICKET_TTL_SECONDS,
+    }
+
+
+@router.get("/stream")
+async def vehicle_events_stream(
+    request: Request,
+    account_name: Optional[str] = Query(default=None, description="Nom du compte Tesla"),
+    vehicle: Optional[List[str]] = Query(default=None, description="Filtrer par véhicule : tesla_id, VIN ou UUID (répétable)"),
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    last_event_id_query: Optional[str] = Query(
+        default=None,
+        alias="last_event_id",
+        description="Comme Last-Event-ID, pour un flux rouvert avec un nouveau ticket",
+    ),
+    user_info: dict = Depends(require_vehicle_events_principal),
+    cache: VehicleCacheService = Depends(get_cache_service),
+):
+    """
+    Flux SSE (messages sans nom d'événement, lisibles par EventSource.onmessage).
+    Chaque message est un JSON {"type": "vehicle" | "endpoint" | "reset", ...}.
+    "reset" : des événements ont été manqués, le client doit recharger l'état complet.
+    Authentification : en-tête Authorization, ou ?ticket= (EventSource, voir POST /ticket).
+    """
+    user_id = user_info.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=400, detail="ID utilisateur introuvable")
+    
+    account_id = cache.get_active_tesla_account(user_id, account_name)
+    if not account_id:
+        raise HTTPException(status_code=404, detail="Aucun compte Tesla trouvé")
+    if vehicle:
+        # Un même filtre pour tous les événements, quel que soit l'identifiant qu'ils portent
+        vehicle = await asyncio.to_thread(cache.expand_vehicle_identifiers, account_id, vehicle)
+    
+    subscription = vehicle_events.subscribe(account_id, vehicles=vehicle, last_event_id=last_event_id or last_event_id_query)
+    
+    async def stream():
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            if subscription.reset:
+                yield sse_event({"type": "reset", "account_id": account_id})
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), timeout=settings.VEHICLE_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                    yield b": heartbeat\n\n"
+                    continue
+                if item is None:
+                    break  # Client trop lent : EventSource se reconnecte avec Last-Event-ID
+                event_id, event = item
+                yield sse_event(event, event_id=vehicle_events.format_id(event_id))
+        finally:
+            vehicle_events.unsubscribe(subscription)
+    
+    return StreamingResponse(stream(), media_type=SSE_MEDIA_TYPE, headers=STREAMING_HEADERS)
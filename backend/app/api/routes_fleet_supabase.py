@@ -3,10 +3,15 @@ Endpoints SUPABASE - Accès direct aux données Supabase sans passer par Tesla.
 Ces endpoints permettent de récupérer les données depuis le cache Supabase uniquement.
 """
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request, Response
+from fastapi.responses import StreamingResponse
 from app.auth.supabase_auth import require_supabase_user
+from app.core.etag import not_modified, set_etag
+from app.core.json_codec import json_response
+from app.core.settings import settings
+from app.core.streaming import NDJSON_MEDIA_TYPE, STREAMING_HEADERS, ndjson_line
 from app.services.vehicle_cache import VehicleCacheService
-from typing import Optional
+from typing import Iterator, List, Optional
 
 router = APIRouter(
     prefix="/fleet/supabase",
@@ -21,6 +26,8 @@ def get_cache_service() -> VehicleCacheService:
 
 @router.get("/vehicles")
 async def supabase_vehicles(
+    request: Request,
+    response: Response,
     account_name: Optional[str] = Query(default=None, description="Nom du compte Tesla"),
     state: Optional[str] = Query(default=None, description="Filtrer par état (online, offline, asleep)"),
     max_age_minutes: int = Query(default=60, ge=1, le=1440, description="Âge maximum accepté du cache en minutes"),
@@ -30,6 +37,7 @@ async def supabase_vehicles(
     """
     Récupère la liste des véhicules depuis Supabase uniquement (pas d'appel à Tesla).
     Retourne les données du cache si disponibles et non expirées.
+    Réponse conditionnelle : ETag + 304 si If-None-Match correspond.
     """
     user_id = user_info.get("user_id")
     if not user_id:
@@ -42,23 +50,29 @@ async def supabase_vehicles(
             detail="Aucun compte Tesla trouvé. Utilisez /fleet/sync/sync pour synchroniser d'abord."
         )
     
-    vehicles = cache.get_cached_vehicles(account_id, max_age_minutes=max_age_minutes, state=state)
+    cached = cache.get_cached_vehicles_with_etag(account_id, max_age_minutes=max_age_minutes, state=state)
     
-    if vehicles is None:
+    if cached is None:
         raise HTTPException(
             status_code=404,
             detail="Aucune donnée en cache. Utilisez /fleet/sync/sync pour synchroniser avec Tesla."
         )
     
-    return {
+    vehicles = cached.data
+    if (unchanged := not_modified(request, cached.etag)) is not None:
+        return unchanged
+    set_etag(response, cached.etag)
+    return json_response({
         "response": vehicles,
         "count": len(vehicles),
         "source": "supabase_cache",
-    }
+    }, headers_from=response)
 
 
 @router.get("/vehicles/{vehicle_id}/data/{endpoint_name}")
 async def supabase_vehicle_endpoint(
+    request: Request,
+    response: Response,
     vehicle_id: str = Path(..., description="ID Tesla du véhicule (tesla_id)"),
     endpoint_name: str = Path(..., description="Nom de l'endpoint (ex: charge_state, vehicle_state)"),
     account_name: Optional[str] = Query(default=None, description="Nom du compte Tesla"),
@@ -68,6 +82,7 @@ async def supabase_vehicle_endpoint(
     """
     Récupère les données d'un endpoint spécifique depuis Supabase uniquement (pas d'appel à Tesla).
     Retourne les données du cache si disponibles et non expirées.
+    Réponse conditionnelle : ETag + 304 si If-None-Match correspond.
     """
     user_id = user_info.get("user_id")
     if not user_id:
@@ -84,19 +99,79 @@ async def supabase_vehicle_endpoint(
             detail=f"Véhicule {vehicle_id} non trouvé. Utilisez /fleet/sync/sync pour synchroniser."
         )
     
-    cached_data = cache.get_cached_endpoint(vehicle_uuid, endpoint_name)
-    if not cached_data:
+    cached = cache.get_cached_endpoint_with_etag(vehicle_uuid, endpoint_name)
+    if not cached or not cached.data:
         raise HTTPException(
             status_code=404,
             detail=f"Données non disponibles en cache. Utilisez /fleet/sync/vehicles/{vehicle_id}/data/{endpoint_name} pour synchroniser."
         )
     
+    if (unchanged := not_modified(request, cached.etag)) is not None:
+        return unchanged
+    set_etag(response, cached.etag)
     return {
-        "response": cached_data,
+        "response": cached.data,
         "source": "supabase_cache",
     }
 
 
+@router.get("/export")
+async def supabase_export(
+    account_name: Optional[str] = Query(default=None, description="Nom du compte Tesla"),
+    state: Optional[str] = Query(default=None, description="Filtrer par état (online, offline, asleep)"),
+    vin: Optional[List[str]] = Query(default=None, description="Filtrer par VIN (répétable)"),
+    max_age_minutes: Optional[int] = Query(default=None, ge=1, description="Uniquement les véhicules synchronisés récemment"),
+    include: Optional[str] = Query(default=None, description="Endpoints en cache à joindre, séparés par des virgules (ex: charge_state,drive_state)"),
+    user_info: dict = Depends(require_supabase_user),
+    cache: VehicleCacheService = Depends(get_cache_service),
+):
+    """
+    Exporte toute la flotte depuis le cache Supabase en NDJSON (une ligne par véhicule,
+    puis une ligne de résumé). Le cache est lu par blocs de EXPORT_CHUNK_SIZE véhicules :
+    la mémoire reste constante quelle que soit la taille de la flotte.
+    """
+    user_id = user_info.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=400, detail="ID utilisateur introuvable")
+    
+    account_id = cache.get_active_tesla_account(user_id, account_name)
+    if not account_id:
+        raise HTTPException(status_code=404, detail="Aucun compte Tesla trouvé")
+    
+    endpoint_names = [name.strip() for name in (include or "").split(",") if name.strip()]
+    
+    def stream() -> Iterator[bytes]:
+        # Générateur synchrone : Starlette l'itère dans le threadpool (client Supabase bloquant)
+        count = 0
+        for rows in cache.iter_cached_vehicles(
+            account_id,
+            chunk_size=settings.EXPORT_CHUNK_SIZE,
+            state=state,
+            vins=vin,
+            max_age_minutes=max_age_minutes,
+        ):
+            endpoints = cache.get_endpoints_for_vehicles([row['id'] for row in rows], endpoint_names)
+            lines = []
+            for row in rows:
+                line = {
+                    "type": "vehicle",
+                    "vehicle": row['vehicle_data'],
+                    "last_synced_at": row.get('last_synced_at'),
+                }
+                if endpoint_names:
+                    line["data"] = endpoints.get(row['id'], {})
+                lines.append(ndjson_line(line))
+            count += len(rows)
+            yield b"".join(lines)
+        yield ndjson_line({"type": "summary", "count": count, "account_id": account_id})
+    
+    return StreamingResponse(
+        stream(),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={**STREAMING_HEADERS, "Content-Disposition": 'attachment; filename="fleet-export.ndjson"'},
+    )
+
+
 @router.get("/accounts")
 async def supabase_accounts(
     user_info: dict = Depends(require_supabase_user),
@@ -3,12 +3,18 @@ Endpoints SYNC - Utilisent le cache Supabase pour récupérer les données.
 Ces endpoints vérifient d'abord le cache, puis synchronisent avec Tesla si nécessaire.
 """
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request, Response
 from app.auth.supabase_auth import require_supabase_user
+from app.core.etag import not_modified, set_etag
+from app.core.json_codec import json_response
 from app.auth.oauth_third_party import ensure_user_access_token
 from app.tesla.client import TeslaClient
 from app.services.vehicle_cache import VehicleCacheService
-from typing import Optional
+from app.tesla.vehicles import fetch_all_vehicles, sync_account_vehicles
+from app.core.settings import settings
+from app.schemas.fleet_batch import BatchReadRequest
+from typing import Any, Dict, Optional
+import asyncio
 import httpx
 
 router = APIRouter(
@@ -53,7 +59,7 @@ async def sync_vehicles(
             end = start + page_size
             paginated = cached_vehicles[start:end]
             
-            return {
+            return json_response({
                 "response": paginated,
                 "pagination": {
                     "previous": page - 1 if page > 1 else None,
@@ -65,7 +71,7 @@ async def sync_vehicles(
                 },
                 "count": len(paginated),
                 "cached": True,
-            }
+            })
     
     # Synchroniser avec Tesla
     user_token = await ensure_user_access_token(user_id=user_id)
@@ -77,27 +83,10 @@ async def sync_vehicles(
     
     try:
         client = TeslaClient(access_token=user_token)
-        result = await client.vehicles_list(page=page, page_size=page_size)
         
         # Mettre en cache tous les véhicules (pas seulement la page actuelle)
         # Pour cela, on récupère toutes les pages
-        all_vehicles = []
-        current_page = 1
-        
-        while True:
-            page_result = await client.vehicles_list(page=current_page, page_size=page_size)
-            vehicles = page_result.get("response", [])
-            if not vehicles:
-                break
-            
-            all_vehicles.extend(vehicles)
-            
-            # Vérifier s'il y a une page suivante
-            pagination = page_result.get("pagination", {})
-            if not pagination.get("next"):
-                break
-            
-            current_page += 1
+        all_vehicles = await fetch_all_vehicles(client, page_size=page_size)
         
         # Mettre en cache tous les véhicules
         if all_vehicles:
@@ -108,7 +97,7 @@ async def sync_vehicles(
         end = start + page_size
         paginated = all_vehicles[start:end] if start < len(all_vehicles) else []
         
-        return {
+        return json_response({
             "response": paginated,
             "pagination": {
                 "previous": page - 1 if page > 1 else None,
@@ -120,7 +109,7 @@ async def sync_vehicles(
             },
             "count": len(paginated),
             "cached": False,
-        }
+        })
         
     except httpx.HTTPStatusError as e:
         error_detail = f"Erreur lors de la synchronisation avec Tesla: {e}"
@@ -133,6 +122,8 @@ async def sync_vehicles(
 
 @router.get("/vehicles/{vehicle_id}/data/{endpoint_name}")
 async def sync_vehicle_endpoint(
+    request: Request,
+    response: Response,
     vehicle_id: str = Path(..., description="ID Tesla du véhicule (tesla_id)"),
     endpoint_name: str = Path(..., description="Nom de l'endpoint (ex: charge_state, vehicle_state)"),
     force_refresh: bool = Query(default=False, description="Forcer la synchronisation avec Tesla"),
@@ -142,6 +133,7 @@ async def sync_vehicle_endpoint(
     """
     Récupère les données d'un endpoint spécifique depuis le cache Supabase.
     Synchronise automatiquement avec Tesla si le cache est expiré ou si force_refresh=True.
+    Les réponses servies depuis le cache portent un ETag (304 si If-None-Match correspond).
     """
     user_id = user_info.get("user_id")
     if not user_id:
@@ -158,10 +150,13 @@ async def sync_vehicle_endpoint(
     
     # Vérifier le cache si pas de force refresh
     if not force_refresh:
-        cached_data = cache.get_cached_endpoint(vehicle_uuid, endpoint_name)
-        if cached_data:
+        cached = cache.get_cached_endpoint_with_etag(vehicle_uuid, endpoint_name)
+        if cached and cached.data:
+            if (unchanged := not_modified(request, cached.etag)) is not None:
+                return unchanged
+            set_etag(response, cached.etag)
             return {
-                "response": cached_data,
+                "response": cached.data,
                 "cached": True,
             }
     
@@ -182,7 +177,7 @@ async def sync_vehicle_endpoint(
         data = resp.json()
         
         # Mettre en cache la réponse
-        cache.cache_endpoint_response(account_id, vehicle_uuid, endpoint_name, data, ttl_minutes=5)
+        cache.cache_endpoint_response(account_id, vehicle_uuid, endpoint_name, data, ttl_minutes=5, tesla_id=vehicle_id)
         
         return {
             "response": data,
@@ -195,6 +190,93 @@ async def sync_vehicle_endpoint(
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 
+@router.post("/batch/read")
+async def sync_batch_read(
+    request: BatchReadRequest,
+    user_info: dict = Depends(require_supabase_user),
+    cache: VehicleCacheService = Depends(get_cache_service),
+):
+    """
+    Lit plusieurs couples (véhicule, endpoint) en une requête.
+    Compte et véhicules sont résolus une fois, le cache est lu en une seule requête,
+    et seuls les manques sont relus depuis Tesla (en parallèle, BATCH_READ_CONCURRENCY).
+    Chaque résultat indique s'il vient du cache ("cached": true) ou de Tesla.
+    """
+    user_id = user_info.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=400, detail="ID utilisateur introuvable")
+    
+    items = list(dict.fromkeys((item.vehicle_id, item.endpoint) for item in request.items))
+    if len(items) > settings.BATCH_READ_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop d'éléments demandés ({len(items)} > {settings.BATCH_READ_MAX_ITEMS})",
+        )
+    
+    account_id = cache.get_active_tesla_account(user_id)
+    if not account_id:
+        raise HTTPException(status_code=404, detail="Aucun compte Tesla trouvé")
+    
+    vehicle_uuids = cache.get_vehicle_uuids(account_id, list({vehicle_id for vehicle_id, _ in items}))
+    cached = {}
+    if not request.force_refresh:
+        cached = cache.get_cached_endpoints_bulk(
+            list(set(vehicle_uuids.values())),
+            list({endpoint for _, endpoint in items}),
+        )
+    
+    results: Dict[tuple, Dict[str, Any]] = {}
+    misses = []
+    for vehicle_id, endpoint in items:
+        vehicle_uuid = vehicle_uuids.get(vehicle_id)
+        if vehicle_uuid is None:
+            results[(vehicle_id, endpoint)] = {"error": f"Véhicule {vehicle_id} non trouvé dans le cache", "status_code": 404}
+        elif (vehicle_uuid, endpoint) in cached:
+            results[(vehicle_id, endpoint)] = {"cached": True, "response": cached[(vehicle_uuid, endpoint)].data}
+        else:
+            misses.append((vehicle_id, endpoint))
+    
+    if misses:
+        user_token = await ensure_user_access_token(user_id=user_id)
+        if not user_token:
+            raise HTTPException(status_code=401, detail="Token Tesla utilisateur non trouvé.")
+        client = TeslaClient(access_token=user_token)
+        semaphore = asyncio.Semaphore(settings.BATCH_READ_CONCURRENCY)
+        
+        async def fetch(vehicle_id: str, endpoint: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    resp = await client.request("GET", f"/api/1/vehicles/{vehicle_id}/{endpoint}")
+                    return {"cached": False, "response": resp.json()}
+                except httpx.HTTPStatusError as e:
+                    status_code = e.response.status_code if e.response is not None else 502
+                    return {"error": str(e), "status_code": status_code}
+                except Exception as e:
+                    return {"error": str(e) or e.__class__.__name__, "status_code": 502}
+        
+        fetched = await asyncio.gather(*(fetch(vehicle_id, endpoint) for vehicle_id, endpoint in misses))
+        to_cache = []
+        for (vehicle_id, endpoint), result in zip(misses, fetched):
+            results[(vehicle_id, endpoint)] = result
+            if "error" not in result:
+                to_cache.append({
+                    "vehicle_id": vehicle_uuids[vehicle_id],
+                    "tesla_id": vehicle_id,
+                    "endpoint_name": endpoint,
+                    "response_data": result["response"],
+                })
+        cache.cache_endpoint_responses(account_id, to_cache, ttl_minutes=request.ttl_minutes)
+    
+    ordered = [{"vehicle_id": vehicle_id, "endpoint": endpoint, **results[(vehicle_id, endpoint)]} for vehicle_id, endpoint in items]
+    return json_response({
+        "results": ordered,
+        "count": len(ordered),
+        "cached": sum(1 for r in ordered if r.get("cached") is True),
+        "fetched": sum(1 for r in ordered if r.get("cached") is False),
+        "failed": sum(1 for r in ordered if "error" in r),
+    })
+
+
 @router.post("/sync")
 async def sync_all(
     account_name: Optional[str] = Query(default=None, description="Nom du compte Tesla à synchroniser"),
@@ -209,10 +291,6 @@ async def sync_all(
     if not user_id:
         raise HTTPException(status_code=400, detail="ID utilisateur introuvable")
     
-    account_id = cache.get_active_tesla_account(user_id, account_name)
-    if not account_id:
-        account_id = cache.create_or_get_tesla_account(user_id, account_name or "Compte principal")
-    
     user_token = await ensure_user_access_token(user_id=user_id)
     if not user_token:
         raise HTTPException(
@@ -221,37 +299,7 @@ async def sync_all(
         )
     
     try:
-        client = TeslaClient(access_token=user_token)
-        
-        # Récupérer tous les véhicules
-        all_vehicles = []
-        page = 1
-        page_size = 50
-        
-        while True:
-            result = await client.vehicles_list(page=page, page_size=page_size)
-            vehicles = result.get("response", [])
-            if not vehicles:
-                break
-            
-            all_vehicles.extend(vehicles)
-            
-            pagination = result.get("pagination", {})
-            if not pagination.get("next"):
-                break
-            
-            page += 1
-        
-        # Mettre en cache tous les véhicules
-        if all_vehicles:
-            cache.cache_vehicles(account_id, all_vehicles)
-        
-        return {
-            "success": True,
-            "vehicles_synced": len(all_vehicles),
-            "account_id": account_id,
-        }
-        
+        return await sync_account_vehicles(user_id, user_token, account_name, cache=cache)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la synchronisation: {str(e)}")
 
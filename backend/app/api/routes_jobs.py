@@ -0,0 +1,122 @@
+"""
+Endpoints JOBS - Commandes véhicule et synchronisations exécutées en arrière-plan.
+Le POST rend immédiatement un job_id ; le résultat se récupère par polling
+(GET /fleet/jobs/{job_id}) ou en flux SSE (GET /fleet/jobs/{job_id}/stream).
+"""
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from app.auth.supabase_auth import require_supabase_user
+from app.core.settings import settings
+from app.core.streaming import SSE_MEDIA_TYPE, STREAMING_HEADERS, sse_event
+from app.schemas.fleet_batch import VehicleCommand
+from app.services.idempotency import HEADER as IDEMPOTENCY_HEADER, run_idempotent
+from app.services.jobs import JobNotFound, TERMINAL_STATUSES, enqueue_command, enqueue_sync, get_job
+
+router = APIRouter(
+    prefix="/fleet/jobs",
+    tags=["fleet-jobs"],
+    dependencies=[Depends(require_supabase_user)],
+)
+
+
+class CommandJobRequest(BaseModel):
+    vehicle_id: str = Field(description="ID Tesla du véhicule (id Fleet API).")
+    command: VehicleCommand = Field(description="Commande véhicule (wake_up, door_lock, door_unlock, charge_start, charge_stop).")
+    command_params: Dict[str, Any] = Field(default_factory=dict)
+    region: Optional[str] = Field(default=None, description="Région Fleet (eu/na, défaut: TESLA_REGION).")
+
+
+class SyncJobRequest(BaseModel):
+    account_name: Optional[str] = Field(default=None, description="Nom du compte Tesla à synchroniser.")
+
+
+def _user_id(user_info: dict) -> str:
+    user_id = user_info.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=400, detail="ID utilisateur introuvable")
+    return user_id
+
+
+@router.post("/commands", status_code=202)
+async def create_command_job(
+    request: CommandJobRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(default=None, alias=IDEMPOTENCY_HEADER),
+    user_info: dict = Depends(require_supabase_user),
+):
+    """
+    Planifie une commande véhicule ; le véhicule est réveillé si nécessaire par le worker.
+    Avec Idempotency-Key, une relance rend le même job au lieu d'en planifier un second.
+    """
+    user_id = _user_id(user_info)
+
+    async def run():
+        return await enqueue_command(user_id, request.vehicle_id, request.command, request.command_params, request.region)
+
+    return await run_idempotent(user_id, idempotency_key, {"job": "command", **request.model_dump()}, response, run)
+
+
+@router.post("/sync", status_code=202)
+async def create_sync_job(
+    request: SyncJobRequest | None = None,
+    user_info: dict = Depends(require_supabase_user),
+):
+    """Planifie une synchronisation complète des véhicules avec Tesla."""
+    return await enqueue_sync(_user_id(user_info), request.account_name if request else None)
+
+
+@router.get("/{job_id}")
+async def job_status(
+    job_id: str = Path(...),
+    user_info: dict = Depends(require_supabase_user),
+):
+    """État du job : queued, started, finished (avec result) ou failed (avec error)."""
+    try:
+        # rq lit l'état dans Redis (client synchrone) : hors de la boucle
+        return await asyncio.to_thread(get_job, job_id, _user_id(user_info))
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} introuvable ou expiré")
+
+
+@router.get("/{job_id}/stream")
+async def job_stream(
+    job_id: str = Path(...),
+    user_info: dict = Depends(require_supabase_user),
+):
+    """
+    Flux SSE : un événement "status" à chaque changement d'état, puis "done" avec le
+    résultat final. Le flux se ferme après JOBS_TIMEOUT_SECONDS au plus.
+    """
+    user_id = _user_id(user_info)
+    try:
+        state = await asyncio.to_thread(get_job, job_id, user_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} introuvable ou expiré")
+
+    async def stream():
+        current = state
+        last_status = None
+        deadline = time.monotonic() + settings.JOBS_TIMEOUT_SECONDS
+        while True:
+            if current["status"] in TERMINAL_STATUSES:
+                yield sse_event(current, event="done")
+                return
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield sse_event(current, event="status")
+            if time.monotonic() > deadline:
+                yield sse_event({"job_id": job_id, "error": "stream timeout"}, event="timeout")
+                return
+            await asyncio.sleep(settings.JOBS_STREAM_POLL_SECONDS)
+            try:
+                current = await asyncio.to_thread(get_job, job_id, user_id)
+            except JobNotFound:
+                yield sse_event({"job_id": job_id, "error": "job expiré"}, event="done")
+                return
+
+    return StreamingResponse(stream(), media_type=SSE_MEDIA_TYPE, headers=STREAMING_HEADERS)
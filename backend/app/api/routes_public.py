@@ -1,8 +1,17 @@
-from fastapi import APIRouter, HTTPException, Response
-from fastapi.responses import FileResponse
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Request, Response
+from app.core.etag import etag_matches
 from app.core.settings import settings
-import os
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -10,55 +19,37 @@ router = APIRouter()
 def health():
     return {"status": "ok"}
 
-@router.get("/.well-known/appspecific/com.tesla.3p.public-key.pem")
-async def get_public_key():
-    """
-    Endpoint pour servir la clé publique Tesla.
-    Cet endpoint est requis par Tesla pour l'enregistrement partenaire.
-    La clé publique est générée automatiquement depuis la clé privée si nécessaire.
-    """
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    # Chercher la clé publique dans différents emplacements possibles
-    possible_paths = [
+
+PEM_MEDIA_TYPE = "application/x-pem-file"
+
+
+@dataclass
+class _ResolvedKey:
+    pem: bytes
+    etag: str
+    source: Path
+    mtime: float
+
+
+def _key_candidates() -> Tuple[List[Path], List[Path]]:
+    """Chemins possibles (clé publique, puis clé privée dont on dérive la clé publique)."""
+    public_paths = [
         Path("/app/app/keys/public/public_key.pem"),  # Docker volume
         Path("./app/keys/public/public_key.pem"),      # Dev local
         Path("app/keys/public/public_key.pem"),        # Alternative
         Path("/app/keys/public/public_key.pem"),       # Alternative Docker
     ]
+    private_paths: List[Path] = []
     
     # Si PRIVATE_KEY_PATH est défini, essayer de déduire le chemin de la clé publique
-    private_key_path = None
-    if hasattr(settings, "PRIVATE_KEY_PATH") and settings.PRIVATE_KEY_PATH:
+    if getattr(settings, "PRIVATE_KEY_PATH", None):
         private_key_path = Path(settings.PRIVATE_KEY_PATH)
-        logger.info(f"PRIVATE_KEY_PATH configuré: {private_key_path}")
-        
         # Si c'est une clé privée, chercher la clé publique dans le même répertoire ou dans public/
         if "private" in str(private_key_path):
-            public_key_path = private_key_path.parent.parent / "public" / "public_key.pem"
-            possible_paths.insert(0, public_key_path)
-            logger.info(f"Chemin déduit pour clé publique: {public_key_path}")
+            public_paths.insert(0, private_key_path.parent.parent / "public" / "public_key.pem")
         else:
-            # Si le chemin contient déjà le nom du fichier, essayer de le remplacer
-            public_key_path = private_key_path.parent / "public_key.pem"
-            possible_paths.insert(0, public_key_path)
-            logger.info(f"Chemin alternatif pour clé publique: {public_key_path}")
-    
-    # Chercher le fichier de clé publique existant
-    for key_path in possible_paths:
-        if key_path.exists() and key_path.is_file():
-            logger.info(f"Clé publique trouvée à: {key_path}")
-            return FileResponse(
-                path=str(key_path),
-                media_type="application/x-pem-file",
-                filename="public_key.pem"
-            )
-    
-    # Si aucune clé publique n'est trouvée, essayer de la générer depuis la clé privée
-    if private_key_path:
-        # Essayer plusieurs chemins possibles pour la clé privée
-        private_key_paths_to_try = [
+            public_paths.insert(0, private_key_path.parent / "public_key.pem")
+        private_paths = [
             private_key_path,
             Path("/app/app/keys/private/private_key.pem"),
             Path("./app/keys/private/private_key.pem"),
@@ -66,57 +57,124 @@ async def get_public_key():
             Path("/app/keys/private/private_key.pem"),
             Path("/run/secrets/tesla_private_key.pem"),  # Docker secrets
         ]
+    return public_paths, private_paths
+
+
+def _public_pem_from_private(priv_path: Path) -> bytes:
+    from cryptography.hazmat.primitives import serialization
+    
+    private_key = serialization.load_pem_private_key(priv_path.read_bytes(), password=None)
+    return private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+
+
+class PublicKeyCache:
+    """
+    Clé publique résolue et sérialisée une seule fois (au démarrage), puis servie depuis la mémoire.
+    Le fichier source est re-vérifié (mtime) au plus toutes les PUBLIC_KEY_RECHECK_SECONDS.
+    """
+
+    def __init__(self):
+        self._key: Optional[_ResolvedKey] = None
+        self._error: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> _ResolvedKey:
+        now = time.monotonic()
+        if now - self._checked_at >= settings.PUBLIC_KEY_RECHECK_SECONDS:
+            with self._lock:
+                if now - self._checked_at >= settings.PUBLIC_KEY_RECHECK_SECONDS:
+                    if self._key is None or self._source_changed(self._key):
+                        self.load()
+                    self._checked_at = time.monotonic()
+        if self._key is None:
+            raise HTTPException(status_code=404, detail=self._error or "Clé publique non trouvée")
+        return self._key
+
+    def load(self) -> Optional[_ResolvedKey]:
+        """(Re)charge la clé ; garde l'ancienne version si la nouvelle résolution échoue."""
+        try:
+            resolved = self._resolve()
+        except LookupError as exc:
+            self._error = str(exc)
+            if self._key is None:
+                logger.error("Clé publique Tesla introuvable:\n%s", exc)
+            return self._key
+        if self._key is None or resolved.etag != self._key.etag:
+            logger.info("Clé publique chargée depuis %s", resolved.source)
+        self._key, self._error = resolved, None
+        self._checked_at = time.monotonic()
+        return resolved
+
+    @staticmethod
+    def _source_changed(key: _ResolvedKey) -> bool:
+        try:
+            return os.stat(key.source).st_mtime != key.mtime
+        except OSError:
+            return True
+
+    def _resolve(self) -> _ResolvedKey:
+        public_paths, private_paths = _key_candidates()
         
-        for priv_path in private_key_paths_to_try:
-            if priv_path.exists() and priv_path.is_file():
-                logger.info(f"Clé privée trouvée à: {priv_path}, génération de la clé publique...")
+        # Chercher le fichier de clé publique existant
+        for key_path in public_paths:
+            if key_path.is_file():
+                return self._resolved(key_path.read_bytes(), key_path)
+        
+        # Si aucune clé publique n'est trouvée, essayer de la générer depuis la clé privée
+        for priv_path in private_paths:
+            if priv_path.is_file():
                 try:
-                    # Extraire la clé publique depuis la clé privée
-                    from cryptography.hazmat.primitives import serialization
-                    from cryptography.hazmat.backends import default_backend
-                    
-                    with open(priv_path, "rb") as f:
-                        private_key = serialization.load_pem_private_key(
-                            f.read(),
-                            password=None,
-                            backend=default_backend()
-                        )
-                    
-                    public_key = private_key.public_key()
-                    public_key_pem = public_key.public_bytes(
-                        encoding=serialization.Encoding.PEM,
-                        format=serialization.PublicFormat.SubjectPublicKeyInfo
-                    )
-                    
-                    logger.info("Clé publique générée avec succès depuis la clé privée")
-                    return Response(
-                        content=public_key_pem,
-                        media_type="application/x-pem-file",
-                        headers={"Content-Disposition": 'attachment; filename="public_key.pem"'}
-                    )
+                    return self._resolved(_public_pem_from_private(priv_path), priv_path)
                 except Exception as e:
                     logger.error(f"Erreur lors de la génération de la clé publique depuis {priv_path}: {str(e)}")
                     # Continuer à essayer les autres chemins
                     continue
-    
-    # Si on arrive ici, aucune clé n'a été trouvée
-    error_detail = (
-        "Clé publique non trouvée et impossible de la générer depuis la clé privée.\n\n"
-        f"PRIVATE_KEY_PATH configuré: {settings.PRIVATE_KEY_PATH if hasattr(settings, 'PRIVATE_KEY_PATH') else 'Non configuré'}\n\n"
-        "Chemins vérifiés pour la clé privée:\n"
-    )
-    for priv_path in private_key_paths_to_try if private_key_path else []:
-        exists = "✓" if priv_path.exists() else "✗"
-        error_detail += f"  {exists} {priv_path}\n"
-    
-    error_detail += (
-        "\nPour résoudre ce problème:\n"
-        "1. Configurez PRIVATE_KEY_PATH dans vos variables d'environnement\n"
-        "2. Assurez-vous que la clé privée existe à l'emplacement configuré\n"
-        "3. Ou placez la clé publique dans /app/app/keys/public/public_key.pem"
-    )
-    
-    raise HTTPException(
-        status_code=404,
-        detail=error_detail
-    )
\ No newline at end of file
+        
+        # Si on arrive ici, aucune clé n'a été trouvée
+        error_detail = (
+            "Clé publique non trouvée et impossible de la générer depuis la clé privée.\n\n"
+            f"PRIVATE_KEY_PATH configuré: {getattr(settings, 'PRIVATE_KEY_PATH', None) or 'Non configuré'}\n\n"
+            "Chemins vérifiés pour la clé privée:\n"
+        )
+        for priv_path in private_paths:
+            exists = "✓" if priv_path.exists() else "✗"
+            error_detail += f"  {exists} {priv_path}\n"
+        
+        error_detail += (
+            "\nPour résoudre ce problème:\n"
+            "1. Configurez PRIVATE_KEY_PATH dans vos variables d'environnement\n"
+            "2. Assurez-vous que la clé privée existe à l'emplacement configuré\n"
+            "3. Ou placez la clé publique dans /app/app/keys/public/public_key.pem"
+        )
+        raise LookupError(error_detail)
+
+    @staticmethod
+    def _resolved(pem: bytes, source: Path) -> _ResolvedKey:
+        etag = '"' + hashlib.sha256(pem).hexdigest()[:32] + '"'
+        return _ResolvedKey(pem=pem, etag=etag, source=source, mtime=os.stat(source).st_mtime)
+
+
+public_key_cache = PublicKeyCache()
+
+
+@router.get("/.well-known/appspecific/com.tesla.3p.public-key.pem")
+async def get_public_key(request: Request):
+    """
+    Endpoint pour servir la clé publique Tesla.
+    Cet endpoint est requis par Tesla pour l'enregistrement partenaire.
+    La clé publique est générée automatiquement depuis la clé privée si nécessaire,
+    une seule fois, puis servie depuis la mémoire (ETag + 304).
+    """
+    key = public_key_cache.get()
+    headers = {
+        "ETag": key.etag,
+        "Cache-Control": f"public, max-age={settings.PUBLIC_KEY_CACHE_MAX_AGE_SECONDS}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), key.etag):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = 'attachment; filename="public_key.pem"'
+    return Response(content=key.pem, media_type=PEM_MEDIA_TYPE, headers=headers)
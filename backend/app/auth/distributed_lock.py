@@ -0,0 +1,134 @@
+"""
+Verrous inter-processus (workers uvicorn / replicas) pour le single-flight.
+
+- Redis : SET NX PX + libération atomique (script Lua compare-and-delete)
+- Supabase : bail (lease) sous forme de ligne dans la table tokens ; la contrainte
+  UNIQUE sur `key` garantit qu'un seul processus détient le verrou. PostgREST ne
+  conserve pas de session entre deux appels, donc pg_advisory_lock n'est pas utilisable.
+- Mémoire : verrou local au processus (dev, un seul worker)
+"""
+from __future__ import annotations
+import secrets
+import threading
+from abc import ABC, abstractmethod
+import time
+from typing import Dict, Optional
+
+from app.core.settings import settings
+from app.core.redis_client import get_redis
+
+LOCK_KEY_PREFIX = "lock:"
+
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class DistributedLock(ABC):
+    """
+    Interface commune : `acquire` retourne un jeton de propriété, ou None si déjà pris.
+    Les implémentations sont synchrones (réseau) : depuis du code async, les appeler
+    via asyncio.to_thread.
+    """
+
+    @abstractmethod
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def release(self, name: str, owner: str) -> None:
+        ...
+
+
+class RedisLock(DistributedLock):
+    def __init__(self, client):
+        self.r = client
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        owner = secrets.token_hex(16)
+        ok = self.r.set(LOCK_KEY_PREFIX + name, owner, nx=True, px=int(ttl * 1000))
+        return owner if ok else None
+
+    def release(self, name: str, owner: str) -> None:
+        try:
+            self.r.eval(_RELEASE_SCRIPT, 1, LOCK_KEY_PREFIX + name, owner)
+        except Exception:
+            # Le verrou expirera de lui-même (TTL)
+            pass
+
+
+class SupabaseLeaseLock(DistributedLock):
+    def __init__(self, supabase_client, table_name: str):
+        self.supabase = supabase_client
+        self.table_name = table_name
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        key = LOCK_KEY_PREFIX + name
+        owner = secrets.token_hex(16)
+        now_iso = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        expires_iso = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() + ttl))
+        try:
+            # Purger un bail expiré (détenteur mort) avant de tenter l'insertion
+            self.supabase.table(self.table_name).delete().eq("key", key).lt("expires_at", now_iso).execute()
+            self.supabase.table(self.table_name).insert({
+                "key": key,
+                "token_data": {"owner": owner},
+                "expires_at": expires_iso,
+            }).execute()
+            return owner
+        except Exception:
+            # Violation de la contrainte UNIQUE : un autre processus détient le verrou
+            return None
+
+    def release(self, name: str, owner: str) -> None:
+        try:
+            self.supabase.table(self.table_name)\
+                .delete()\
+                .eq("key", LOCK_KEY_PREFIX + name)\
+                .eq("token_data->>owner", owner)\
+                .execute()
+        except Exception:
+            pass
+
+
+class LocalLock(DistributedLock):
+    _held: Dict[str, tuple[str, float]] = {}
+    # Appelé via asyncio.to_thread : lecture et écriture sous le même verrou
+    _guard = threading.Lock()
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        with self._guard:
+            now = time.monotonic()
+            held = self._held.get(name)
+            if held and held[1] > now:
+                return None
+            owner = secrets.token_hex(16)
+            self._held[name] = (owner, now + ttl)
+            return owner
+
+    def release(self, name: str, owner: str) -> None:
+        with self._guard:
+            held = self._held.get(name)
+            if held and held[0] == owner:
+                self._held.pop(name, None)
+
+
+def get_distributed_lock() -> DistributedLock:
+    """
+    Choisit le verrou selon l'infrastructure disponible.
+    Priorité: Redis (si REDIS_URL répond) → Supabase (TOKEN_STORE_TYPE="supabase") → local.
+    """
+    client = get_redis()
+    if client is not None:
+        return RedisLock(client)
+    if settings.TOKEN_STORE_TYPE == "supabase":
+        try:
+            from app.auth.supabase_store import get_supabase_store
+            store = get_supabase_store()
+            return SupabaseLeaseLock(store.supabase, store.table_name)
+        except Exception:
+            pass
+    return LocalLock()
@@ -0,0 +1,167 @@
+"""
+Vérification locale des JWT Supabase (signature + expiration + audience).
+
+- Clés asymétriques (ES256/RS256) : JWKS publié par Supabase
+  ({SUPABASE_URL}/auth/v1/.well-known/jwks.json), mis en cache et rafraîchi
+  périodiquement en arrière-plan ; un `kid` inconnu déclenche un rafraîchissement
+  (limité par SUPABASE_JWKS_MIN_REFRESH_SECONDS).
+- Secret partagé (HS256, projets Supabase "legacy") : SUPABASE_JWT_SECRET.
+
+Note : un token révoqué (logout) reste accepté jusqu'à son `exp`, comme pour
+tout JWT vérifié localement. Les tokens Supabase expirent après ~1h.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+import jwt
+
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = {"ES256", "RS256", "EdDSA"}
+
+
+class LocalVerificationUnavailable(Exception):
+    """Le token ne peut pas être vérifié localement (pas de secret, JWKS indisponible, kid inconnu)."""
+
+
+class SupabaseJWTVerifier:
+    def __init__(self):
+        self._keys: Dict[str, Any] = {}
+        # -inf : time.monotonic() peut être proche de 0 juste après le démarrage de la machine
+        self._fetched_at: float = float("-inf")
+        self._last_attempt: float = float("-inf")
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def jwks_url(self) -> Optional[str]:
+        if not settings.SUPABASE_URL:
+            return None
+        return settings.SUPABASE_URL.rstrip("/") + "/auth/v1/.well-known/jwks.json"
+
+    def expected_issuer(self) -> Optional[str]:
+        if settings.SUPABASE_JWT_ISSUER:
+            return settings.SUPABASE_JWT_ISSUER
+        if settings.SUPABASE_URL:
+            return settings.SUPABASE_URL.rstrip("/") + "/auth/v1"
+        return None
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Vérifie le token et retourne ses claims.
+        Lève jwt.InvalidTokenError (signature, exp, aud, iss...) ou LocalVerificationUnavailable.
+        """
+        header = jwt.get_unverified_header(token)
+        alg = header.get("alg")
+        key = await self._key_for(alg, header.get("kid"))
+
+        issuer = self.expected_issuer()
+        return jwt.decode(
+            token,
+            key=key,
+            algorithms=[alg],
+            audience=settings.SUPABASE_JWT_AUDIENCE or None,
+            issuer=issuer if settings.SUPABASE_JWT_VERIFY_ISSUER else None,
+            leeway=settings.SUPABASE_JWT_LEEWAY_SECONDS,
+            options={
+                "require": ["exp", "sub"],
+                "verify_aud": bool(settings.SUPABASE_JWT_AUDIENCE),
+                "verify_iss": bool(settings.SUPABASE_JWT_VERIFY_ISSUER and issuer),
+            },
+        )
+
+    async def _key_for(self, alg: Optional[str], kid: Optional[str]):
+        if alg == "HS256":
+            if not settings.SUPABASE_JWT_SECRET:
+                raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET non configuré")
+            return settings.SUPABASE_JWT_SECRET
+        if alg not in ASYMMETRIC_ALGORITHMS:
+            raise jwt.InvalidAlgorithmError(f"Algorithme non supporté: {alg}")
+
+        # Après un téléchargement raté, pas de nouvel essai avant SUPABASE_JWKS_MIN_REFRESH_SECONDS :
+        # les requêtes passent directement au fallback au lieu d'attendre le timeout du JWKS
+        if time.monotonic() - self._fetched_at > settings.SUPABASE_JWKS_CACHE_SECONDS and self._may_retry():
+            await self.refresh()
+        key = self._lookup(kid)
+        if key is None and self._may_retry():
+            # Rotation de clés : le kid peut être plus récent que notre cache
+            await self.refresh(force=True)
+            key = self._lookup(kid)
+        if key is None:
+            raise LocalVerificationUnavailable(f"Clé JWKS introuvable (kid={kid})")
+        return key
+
+    def _may_retry(self) -> bool:
+        return time.monotonic() - self._last_attempt > settings.SUPABASE_JWKS_MIN_REFRESH_SECONDS
+
+    def _lookup(self, kid: Optional[str]):
+        if kid:
+            return self._keys.get(kid)
+        # Sans kid : n'accepter que s'il n'y a qu'une seule clé
+        if len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        return None
+
+    async def refresh(self, force: bool = False) -> None:
+        """Recharge le JWKS (un seul téléchargement à la fois)."""
+        url = self.jwks_url()
+        if not url:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._lock:
+            # Un autre appelant vient peut-être de rafraîchir pendant qu'on attendait le verrou
+            if self._last_attempt >= started or (not force and time.monotonic() - self._fetched_at <= settings.SUPABASE_JWKS_CACHE_SECONDS):
+                return
+            self._last_attempt = time.monotonic()
+            headers = {}
+            apikey = settings.get_supabase_key_for_auth()
+            if apikey:
+                headers["apikey"] = apikey
+            try:
+                async with httpx.AsyncClient(timeout=5.0) as client:
+                    resp = await client.get(url, headers=headers)
+                    resp.raise_for_status()
+                    jwks = resp.json()
+            except Exception as exc:
+                logger.warning("Téléchargement du JWKS Supabase impossible: %s", exc)
+                return
+
+            keys: Dict[str, Any] = {}
+            for jwk in jwks.get("keys", []):
+                try:
+                    keys[jwk.get("kid") or ""] = jwt.PyJWK(jwk).key
+                except Exception as exc:
+                    logger.debug("Clé JWKS ignorée (kid=%s): %s", jwk.get("kid"), exc)
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+
+    # ---- Rafraîchissement périodique en arrière-plan ----
+
+    async def start(self) -> None:
+        if not self.jwks_url() or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run(), name="supabase-jwks-refresh")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.refresh(force=True)
+            await asyncio.sleep(settings.SUPABASE_JWKS_CACHE_SECONDS / 2)
+
+
+jwt_verifier = SupabaseJWTVerifier()
@@ -5,6 +5,8 @@ from typing import Optional, Dict, Any
 from app.core.settings import settings
 from .tp_store import TPStore
 from .supabase_store import get_supabase_store
+from .token_refresher import token_refresher
+from .pending_links import get_pending_link_store
 
 def _generate_pkce_pair() -> tuple[str, str]:
     verifier = base64.urlsafe_b64encode(os.urandom(32)).rstrip(b"=").decode("ascii")
@@ -267,43 +269,38 @@ async def ensure_user_access_token(user_id: Optional[str] = None, state: Optiona
             token_data = store.get(key)
             
             if token_data:
-                access_token = token_data.get("access_token")
-                if access_token:
-                    return access_token
+                # Le refresher renouvelle le token en arrière-plan avant son expiration
+                token_refresher.track(key, token_data)
+                if store.valid(token_data):
+                    return token_data.get("access_token")
                 
-                # Si le token est expiré, essayer de le rafraîchir
-                refresh_token = token_data.get("refresh_token")
-                if refresh_token:
-                    try:
-                        new_token = await refresh_access_token(refresh_token)
-                        # Stocker le nouveau token dans Supabase
-                        expires_in = new_token.get("expires_in", 3600)
-                        store.set(key, new_token, ttl=expires_in)
-                        return new_token.get("access_token")
-                    except Exception:
-                        # Si le refresh échoue, retourner None
-                        return None
+                # Si le token est expiré, le rafraîchir (single-flight : les requêtes
+                # concurrentes pour le même utilisateur partagent le même refresh)
+                if token_data.get("refresh_token"):
+                    new_token = await token_refresher.refresh(key)
+                    return new_token.get("access_token") if new_token else None
+                return token_data.get("access_token")
             
             # Si aucun token trouvé pour l'utilisateur, chercher automatiquement
-            # les tokens temporaires récents et les lier à l'utilisateur
+            # un token en attente de liaison (callback OAuth récent) et le lier à l'utilisateur
+            pending = get_pending_link_store()
             temp_token_data = None
-            temp_key = None
             
-            # D'abord, essayer avec le state fourni si disponible
+            # D'abord, essayer avec le state fourni si disponible (accès direct par clé)
             if state:
-                temp_key = f"temp_token:{state}"
-                temp_token_data = store.get(temp_key)
+                temp_token_data = pending.take(state)
             
-            # Si pas de token avec le state fourni, chercher tous les tokens temporaires récents
+            # Sinon, prendre le lien en attente le plus récent (index created_at, résultat vide mis en cache)
             if not temp_token_data:
-                temp_token_data, temp_key = await _find_recent_temp_token(store)
+                found = pending.take_most_recent()
+                if found:
+                    temp_token_data = found[1]
             
-            if temp_token_data and temp_key:
-                # Lier le token temporaire à l'utilisateur
+            if temp_token_data:
+                # Lier le token en attente à l'utilisateur
                 expires_in = temp_token_data.get("expires_in", 3600)
                 store.set(key, temp_token_data, ttl=expires_in)
-                # Supprimer le token temporaire
-                store.delete(temp_key)
+                token_refresher.track(key, store.get(key))
                 return temp_token_data.get("access_token")
             
             return None
@@ -322,50 +319,3 @@ async def ensure_user_access_token(user_id: Optional[str] = None, state: Optiona
     TPStore.set_token(newtok)
     return TPStore.get_access_token()
 
-
-async def _find_recent_temp_token(store) -> tuple[Optional[dict], Optional[str]]:
-    """
-    Cherche un token temporaire récent (créé dans les 10 dernières minutes).
-    Retourne (token_data, key) ou (None, None) si aucun trouvé.
-    """
-    import time
-    from supabase import create_client
-    from app.core.settings import settings
-    
-    try:
-        # Utiliser directement Supabase pour chercher les tokens temporaires récents
-        supabase_url = settings.SUPABASE_URL
-        supabase_key = settings.get_supabase_key_for_admin()
-        
-        if not supabase_url or not supabase_key:
-            return None, None
-        
-        client = create_client(supabase_url, supabase_key)
-        table_name = settings.SUPABASE_TOKENS_TABLE
-        
-        # Chercher les tokens temporaires créés dans les 10 dernières minutes
-        # Les tokens temporaires ont une clé qui commence par "temp_token:"
-        import datetime
-        ten_minutes_ago = datetime.datetime.utcnow() - datetime.timedelta(minutes=10)
-        ten_minutes_ago_str = ten_minutes_ago.strftime("%Y-%m-%d %H:%M:%S")
-        
-        response = client.table(table_name)\
-            .select("key, token_data, expires_at, updated_at")\
-            .like("key", "temp_token:%")\
-            .gte("updated_at", ten_minutes_ago_str)\
-            .order("updated_at", desc=True)\
-            .limit(1)\
-            .execute()
-        
-        if response.data and len(response.data) > 0:
-            token_entry = response.data[0]
-            token_data = token_entry.get("token_data")
-            if isinstance(token_data, str):
-                import json
-                token_data = json.loads(token_data)
-            return token_data, token_entry.get("key")
-        
-        return None, None
-    except Exception as e:
-        # En cas d'erreur, retourner None
-        return None, None
\ No newline at end of file
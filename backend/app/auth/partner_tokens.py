@@ -1,12 +1,32 @@
 from __future__ import annotations
+import asyncio
+import logging
+import time
 import httpx
 from pydantic import BaseModel
 from app.core.settings import settings
 from app.auth.token_store import TokenStore
 from app.auth.supabase_store import SupabaseTokenStore
-from typing import Union
+from app.auth.token_refresher import token_refresher, PARTNER_TOKEN_PREFIX
+from app.auth.distributed_lock import get_distributed_lock
+from typing import Dict, Optional, Union
 
-PARTNER_CACHE_KEY = "tesla:partner_token:eu"
+logger = logging.getLogger(__name__)
+
+# Un token partenaire par région (l'audience diffère entre EU et NA)
+PARTNER_CACHE_KEY_TEMPLATE = PARTNER_TOKEN_PREFIX + "{region}"
+
+# Acquisitions en cours dans ce processus (fusionne les appelants locaux avant le verrou distribué)
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def partner_cache_key(region: str | None = None) -> str:
+    """Clé de cache du token partenaire pour une région (défaut: TESLA_REGION)."""
+    return PARTNER_CACHE_KEY_TEMPLATE.format(region=settings.tesla_region_for(region))
+
+
+def partner_region_from_key(key: str) -> str:
+    return key[len(PARTNER_TOKEN_PREFIX):] or settings.tesla_region_for()
 
 class PartnerToken(BaseModel):
     access_token: str
@@ -14,13 +34,14 @@ class PartnerToken(BaseModel):
     expires_in: int
     scope: str | None = None
 
-async def fetch_partner_token(use_tp_credentials: bool = False) -> PartnerToken:
+async def fetch_partner_token(use_tp_credentials: bool = False, region: str | None = None) -> PartnerToken:
     """
     Récupère un partner token via client_credentials.
     
     Args:
         use_tp_credentials: Si True, utilise TP_CLIENT_ID/SECRET au lieu de TESLA_CLIENT_ID/SECRET.
                            Utile si vous utilisez le même CLIENT_ID pour les deux types de tokens.
+        region: Région Fleet ("eu"/"na") dont l'audience est demandée (défaut: TESLA_REGION)
     
     Note: Pour les endpoints partenaire, les scopes sont généralement déterminés
     par la configuration de l'application dans le portail Tesla Developer.
@@ -42,7 +63,7 @@ async def fetch_partner_token(use_tp_credentials: bool = False) -> PartnerToken:
         "grant_type": "client_credentials",
         "client_id": client_id,
         "client_secret": client_secret,
-        "audience": settings.tesla_audience_for(),  # audience par défaut selon la région
+        "audience": settings.tesla_audience_for(region),
     }
     # Note: Pour client_credentials, les scopes sont généralement déterminés par
     # la configuration de l'app dans le portail, mais on peut essayer de les spécifier
@@ -93,20 +114,97 @@ async def fetch_partner_token(use_tp_credentials: bool = False) -> PartnerToken:
         payload = resp.json()
         return PartnerToken(**payload)
 
-async def get_partner_token_cached(store: Union[TokenStore, SupabaseTokenStore], use_tp_credentials: bool = False) -> str:
+async def get_partner_token_cached(
+    store: Union[TokenStore, SupabaseTokenStore],
+    use_tp_credentials: bool = False,
+    region: str | None = None,
+) -> str:
     """
     Retourne un access_token valide depuis le store (Redis/Supabase), sinon fetch + cache.
+    En cas de miss, un seul processus appelle fleet-auth (voir acquire_partner_token).
     
     Args:
         store: Le store de tokens
         use_tp_credentials: Si True, utilise TP_CLIENT_ID/SECRET au lieu de TESLA_CLIENT_ID/SECRET
+        region: Région Fleet ("eu"/"na"), défaut: TESLA_REGION
     """
-    cached = store.get(PARTNER_CACHE_KEY)
+    key = partner_cache_key(region)
+    cached = await asyncio.to_thread(store.get, key)
     if store.valid(cached):
+        token_refresher.track(key, cached, use_tp_credentials=use_tp_credentials)
         return cached["access_token"]
 
-    token = await fetch_partner_token(use_tp_credentials=use_tp_credentials)
+    token = await acquire_partner_token(store, region, use_tp_credentials=use_tp_credentials)
+    return token["access_token"]
+
+
+async def acquire_partner_token(
+    store: Union[TokenStore, SupabaseTokenStore],
+    region: str | None = None,
+    use_tp_credentials: bool = False,
+    min_validity: int = 30,
+) -> dict:
+    """
+    Obtient un token partenaire en single-flight :
+    - dans le processus, les appelants concurrents partagent la même tâche ;
+    - entre processus, seul le détenteur du verrou distribué appelle fleet-auth,
+      les autres attendent en interrogeant le store jusqu'à ce que le token apparaisse.
+
+    Args:
+        min_validity: Durée de validité restante (s) en dessous de laquelle le token
+                      en cache est considéré comme à renouveler
+    """
+    key = partner_cache_key(region)
+    task = _inflight.get(key)
+    if task is None or task.done():
+        task = asyncio.ensure_future(_acquire(store, key, use_tp_credentials, min_validity))
+        _inflight[key] = task
+        task.add_done_callback(lambda t, k=key: _inflight.pop(k, None) if _inflight.get(k) is t else None)
+    return await asyncio.shield(task)
+
+
+def _usable(token: Optional[dict], min_validity: int) -> bool:
+    return bool(token and token.get("access_token") and token.get("expires_at", 0) > time.time() + min_validity)
+
+
+async def _acquire(store, key: str, use_tp_credentials: bool, min_validity: int) -> dict:
+    # Verrou et store sont synchrones (Redis, PostgREST) : appelés hors de la boucle
+    lock = await asyncio.to_thread(get_distributed_lock)
+    deadline = time.monotonic() + settings.PARTNER_TOKEN_LOCK_WAIT_SECONDS
+
+    while True:
+        owner = await asyncio.to_thread(lock.acquire, key, settings.PARTNER_TOKEN_LOCK_TTL_SECONDS)
+        if owner:
+            try:
+                # Double vérification : le détenteur précédent a pu remplir le cache
+                cached = await asyncio.to_thread(store.get, key)
+                if _usable(cached, min_validity):
+                    token_refresher.track(key, cached, use_tp_credentials=use_tp_credentials)
+                    return cached
+                return await _fetch_and_store(store, key, use_tp_credentials)
+            finally:
+                await asyncio.to_thread(lock.release, key, owner)
+
+        await asyncio.sleep(settings.PARTNER_TOKEN_LOCK_POLL_SECONDS)
+        cached = await asyncio.to_thread(store.get, key)
+        if _usable(cached, min_validity):
+            token_refresher.track(key, cached, use_tp_credentials=use_tp_credentials)
+            return cached
+
+        if time.monotonic() >= deadline:
+            # Le détenteur du verrou semble bloqué : ne pas faire échouer la requête
+            logger.warning("Verrou token partenaire %s non libéré à temps, fetch direct", key)
+            return await _fetch_and_store(store, key, use_tp_credentials)
+
+
+async def _fetch_and_store(store, key: str, use_tp_credentials: bool) -> dict:
+    token = await fetch_partner_token(
+        use_tp_credentials=use_tp_credentials,
+        region=partner_region_from_key(key),
+    )
     # marge de sécurité 60s
     ttl = max(60, int(token.expires_in) - 60)
-    store.set(PARTNER_CACHE_KEY, token.model_dump(), ttl=ttl)
-    return token.access_token
+    await asyncio.to_thread(store.set, key, token.model_dump(), ttl=ttl)
+    stored = await asyncio.to_thread(store.get, key) or {**token.model_dump(), "expires_at": int(time.time()) + ttl}
+    token_refresher.track(key, stored, use_tp_credentials=use_tp_credentials)
+    return stored
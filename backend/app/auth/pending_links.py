@@ -0,0 +1,141 @@
+"""
+Tokens Tesla en attente de liaison à un utilisateur Supabase.
+
+Après le callback OAuth, le token est stocké sous son `state` jusqu'à ce que
+l'utilisateur le lie (POST /auth/link-token ou première requête authentifiée).
+Supabase : table `pending_token_links` (clé primaire state, index created_at).
+Mémoire : store TTL borné (dev / TOKEN_STORE_TYPE != "supabase").
+"""
+from __future__ import annotations
+import time
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+from app.core.settings import settings
+from app.core.memory_store import get_memory_store
+from app.core.invalidation import invalidation_bus
+
+INVALIDATION_NAMESPACE = "pending_links"
+# Marqueur local "aucun lien en attente" : évite une requête par appel pour les utilisateurs non liés
+_EMPTY_MARKER = "__empty__"
+
+_negative_cache = get_memory_store("pending_links_negative", max_entries=16)
+_subscribed = False
+
+
+def _iso(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+class PendingLinkStore(ABC):
+    """Interface : put / take(state) / take_most_recent(max_age)."""
+
+    @abstractmethod
+    def put(self, state: str, token: dict, ttl: int | None = None) -> None:
+        ...
+
+    @abstractmethod
+    def take(self, state: str) -> Optional[dict]:
+        """Retire et retourne le token en attente pour ce state (usage unique)."""
+
+    @abstractmethod
+    def _take_most_recent(self, max_age_seconds: int) -> Optional[Tuple[str, dict]]:
+        ...
+
+    def take_most_recent(self, max_age_seconds: int | None = None) -> Optional[Tuple[str, dict]]:
+        """
+        Retire et retourne (state, token) du lien créé le plus récemment dans la fenêtre.
+        Un résultat vide est mémorisé brièvement (invalidé par put, ici et sur les autres replicas).
+        """
+        if _negative_cache.get(_EMPTY_MARKER):
+            return None
+        found = self._take_most_recent(max_age_seconds or settings.PENDING_LINK_AUTO_LINK_WINDOW_SECONDS)
+        if found is None:
+            _negative_cache.set(_EMPTY_MARKER, True, ttl=settings.PENDING_LINK_NEGATIVE_CACHE_SECONDS)
+        return found
+
+    def _notify_put(self) -> None:
+        _negative_cache.clear()
+        invalidation_bus.publish(INVALIDATION_NAMESPACE, "*")
+
+
+class SupabasePendingLinkStore(PendingLinkStore):
+    def __init__(self, supabase_client, table_name: str = "pending_token_links"):
+        self.supabase = supabase_client
+        self.table_name = table_name
+
+    def put(self, state: str, token: dict, ttl: int | None = None) -> None:
+        now = time.time()
+        self.supabase.table(self.table_name).upsert({
+            "state": state,
+            "token_data": token,
+            "created_at": _iso(now),
+            "expires_at": _iso(now + (ttl or settings.PENDING_LINK_TTL_SECONDS)),
+        }).execute()
+        self._notify_put()
+
+    def take(self, state: str) -> Optional[dict]:
+        # DELETE ... RETURNING : un seul appelant peut consommer le lien
+        response = self.supabase.table(self.table_name)\
+            .delete()\
+            .eq("state", state)\
+            .gte("expires_at", _iso(time.time()))\
+            .execute()
+        if response.data:
+            return response.data[0].get("token_data")
+        return None
+
+    def _take_most_recent(self, max_age_seconds: int) -> Optional[Tuple[str, dict]]:
+        now = time.time()
+        response = self.supabase.table(self.table_name)\
+            .select("state")\
+            .gte("created_at", _iso(now - max_age_seconds))\
+            .gte("expires_at", _iso(now))\
+            .order("created_at", desc=True)\
+            .limit(1)\
+            .execute()
+        if not response.data:
+            return None
+        state = response.data[0]["state"]
+        token = self.take(state)
+        return (state, token) if token else None
+
+
+class MemoryPendingLinkStore(PendingLinkStore):
+    def __init__(self):
+        self._links = get_memory_store("pending_links", default_ttl=settings.PENDING_LINK_TTL_SECONDS)
+
+    def put(self, state: str, token: dict, ttl: int | None = None) -> None:
+        self._links.set(state, (time.time(), dict(token)), ttl=ttl or settings.PENDING_LINK_TTL_SECONDS)
+        self._notify_put()
+
+    def take(self, state: str) -> Optional[dict]:
+        entry = self._links.pop(state)
+        return entry[1] if entry else None
+
+    def _take_most_recent(self, max_age_seconds: int) -> Optional[Tuple[str, dict]]:
+        cutoff = time.time() - max_age_seconds
+        candidates = [(created, state) for state, (created, _token) in self._links.items() if created >= cutoff]
+        for _created, state in sorted(candidates, reverse=True):
+            token = self.take(state)
+            if token:
+                return state, token
+        return None
+
+
+def get_pending_link_store() -> PendingLinkStore:
+    global _subscribed
+    if not _subscribed:
+        invalidation_bus.subscribe(INVALIDATION_NAMESPACE, lambda _key: _negative_cache.clear())
+        _subscribed = True
+    if settings.TOKEN_STORE_TYPE == "supabase":
+        from app.auth.supabase_store import get_supabase_store
+        try:
+            store = get_supabase_store()
+            return SupabasePendingLinkStore(store.supabase, settings.SUPABASE_PENDING_LINKS_TABLE)
+        except ValueError:
+            pass
+    return _memory_store
+
+
+_memory_store = MemoryPendingLinkStore()
@@ -0,0 +1,75 @@
+"""
+Tickets de flux SSE (GET /fleet/events/stream).
+
+EventSource ne peut pas envoyer d'en-tête Authorization : plutôt que de mettre
+le bearer Supabase dans l'URL (journaux d'accès, historique, Referer), le client
+échange son token contre un ticket (POST /fleet/events/ticket) :
+- propre à un usage (`purpose`) : inutilisable sur une autre route ;
+- de courte durée (STREAM_TICKET_TTL_SECONDS) : valable le temps d'ouvrir le
+  flux et des reconnexions automatiques d'EventSource, sans relecture de session ;
+- stocké sous son hash (le ticket lui-même n'est jamais gardé), dans Redis quand
+  il répond (ticket émis par un replica, flux ouvert sur un autre), sinon dans
+  un store mémoire du processus.
+"""
+from __future__ import annotations
+import hashlib
+import secrets
+from typing import Any, Dict, Optional
+
+from fastapi import Depends, HTTPException, Query, status
+
+from app.auth.supabase_auth import oauth2_scheme, require_supabase_user
+from app.core import json_codec
+from app.core.memory_store import get_memory_store
+from app.core.redis_client import get_redis
+from app.core.settings import settings
+
+KEY_PREFIX = "stream_ticket:"
+VEHICLE_EVENTS = "vehicle_events"
+
+_local = get_memory_store("stream_tickets", max_entries=10000, default_ttl=settings.STREAM_TICKET_TTL_SECONDS)
+
+
+def _key(ticket: str) -> str:
+    return KEY_PREFIX + hashlib.sha256(ticket.encode()).hexdigest()
+
+
+def issue_stream_ticket(user_info: Dict[str, Any], purpose: str) -> str:
+    """Crée un ticket pour `purpose`, lié à l'utilisateur authentifié."""
+    ticket = secrets.token_urlsafe(32)
+    raw = json_codec.dumps_str({"user_id": user_info.get("user_id"), "purpose": purpose})
+    client = get_redis()
+    if client is not None:
+        client.set(_key(ticket), raw, ex=settings.STREAM_TICKET_TTL_SECONDS)
+    else:
+        _local.set(_key(ticket), raw, ttl=settings.STREAM_TICKET_TTL_SECONDS)
+    return ticket
+
+
+def resolve_stream_ticket(ticket: str, purpose: str) -> Optional[Dict[str, Any]]:
+    """Principal {"user_id"} du ticket, ou None (inconnu, expiré ou émis pour un autre usage)."""
+    client = get_redis()
+    raw = client.get(_key(ticket)) if client is not None else _local.get(_key(ticket))
+    if not raw:
+        return None
+    record = json_codec.loads(raw)
+    if record.get("purpose") != purpose or not record.get("user_id"):
+        return None
+    return {"user_id": record["user_id"]}
+
+
+async def require_vehicle_events_principal(
+    token: str | None = Depends(oauth2_scheme),
+    ticket: str | None = Query(default=None, description="Ticket de flux (POST /fleet/events/ticket)"),
+) -> Dict[str, Any]:
+    """En-tête Authorization (clients HTTP) ou ?ticket= (EventSource)."""
+    if token:
+        return await require_supabase_user(token)
+    if ticket:
+        principal = resolve_stream_ticket(ticket, VEHICLE_EVENTS)
+        if principal is not None:
+            return principal
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Ticket de flux invalide ou expiré : demandez-en un nouveau via POST /fleet/events/ticket",
+    )
@@ -1,9 +1,33 @@
 from __future__ import annotations
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Dict
 import httpx
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from prometheus_client import Counter
 from app.core.settings import settings
+from app.core.memory_store import get_memory_store
+from app.auth.jwt_verifier import jwt_verifier, LocalVerificationUnavailable
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_REQUESTS = Counter(
+    "supabase_principal_cache_requests_total",
+    "Résolutions du principal Supabase (hit = cache, coalesced = vérification en cours partagée, miss = vérification)",
+    ["result"],
+)
+
+# Clé = sha256(token) : le bearer token lui-même n'est jamais gardé comme clé
+_principal_cache = get_memory_store(
+    "supabase_principals",
+    max_entries=settings.SUPABASE_PRINCIPAL_CACHE_MAX_ENTRIES,
+    default_ttl=settings.SUPABASE_PRINCIPAL_CACHE_MAX_AGE_SECONDS,
+)
+_inflight: Dict[str, asyncio.Future] = {}
 
 # Swagger affichera un prompt user/pass via ce flow, puis ajoutera le Bearer automatiquement
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/supabase/token", auto_error=False)
@@ -22,18 +46,25 @@ def get_user_id_from_token(token: str) -> str | None:
         return None
 
 
-async def require_supabase_user(token: str | None = Depends(oauth2_scheme)):
+def _user_from_claims(claims: dict) -> dict:
+    """Reconstruit un profil minimal (équivalent /auth/v1/user) à partir des claims du JWT."""
+    return {
+        "id": claims.get("sub"),
+        "aud": claims.get("aud"),
+        "role": claims.get("role"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "app_metadata": claims.get("app_metadata") or {},
+        "user_metadata": claims.get("user_metadata") or {},
+        "session_id": claims.get("session_id"),
+    }
+
+
+async def _verify_remote(token: str) -> dict:
     """
     Vérifie le bearer token Supabase via l'endpoint /auth/v1/user.
     Utilise SUPABASE_SERVICE_ROLE_KEY de préférence (pour bypass RLS), sinon SUPABASE_ANON_KEY ou SUPABASE_KEY.
-    Retourne un dict avec 'user' (profil) et 'user_id' (ID utilisateur).
     """
-    if not token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Authorization header manquant. Utilisez le flow /api/auth/supabase/token pour obtenir un token.",
-        )
-
     supabase_url = settings.SUPABASE_URL
     supabase_key = settings.get_supabase_key_for_admin()  # Service role pour vérifier les tokens
     
@@ -80,7 +111,113 @@ async def require_supabase_user(token: str | None = Depends(oauth2_scheme)):
             detail=detail_msg,
         )
 
-    user_data = resp.json()
+    return resp.json()
+
+
+def _principal_ttl(token: str) -> float:
+    """Durée de cache : jusqu'à l'exp du JWT, plafonnée par SUPABASE_PRINCIPAL_CACHE_MAX_AGE_SECONDS."""
+    max_age = settings.SUPABASE_PRINCIPAL_CACHE_MAX_AGE_SECONDS
+    try:
+        # Lecture sans vérification : appelé uniquement après une vérification réussie
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except Exception:
+        exp = None
+    if not exp:
+        return max_age
+    return max(0.0, min(max_age, float(exp) - time.time()))
+
+
+class _VerifierCancelled(Exception):
+    """La vérification partagée a été annulée avec la requête qui la portait."""
+
+
+async def require_supabase_user(token: str | None = Depends(oauth2_scheme)):
+    """
+    Vérifie le bearer token Supabase.
+    Par défaut la signature, l'expiration et l'audience sont vérifiées localement
+    (JWKS en cache ou SUPABASE_JWT_SECRET) ; l'appel /auth/v1/user n'est fait que si
+    la vérification locale est impossible (voir SUPABASE_JWT_VERIFICATION).
+    Le principal vérifié est mis en cache (hash du token) et les vérifications
+    concurrentes d'un même token sont fusionnées en une seule.
+    Retourne un dict avec 'user' (profil) et 'user_id' (ID utilisateur).
+    """
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authorization header manquant. Utilisez le flow /api/auth/supabase/token pour obtenir un token.",
+        )
+    if not settings.SUPABASE_PRINCIPAL_CACHE_ENABLED:
+        return await _verify_principal(token)
+
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    principal = _principal_cache.get(cache_key)
+    if principal is not None:
+        PRINCIPAL_CACHE_REQUESTS.labels("hit").inc()
+        return dict(principal)
+
+    future = _inflight.get(cache_key)
+    while future is not None:
+        PRINCIPAL_CACHE_REQUESTS.labels("coalesced").inc()
+        try:
+            return dict(await asyncio.shield(future))
+        except _VerifierCancelled:
+            # La requête qui vérifiait a été annulée (client parti) : on prend le relais
+            future = _inflight.get(cache_key)
+
+    PRINCIPAL_CACHE_REQUESTS.labels("miss").inc()
+    future = asyncio.get_running_loop().create_future()
+    _inflight[cache_key] = future
+    try:
+        principal = await _verify_principal(token)
+    except asyncio.CancelledError:
+        # Ne pas propager l'annulation aux requêtes fusionnées : elles relancent la vérification
+        future.set_exception(_VerifierCancelled())
+        future.exception()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        # Évite "Future exception was never retrieved" quand personne n'attendait
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(cache_key, None)
+    future.set_result(principal)
+
+    ttl = _principal_ttl(token)
+    if ttl > 0:
+        _principal_cache.set(cache_key, principal, ttl=ttl)
+    return dict(principal)
+
+
+async def _verify_principal(token: str) -> dict:
+    mode = settings.SUPABASE_JWT_VERIFICATION
+    if mode != "remote":
+        try:
+            claims = await jwt_verifier.verify(token)
+            return {
+                "user": _user_from_claims(claims),
+                "user_id": claims.get("sub"),
+                "token": token,
+            }
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token Supabase expiré - reconnectez-vous via /api/auth/supabase/token",
+            )
+        except jwt.InvalidTokenError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Token Supabase invalide: {exc}",
+            )
+        except LocalVerificationUnavailable as exc:
+            if mode == "local":
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail=f"Token Supabase non vérifiable localement: {exc}",
+                )
+            logger.debug("Vérification locale impossible, repli sur /auth/v1/user: %s", exc)
+
+    user_data = await _verify_remote(token)
     # Extraire l'ID utilisateur depuis le token JWT ou depuis user_data
     user_id = get_user_id_from_token(token) or user_data.get("id") or user_data.get("sub")
     
@@ -89,4 +226,3 @@ async def require_supabase_user(token: str | None = Depends(oauth2_scheme)):
         "user_id": user_id,
         "token": token,  # Garder le token pour usage downstream si besoin
     }
-
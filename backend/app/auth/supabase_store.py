@@ -1,13 +1,22 @@
 """
 Store de tokens utilisant Supabase au lieu de Redis.
 Utilise la table 'tokens' dans Supabase pour stocker les tokens OAuth.
+Les lectures passent par un cache local (read-through) borné par l'expiration
+du token, invalidé en écriture et entre replicas via le bus d'invalidation.
 """
 from __future__ import annotations
-import json
 import time
 from typing import Optional
 from supabase import create_client, Client
+from app.core import json_codec
 from app.core.settings import settings
+from app.core.memory_store import get_memory_store
+from app.core.invalidation import invalidation_bus
+
+INVALIDATION_NAMESPACE = "supabase_tokens"
+
+_read_cache = get_memory_store("supabase_token_cache")
+_read_cache_subscribed = False
 
 
 class SupabaseTokenStore:
@@ -27,18 +36,31 @@ class SupabaseTokenStore:
         """
         self.supabase: Client = create_client(supabase_url, supabase_key)
         self.table_name = table_name
-        self._fallback_mem: dict[str, str] = {}  # Fallback en mémoire si Supabase échoue
+        self._fallback_mem = get_memory_store("supabase_fallback")  # Fallback en mémoire si Supabase échoue
+        self._read_cache = _read_cache
+        global _read_cache_subscribed
+        if not _read_cache_subscribed:
+            invalidation_bus.subscribe(INVALIDATION_NAMESPACE, _read_cache.delete)
+            _read_cache_subscribed = True
     
-    def get(self, key: str) -> Optional[dict]:
+    def get(self, key: str, bypass_cache: bool = False) -> Optional[dict]:
         """
-        Récupère un token depuis Supabase.
+        Récupère un token depuis le cache local, sinon depuis Supabase.
         
         Args:
-            key: Clé du token (ex: "partner_token:eu", "user_token:user123")
+            key: Clé du token (ex: "tesla:partner_token:eu", "user_token:user123")
+            bypass_cache: Si True, lit directement Supabase (ex: avant de consommer
+                          un refresh_token, pour ne pas utiliser une copie périmée)
             
         Returns:
             Dictionnaire du token ou None si non trouvé/expiré
         """
+        if settings.TOKEN_LOCAL_CACHE_ENABLED and not bypass_cache:
+            # Écoute des invalidations pas encore démarrée (Redis indisponible au démarrage) : nouvel essai
+            invalidation_bus.ensure_listener()
+            cached = self._read_cache.get(key)
+            if cached is not None:
+                return dict(cached)
         try:
             # Récupérer depuis Supabase (tokens non expirés uniquement)
             # expires_at est un TIMESTAMPTZ, on compare avec NOW()
@@ -52,25 +74,26 @@ class SupabaseTokenStore:
             
             if response.data and len(response.data) > 0:
                 token_data = response.data[0]["token_data"]
-                # Si c'est déjà un dict, le retourner tel quel
+                # Parser le JSON si nécessaire
+                if isinstance(token_data, str):
+                    token_data = json_codec.loads(token_data)
                 if isinstance(token_data, dict):
-                    return token_data
-                # Sinon, parser le JSON
-                return json.loads(token_data) if isinstance(token_data, str) else token_data
+                    self._cache_put(key, token_data)
+                return token_data
             
             # Si pas trouvé dans Supabase, essayer le fallback mémoire
-            if key in self._fallback_mem:
-                raw = self._fallback_mem[key]
-                return json.loads(raw) if isinstance(raw, str) else raw
+            raw = self._fallback_mem.get(key)
+            if raw:
+                return json_codec.loads(raw) if isinstance(raw, str) else raw
                 
             return None
             
         except Exception as e:
             # En cas d'erreur, utiliser le fallback mémoire
             print(f"⚠️  Erreur Supabase get({key}): {e}, utilisation du fallback mémoire")
-            if key in self._fallback_mem:
-                raw = self._fallback_mem[key]
-                return json.loads(raw) if isinstance(raw, str) else raw
+            raw = self._fallback_mem.get(key)
+            if raw:
+                return json_codec.loads(raw) if isinstance(raw, str) else raw
             return None
     
     def set(self, key: str, token: dict, ttl: int) -> None:
@@ -98,14 +121,17 @@ class SupabaseTokenStore:
                 "updated_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
             }).execute()
             
-            # Mettre aussi dans le fallback mémoire
-            self._fallback_mem[key] = json.dumps(token_copy)
+            # Mettre aussi dans le fallback mémoire et le cache de lecture (write-through)
+            self._fallback_mem.set(key, json_codec.dumps_str(token_copy), ttl=ttl)
+            self._cache_put(key, token_copy)
+            invalidation_bus.publish(INVALIDATION_NAMESPACE, key)
             
         except Exception as e:
             # En cas d'erreur, utiliser le fallback mémoire
             print(f"⚠️  Erreur Supabase set({key}): {e}, utilisation du fallback mémoire")
             token_copy["expires_at"] = expires_at_ts
-            self._fallback_mem[key] = json.dumps(token_copy)
+            self._fallback_mem.set(key, json_codec.dumps_str(token_copy), ttl=ttl)
+            self._read_cache.delete(key)
     
     def valid(self, token: dict | None) -> bool:
         """
@@ -138,9 +164,52 @@ class SupabaseTokenStore:
         except Exception as e:
             print(f"⚠️  Erreur Supabase delete({key}): {e}")
         
-        # Supprimer aussi du fallback mémoire
-        self._fallback_mem.pop(key, None)
+        # Supprimer aussi du fallback mémoire et du cache de lecture (ici et sur les autres replicas)
+        self._fallback_mem.delete(key)
+        self._read_cache.delete(key)
+        invalidation_bus.publish(INVALIDATION_NAMESPACE, key)
+    
+    def _cache_put(self, key: str, token: dict) -> None:
+        """Met un token en cache local jusqu'à son expiration (bornée par TOKEN_LOCAL_CACHE_MAX_AGE_SECONDS)."""
+        if not settings.TOKEN_LOCAL_CACHE_ENABLED:
+            return
+        ttl = float(settings.TOKEN_LOCAL_CACHE_MAX_AGE_SECONDS)
+        expires_at = token.get("expires_at")
+        if expires_at:
+            ttl = min(ttl, float(expires_at) - time.time())
+        if ttl > 0:
+            self._read_cache.set(key, dict(token), ttl=ttl)
     
+    def list_prefix(self, prefix: str) -> dict[str, dict]:
+        """
+        Liste les tokens non expirés dont la clé commence par `prefix`.
+        Utilisé au démarrage (ex: TokenRefresher), pas dans les chemins de requête.
+
+        Args:
+            prefix: Préfixe de clé (ex: "user_token:")
+
+        Returns:
+            Dictionnaire clé -> token
+        """
+        try:
+            current_time_iso = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+            response = self.supabase.table(self.table_name)\
+                .select("key, token_data")\
+                .like("key", f"{prefix}%")\
+                .gte("expires_at", current_time_iso)\
+                .execute()
+            tokens = {}
+            for row in response.data or []:
+                token_data = row.get("token_data")
+                if isinstance(token_data, str):
+                    token_data = json_codec.loads(token_data)
+                if isinstance(token_data, dict):
+                    tokens[row["key"]] = token_data
+            return tokens
+        except Exception as e:
+            print(f"⚠️  Erreur Supabase list_prefix({prefix}): {e}")
+            return {}
+
     def cleanup_expired(self) -> None:
         """
         Nettoie les tokens expirés (optionnel, peut être fait par une fonction PostgreSQL).
@@ -173,5 +242,14 @@ def get_supabase_store() -> SupabaseTokenStore:
         )
     
     table_name = settings.SUPABASE_TOKENS_TABLE
-    return SupabaseTokenStore(supabase_url, supabase_key, table_name)
+    # Une instance par configuration et par processus (évite un create_client par requête)
+    config = (supabase_url, supabase_key, table_name)
+    store = _stores.get(config)
+    if store is None:
+        store = SupabaseTokenStore(supabase_url, supabase_key, table_name)
+        _stores[config] = store
+    return store
+
+
+_stores: dict[tuple[str, str, str], SupabaseTokenStore] = {}
 
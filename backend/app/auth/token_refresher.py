@@ -0,0 +1,272 @@
+"""
+Rafraîchissement proactif des tokens Tesla (utilisateur et partenaire).
+
+Le refresher suit l'expiration de chaque `user_token:*` et du token partenaire,
+et les renouvelle en arrière-plan avant leur expiration (avec jitter), en
+single-flight par clé : dans le processus (une seule tâche par clé) et entre
+workers/replicas (verrou distribué, comme acquire_partner_token). Les requêtes
+n'attendent donc plus l'endpoint OAuth /token, et le même refresh_token (rotatif
+chez Tesla) n'est jamais consommé deux fois.
+
+Un refresh refusé par Tesla (4xx, ex: invalid_grant après révocation) retire la
+clé du suivi ; les autres échecs sont retentés avec un délai exponentiel, jusqu'à
+ce que le token soit expiré depuis TOKEN_REFRESH_GIVE_UP_AFTER_SECONDS.
+Dans les deux cas la clé est marquée (empreinte du refresh_token, échéance) :
+ni `track()` à la lecture du token, ni `refresh()` côté requête n'appellent /token
+avant l'échéance ; un refus bloque jusqu'à ce qu'un nouveau refresh_token soit stocké.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+USER_TOKEN_PREFIX = "user_token:"
+PARTNER_TOKEN_PREFIX = "tesla:partner_token:"
+
+
+def _fingerprint(refresh_token: Optional[str]) -> str:
+    return hashlib.sha256((refresh_token or "").encode()).hexdigest()[:16]
+
+
+@dataclass
+class _Tracked:
+    expires_at: float
+    jitter: float
+    use_tp_credentials: bool = False
+    retry_at: float = 0.0
+    failures: int = 0
+
+    @property
+    def due_at(self) -> float:
+        return max(self.expires_at - settings.TOKEN_REFRESH_LEAD_SECONDS - self.jitter, self.retry_at)
+
+
+class TokenRefresher:
+    """Planifie et exécute le refresh anticipé des tokens stockés."""
+
+    def __init__(self):
+        self._tracked: Dict[str, _Tracked] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Clé -> (empreinte du refresh_token, pas de refresh avant cette date)
+        self._blocked: Dict[str, Tuple[str, float]] = {}
+        self._attempts: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @staticmethod
+    def is_refreshable_key(key: str) -> bool:
+        return key.startswith(USER_TOKEN_PREFIX) or key.startswith(PARTNER_TOKEN_PREFIX)
+
+    def track(self, key: str, token: Optional[dict], use_tp_credentials: bool = False) -> None:
+        """
+        Enregistre (ou met à jour) l'expiration d'un token à surveiller.
+        Les user tokens sans refresh_token ne peuvent pas être renouvelés et sont ignorés.
+        """
+        if not token or not self.is_refreshable_key(key):
+            return
+        expires_at = token.get("expires_at")
+        if not expires_at:
+            return
+        if key.startswith(USER_TOKEN_PREFIX) and not token.get("refresh_token"):
+            return
+        blocked = self._blocked.get(key)
+        if blocked is not None:
+            if blocked[0] == _fingerprint(token.get("refresh_token")) and blocked[1] > time.time():
+                return  # Refresh refusé ou en attente de réessai pour ce refresh_token
+            if blocked[0] != _fingerprint(token.get("refresh_token")):
+                del self._blocked[key]  # Nouveau refresh_token (nouvelle liaison)
+
+        current = self._tracked.get(key)
+        if current and current.expires_at == float(expires_at):
+            return
+        entry = _Tracked(
+            expires_at=float(expires_at),
+            jitter=random.uniform(0, settings.TOKEN_REFRESH_JITTER_SECONDS),
+            use_tp_credentials=use_tp_credentials,
+        )
+        self._tracked[key] = entry
+        if self._wakeup and (current is None or entry.due_at < current.due_at):
+            self._wakeup.set()
+
+    def untrack(self, key: str) -> None:
+        self._tracked.pop(key, None)
+
+    async def refresh(self, key: str) -> Optional[dict]:
+        """
+        Rafraîchit le token `key` (single-flight) et retourne le nouveau token,
+        ou None si le refresh est impossible. Les appels concurrents pour la même
+        clé partagent le même refresh. Avant l'échéance d'un échec précédent
+        (voir `_refresh_failed`), retourne None sans appeler Tesla.
+        """
+        blocked = self._blocked.get(key)
+        if blocked is not None and blocked[1] > time.time():
+            return None
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._do_refresh(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._inflight.pop(k, None) if self._inflight.get(k) is t else None)
+        return await asyncio.shield(task)
+
+    async def _do_refresh(self, key: str) -> Optional[dict]:
+        from app.auth.partner_tokens import acquire_partner_token, partner_region_from_key
+        from app.auth.store_factory import get_token_store
+
+        try:
+            if key.startswith(USER_TOKEN_PREFIX):
+                return await self._refresh_user_token(key)
+
+            if key.startswith(PARTNER_TOKEN_PREFIX):
+                entry = self._tracked.get(key)
+                # Même chemin single-flight (local + distribué) que les requêtes
+                stored = await acquire_partner_token(
+                    get_token_store(),
+                    partner_region_from_key(key),
+                    use_tp_credentials=entry.use_tp_credentials if entry else False,
+                    min_validity=settings.TOKEN_REFRESH_LEAD_SECONDS,
+                )
+                logger.info("Token partenaire rafraîchi (key=%s)", key)
+                return stored
+        except Exception as exc:
+            self._refresh_failed(key, exc)
+        return None
+
+    async def _refresh_user_token(self, key: str) -> Optional[dict]:
+        from app.auth.distributed_lock import get_distributed_lock
+        from app.auth.supabase_store import get_supabase_store
+
+        store = get_supabase_store()
+        # Verrou et store sont synchrones (Redis, PostgREST) : appelés hors de la boucle
+        lock = await asyncio.to_thread(get_distributed_lock)
+        deadline = time.monotonic() + settings.TOKEN_REFRESH_LOCK_WAIT_SECONDS
+        while True:
+            owner = await asyncio.to_thread(lock.acquire, key, settings.TOKEN_REFRESH_LOCK_TTL_SECONDS)
+            if owner:
+                try:
+                    return await self._refresh_user_token_locked(store, key)
+                finally:
+                    await asyncio.to_thread(lock.release, key, owner)
+
+            # Un autre worker/replica rafraîchit ce token : on attend son résultat
+            await asyncio.sleep(settings.TOKEN_REFRESH_LOCK_POLL_SECONDS)
+            current = await asyncio.to_thread(store.get, key, True)
+            if self._fresh_enough(current):
+                self.track(key, current)
+                return current
+            if time.monotonic() >= deadline:
+                # Contrairement au token partenaire, jamais de refresh sans le verrou
+                raise TimeoutError(f"Verrou de refresh {key[:24]}... non libéré à temps")
+
+    async def _refresh_user_token_locked(self, store, key: str) -> Optional[dict]:
+        from app.auth.oauth_third_party import refresh_access_token
+
+        # Lecture directe après le verrou : ne jamais consommer un refresh_token
+        # depuis une copie locale périmée
+        current = await asyncio.to_thread(store.get, key, True)
+        if not current or not current.get("refresh_token"):
+            self.untrack(key)
+            return None
+        # Le détenteur précédent du verrou a peut-être déjà renouvelé ce token
+        if self._fresh_enough(current):
+            self.track(key, current)
+            return current
+        self._attempts[key] = _fingerprint(current["refresh_token"])
+        new_token = await refresh_access_token(current["refresh_token"])
+        self._attempts.pop(key, None)
+        self._blocked.pop(key, None)
+        merged = {k: v for k, v in current.items() if k != "expires_at"}
+        merged.update(new_token)
+        expires_in = int(merged.get("expires_in", 3600))
+        await asyncio.to_thread(store.set, key, merged, expires_in)
+        stored = await asyncio.to_thread(store.get, key, True) or merged
+        self.track(key, stored)
+        logger.info("Token utilisateur rafraîchi (key=%s...)", key[:24])
+        return stored
+
+    def _refresh_failed(self, key: str, exc: Exception) -> None:
+        entry = self._tracked.get(key)
+        fingerprint = self._attempts.pop(key, "")
+        rejected = isinstance(exc, httpx.HTTPStatusError) and exc.response is not None and 400 <= exc.response.status_code < 500
+        if rejected:
+            # refresh_token révoqué : plus aucun appel tant qu'il n'est pas remplacé
+            logger.warning("Refresh du token %s... refusé: %s", key[:24], exc)
+            self._blocked[key] = (fingerprint, float("inf"))
+            self.untrack(key)
+            return
+        # Réessayer plus tard, de plus en plus espacé, plutôt qu'en boucle serrée
+        failures = (entry.failures if entry else 0) + 1
+        delay = min(settings.TOKEN_REFRESH_RETRY_SECONDS * 2 ** (failures - 1), settings.TOKEN_REFRESH_MAX_RETRY_SECONDS)
+        retry_at = time.time() + delay
+        self._blocked[key] = (fingerprint, retry_at)
+        if entry is None:
+            logger.warning("Échec du refresh du token %s... (pas de nouvel essai avant %ds): %s", key[:24], delay, exc)
+            return
+        if time.time() - entry.expires_at > settings.TOKEN_REFRESH_GIVE_UP_AFTER_SECONDS:
+            # Token abandonné : de nouveau suivi à sa prochaine lecture, après l'échéance
+            logger.warning("Refresh du token %s... abandonné: %s", key[:24], exc)
+            self.untrack(key)
+            return
+        entry.failures = failures
+        entry.retry_at = retry_at
+        logger.warning("Échec du refresh du token %s... (nouvel essai dans %ds): %s", key[:24], delay, exc)
+
+    @staticmethod
+    def _fresh_enough(token: Optional[dict]) -> bool:
+        if not token or not token.get("access_token"):
+            return False
+        return token.get("expires_at", 0) > time.time() + settings.TOKEN_REFRESH_LEAD_SECONDS
+
+    # ---- Boucle d'arrière-plan ----
+
+    async def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        if settings.TOKEN_STORE_TYPE == "supabase":
+            try:
+                from app.auth.supabase_store import get_supabase_store
+                for key, token in get_supabase_store().list_prefix(USER_TOKEN_PREFIX).items():
+                    self.track(key, token)
+                logger.info("TokenRefresher: %d token(s) utilisateur suivis", len(self._tracked))
+            except Exception as exc:
+                logger.warning("TokenRefresher: chargement initial impossible: %s", exc)
+        self._task = asyncio.create_task(self._run(), name="token-refresher")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            now = time.time()
+            due = [key for key, entry in self._tracked.items() if entry.due_at <= now]
+            if due:
+                await asyncio.gather(*(self.refresh(key) for key in due), return_exceptions=True)
+                now = time.time()
+
+            upcoming = [entry.due_at for entry in self._tracked.values()]
+            delay = min(upcoming) - now if upcoming else settings.TOKEN_REFRESH_POLL_SECONDS
+            delay = max(1.0, min(delay, settings.TOKEN_REFRESH_POLL_SECONDS))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+token_refresher = TokenRefresher()
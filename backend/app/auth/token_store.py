@@ -1,11 +1,13 @@
 from __future__ import annotations
-import json, time, os
+import time, os
 from typing import Optional
 import redis
+from app.core import json_codec
+from app.core.memory_store import get_memory_store
 
 class TokenStore:
     def __init__(self, redis_url: str):
-        self._mem: dict[str, str] = {}  # fallback mémoire
+        self._mem = get_memory_store("token_store")  # fallback mémoire (borné, TTL)
         self._use_mem = False
         # Astuce: si REDIS_URL commence par "memory://", on force le mode mémoire
         if redis_url.startswith("memory://"):
@@ -28,12 +30,12 @@ class TokenStore:
             raw = self.r.get(key) if (self.r and not self._use_mem) else self._mem.get(key)
         except Exception:
             raw = self._mem.get(key)
-        return json.loads(raw) if raw else None
+        return json_codec.loads(raw) if raw else None
 
     def set(self, key: str, token: dict, ttl: int) -> None:
         token = dict(token)
         token["expires_at"] = int(time.time()) + ttl
-        payload = json.dumps(token)
+        payload = json_codec.dumps_str(token)
         if self.r and not self._use_mem:
             try:
                 self.r.setex(key, ttl, payload)
@@ -41,7 +43,7 @@ class TokenStore:
             except Exception:
                 # bascule mémoire si erreur
                 self._use_mem = True
-        self._mem[key] = payload  # pas d’expiration en fallback (ok pour dev)
+        self._mem.set(key, payload, ttl=ttl)
 
     def valid(self, token: dict | None) -> bool:
         return bool(token and token.get("access_token") and token.get("expires_at", 0) > time.time()+30)
\ No newline at end of file
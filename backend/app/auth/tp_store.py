@@ -1,6 +1,8 @@
 from __future__ import annotations
 import time
 from typing import Optional, Dict, Any
+from app.core.settings import settings
+from app.core.memory_store import get_memory_store
 
 class TPStore:
     """
@@ -8,7 +10,8 @@ class TPStore:
     En prod: remplace par DB/Redis chiffré et multi-utilisateurs.
     """
     _token: Optional[Dict[str, Any]] = None
-    _pkce_by_state: Dict[str, str] = {}
+    # state -> code_verifier ; borné et expiré pour ne pas accumuler les logins abandonnés
+    _pkce_by_state = get_memory_store("pkce", default_ttl=settings.PKCE_VERIFIER_TTL_SECONDS)
 
     @classmethod
     def set_token(cls, token: Dict[str, Any]) -> None:
@@ -35,7 +38,7 @@ class TPStore:
     # ---- PKCE (state -> code_verifier) ----
     @classmethod
     def set_pkce_verifier(cls, state: str, code_verifier: str) -> None:
-        cls._pkce_by_state[state] = code_verifier
+        cls._pkce_by_state.set(state, code_verifier, ttl=settings.PKCE_VERIFIER_TTL_SECONDS)
 
     @classmethod
     def pop_pkce_verifier(cls, state: str) -> Optional[str]:
@@ -0,0 +1,188 @@
+"""
+Compression des réponses HTTP (zstd, brotli, gzip) négociée via Accept-Encoding.
+
+- gzip est toujours disponible ; brotli et zstd si les paquets `brotli` /
+  `zstandard` sont installés.
+- Seules les réponses complètes (non streamées) d'un type compressible et
+  d'au moins COMPRESSION_MIN_SIZE octets sont compressées : NDJSON/SSE et
+  autres StreamingResponse passent tels quels.
+- Les octets compressés sont gardés en mémoire, indexés par hash du corps +
+  encodage : une liste de flotte servie depuis le cache n'est compressée
+  qu'une fois. Pas d'index par ETag : deux routes peuvent renvoyer le même
+  ETag (ex: réponse vide ou ETag dérivé des mêmes lignes) pour des corps différents.
+"""
+from __future__ import annotations
+import gzip
+import hashlib
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from prometheus_client import Counter
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.memory_store import get_memory_store
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    zstandard = None
+
+COMPRESSION_RESPONSES = Counter(
+    "http_response_compression_total",
+    "Réponses compressées (hit = octets compressés réutilisés depuis le cache, uncached = corps trop gros pour le cache)",
+    ["encoding", "result"],
+)
+
+COMPRESSIBLE_TYPES = ("application/json", "application/problem+json", "application/javascript", "application/xml", "image/svg+xml")
+# Au-delà, la compression est faite hors de la boucle asyncio
+THREADPOOL_MIN_SIZE = 256 * 1024
+
+_compressed_cache = get_memory_store(
+    "compressed_responses",
+    max_entries=settings.COMPRESSION_CACHE_MAX_ENTRIES,
+    default_ttl=settings.COMPRESSION_CACHE_TTL_SECONDS,
+)
+
+
+def _encoders() -> Dict[str, Callable[[bytes], bytes]]:
+    encoders: Dict[str, Callable[[bytes], bytes]] = {}
+    if zstandard is not None:
+        encoders["zstd"] = lambda data: zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compress(data)
+    if brotli is not None:
+        encoders["br"] = lambda data: brotli.compress(data, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    encoders["gzip"] = lambda data: gzip.compress(data, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+    return encoders
+
+
+ENCODERS = _encoders()  # Ordre = préférence serveur
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Encodage à utiliser : meilleur q-value du client, puis préférence serveur (zstd > br > gzip)."""
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    best: Optional[Tuple[float, int, str]] = None
+    for rank, encoding in enumerate(ENCODERS):
+        q = accepted.get(encoding, wildcard)
+        if q > 0 and (best is None or q > best[0]):
+            best = (q, rank, encoding)
+    return best[2] if best else None
+
+
+def _compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    if content_type == "text/event-stream":
+        return False
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES or content_type.endswith("+json")
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        minimum_size = self.minimum_size if self.minimum_size is not None else settings.COMPRESSION_MIN_SIZE
+        await _CompressingResponder(self.app, encoding, minimum_size)(scope, receive, send)
+
+
+class _CompressingResponder:
+    """Retient http.response.start jusqu'au premier corps pour décider de compresser ou non."""
+
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.on_message)
+
+    async def on_message(self, message: Message) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start = message
+            status = message["status"]
+            if status < 200 or status in (204, 304) or not _compressible(Headers(raw=message["headers"])):
+                await self._pass(message)
+            return
+        if message["type"] != "http.response.body" or self.start is None:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        if message.get("more_body", False) or len(body) < self.minimum_size:
+            # Réponse streamée (NDJSON, SSE, fichiers) ou trop petite : inchangée
+            await self._pass(self.start)
+            await self.send(message)
+            return
+
+        headers = MutableHeaders(raw=self.start["headers"])
+        compressed = await self._compressed(body)
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # Représentation différente du corps d'origine : ETag faible (comme nginx)
+            headers["ETag"] = "W/" + etag
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": compressed})
+
+    async def _pass(self, start: Message) -> None:
+        self.passthrough = True
+        await self.send(start)
+
+    async def _compressed(self, body: bytes) -> bytes:
+        # Gros corps (exports, flotte entière) : rarement identiques, ils évinceraient tout le cache
+        cacheable = len(body) <= settings.COMPRESSION_CACHE_MAX_BODY_BYTES
+        key = f"{self.encoding}:{hashlib.blake2b(body, digest_size=16).hexdigest()}" if cacheable else None
+        if key is not None:
+            cached = _compressed_cache.get(key)
+            if cached is not None:
+                COMPRESSION_RESPONSES.labels(self.encoding, "hit").inc()
+                return cached
+        encoder = ENCODERS[self.encoding]
+        if len(body) >= THREADPOOL_MIN_SIZE:
+            compressed = await run_in_threadpool(encoder, body)
+        else:
+            compressed = encoder(body)
+        if key is not None:
+            _compressed_cache.set(key, compressed)
+        COMPRESSION_RESPONSES.labels(self.encoding, "miss" if key is not None else "uncached").inc()
+        return compressed
@@ -0,0 +1,61 @@
+"""
+ETag et réponses conditionnelles (If-None-Match -> 304 Not Modified).
+
+Les ETags des données en cache sont calculés à l'écriture (compute_etag) et
+stockés avec la donnée : une lecture ne re-hash jamais le corps.
+"""
+from __future__ import annotations
+import hashlib
+from typing import Any, Iterable, Optional
+
+from fastapi import Request, Response
+
+from app.core import json_codec
+
+# Les clients doivent revalider à chaque fois (polling), mais sans retélécharger le corps
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def compute_etag(payload: Any) -> str:
+    """Empreinte (sans guillemets) d'un payload JSON, calculée une fois à l'écriture."""
+    data = payload if isinstance(payload, (bytes, str)) else json_codec.dumps(payload)
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def combine_etags(etags: Iterable[str], *parts: str) -> str:
+    """ETag d'une collection à partir des ETags de ses éléments (sans relire les corps)."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode())
+        h.update(b"\0")
+    for etag in etags:
+        h.update(etag.encode())
+        h.update(b",")
+    return h.hexdigest()
+
+
+def quote(etag: str) -> str:
+    return etag if etag.startswith(('"', 'W/"')) else f'"{etag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparaison faible (RFC 9110) : W/"x" correspond à "x" (ETag affaibli par la compression)."""
+    if not if_none_match:
+        return False
+    etag = quote(etag).removeprefix("W/")
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def not_modified(request: Request, etag: str, cache_control: str = REVALIDATE_CACHE_CONTROL) -> Optional[Response]:
+    """Réponse 304 si le client a déjà cette version, sinon None."""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": quote(etag), "Cache-Control": cache_control})
+    return None
+
+
+def set_etag(response: Response, etag: str, cache_control: str = REVALIDATE_CACHE_CONTROL) -> None:
+    response.headers["ETag"] = quote(etag)
+    response.headers["Cache-Control"] = cache_control
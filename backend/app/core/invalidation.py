@@ -0,0 +1,96 @@
+"""
+Bus d'invalidation inter-replicas pour les caches locaux (en mémoire) d'un processus.
+
+Quand Redis est disponible, chaque invalidation est publiée sur un canal pub/sub
+et appliquée par tous les autres processus. Sans Redis, seul le processus courant
+est invalidé : les caches locaux doivent alors borner leur durée de vie (max-age).
+Si Redis ne répondait pas au premier abonnement (ou si l'écoute s'est arrêtée),
+elle est relancée à la publication suivante ou via ensure_listener() (lectures),
+au plus toutes les REDIS_RECONNECT_SECONDS.
+"""
+from __future__ import annotations
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from app.core import json_codec
+from app.core.redis_client import get_redis
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+
+
+class InvalidationBus:
+    def __init__(self, channel: str = CHANNEL):
+        self.channel = channel
+        self.origin = uuid.uuid4().hex  # Ignorer nos propres messages
+        self._handlers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._listener = None
+        self._retry_at = 0.0
+
+    def subscribe(self, namespace: str, handler: Callable[[str], None]) -> None:
+        with self._lock:
+            # Réabonnement (écoute pas encore démarrée) : le handler n'est enregistré qu'une fois
+            if handler not in self._handlers[namespace]:
+                self._handlers[namespace].append(handler)
+            self._ensure_listener()
+
+    def publish(self, namespace: str, key: str) -> None:
+        self.ensure_listener()
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.publish(self.channel, json_codec.dumps({"origin": self.origin, "ns": namespace, "key": key}))
+        except Exception as exc:
+            logger.debug("Publication d'invalidation impossible (%s:%s): %s", namespace, key, exc)
+
+    @property
+    def distributed(self) -> bool:
+        return self._listener is not None and self._listener.is_alive()
+
+    def ensure_listener(self) -> None:
+        """Relance l'écoute si des handlers attendent et qu'elle ne tourne pas (sans attente si c'est le cas)."""
+        if self.distributed or not self._handlers or time.monotonic() < self._retry_at:
+            return
+        with self._lock:
+            self._ensure_listener()
+
+    def _ensure_listener(self) -> None:
+        # Appelé avec self._lock acquis
+        if self.distributed:
+            return
+        self._listener = None
+        client = get_redis()
+        if client is None:
+            self._retry_at = time.monotonic() + settings.REDIS_RECONNECT_SECONDS
+            return
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_message})
+            self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        except Exception as exc:
+            self._retry_at = time.monotonic() + settings.REDIS_RECONNECT_SECONDS
+            logger.warning("Abonnement au bus d'invalidation impossible: %s", exc)
+
+    def _on_message(self, message) -> None:
+        try:
+            payload = json_codec.loads(message["data"])
+        except Exception:
+            return
+        if payload.get("origin") == self.origin:
+            return
+        for handler in list(self._handlers.get(payload.get("ns"), ())):
+            try:
+                handler(payload.get("key"))
+            except Exception:
+                pass
+
+
+invalidation_bus = InvalidationBus()
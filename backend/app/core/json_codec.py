@@ -0,0 +1,92 @@
+"""
+Codec JSON rapide, partagé par les réponses API, les stores de tokens et les messages VCP.
+
+orjson est utilisé s'il est installé (JSON_CODEC=auto|orjson), sinon la
+bibliothèque standard (JSON_CODEC=stdlib ou orjson absent). Dans les deux cas :
+- sortie compacte, UTF-8, clés non-str acceptées ;
+- les types inconnus sont sérialisés avec str() (comme json.dumps(default=str)).
+"""
+from __future__ import annotations
+import json
+import logging
+from typing import Any, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    orjson = None
+
+
+def _use_orjson() -> bool:
+    if settings.JSON_CODEC == "stdlib":
+        return False
+    if orjson is None:
+        if settings.JSON_CODEC == "orjson":
+            logger.warning("JSON_CODEC=orjson mais orjson n'est pas installé : utilisation de json (stdlib)")
+        return False
+    return True
+
+
+if _use_orjson():
+    CODEC_NAME = "orjson"
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str, option=_OPTIONS)
+
+    def dumps_str(obj: Any) -> str:
+        return orjson.dumps(obj, default=str, option=_OPTIONS).decode()
+
+    loads = orjson.loads
+else:
+    CODEC_NAME = "stdlib"
+
+    def dumps_str(obj: Any) -> str:
+        return json.dumps(obj, default=str, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj: Any) -> bytes:
+        return dumps_str(obj).encode()
+
+    def loads(data: bytes | bytearray | memoryview | str) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+dumps.__doc__ = "Sérialise en JSON compact (bytes UTF-8)."
+dumps_str.__doc__ = "Sérialise en JSON compact (str), ex: frames texte websocket."
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Réponse JSON par défaut de l'application (voir create_app).
+
+    Seul l'encodage final passe par le codec : pour une valeur retournée par une
+    route, FastAPI fait d'abord jsonable_encoder (parcours complet, copie des
+    dicts/listes). Les routes à gros volume rendent directement json_response().
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+_SKIPPED_HEADERS = {b"content-length", b"content-type"}
+
+
+def json_response(content: Any, headers_from: Optional[Response] = None, status_code: int = 200) -> FastJSONResponse:
+    """
+    Réponse sérialisée directement par le codec, sans jsonable_encoder : à réserver aux
+    contenus déjà en types JSON (dicts/listes lus dans le cache, réponses Tesla).
+    `headers_from` : Response injectée dans la route, dont les en-têtes (ETag...) sont repris.
+    """
+    response = FastJSONResponse(content, status_code=status_code)
+    if headers_from is not None:
+        response.raw_headers.extend((k, v) for k, v in headers_from.raw_headers if k not in _SKIPPED_HEADERS)
+    return response
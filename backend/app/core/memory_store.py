@@ -0,0 +1,193 @@
+"""
+Store clé/valeur en mémoire, borné (LRU) et avec expiration (TTL).
+Utilisé comme fallback mémoire par TokenStore, SupabaseTokenStore et TPStore
+pour que les workers longue durée gardent une empreinte mémoire stable.
+"""
+from __future__ import annotations
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+from app.core.settings import settings
+
+_MISSING = object()
+
+MEMORY_STORE_SIZE = Gauge(
+    "memory_store_entries",
+    "Nombre d'entrées présentes dans le store mémoire",
+    ["store"],
+)
+MEMORY_STORE_EVICTIONS = Counter(
+    "memory_store_evictions_total",
+    "Entrées retirées du store mémoire (lru = capacité atteinte, expired = TTL dépassé)",
+    ["store", "reason"],
+)
+
+
+class TTLMemoryStore:
+    """
+    Dictionnaire thread-safe avec expiration par clé et éviction LRU.
+
+    - Les clés expirées sont supprimées à la lecture (lazy) et par un balayage
+      périodique en arrière-plan (voir `_Sweeper`).
+    - Quand `max_entries` est atteint, la clé la moins récemment utilisée est évincée.
+    """
+
+    def __init__(self, name: str, max_entries: int | None = None, default_ttl: int | None = None):
+        self.name = name
+        self.max_entries = max_entries or settings.MEMORY_STORE_MAX_ENTRIES
+        self.default_ttl = default_ttl or settings.MEMORY_STORE_DEFAULT_TTL_SECONDS
+        self._data: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        _sweeper.register(self)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._expire(key)
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: int | float | None = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + max(0, ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._evictions += 1
+                MEMORY_STORE_EVICTIONS.labels(self.name, "lru").inc()
+            MEMORY_STORE_SIZE.labels(self.name).set(len(self._data))
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            MEMORY_STORE_SIZE.labels(self.name).set(len(self._data))
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._expirations += 1
+                MEMORY_STORE_EVICTIONS.labels(self.name, "expired").inc()
+                return default
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            MEMORY_STORE_SIZE.labels(self.name).set(len(self._data))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            MEMORY_STORE_SIZE.labels(self.name).set(0)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def items(self) -> list[tuple[str, Any]]:
+        """Instantané des entrées non expirées (ne modifie pas l'ordre LRU)."""
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (v, exp) in self._data.items() if exp > now]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def sweep(self) -> int:
+        """Supprime toutes les entrées expirées. Retourne le nombre d'entrées retirées."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._data.items() if exp <= now]
+            for key in expired:
+                self._expire(key)
+            MEMORY_STORE_SIZE.labels(self.name).set(len(self._data))
+            return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+    def _expire(self, key: str) -> None:
+        # Appelé avec self._lock déjà acquis
+        self._data.pop(key, None)
+        self._expirations += 1
+        MEMORY_STORE_EVICTIONS.labels(self.name, "expired").inc()
+        MEMORY_STORE_SIZE.labels(self.name).set(len(self._data))
+
+
+class _Sweeper:
+    """Thread daemon unique qui balaie périodiquement tous les stores mémoire enregistrés."""
+
+    def __init__(self):
+        self._stores: "weakref.WeakSet[TTLMemoryStore]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, store: TTLMemoryStore) -> None:
+        with self._lock:
+            self._stores.add(store)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="memory-store-sweeper", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(settings.MEMORY_STORE_SWEEP_INTERVAL_SECONDS)
+            with self._lock:
+                stores = list(self._stores)
+            for store in stores:
+                try:
+                    store.sweep()
+                except Exception:
+                    pass
+
+
+_sweeper = _Sweeper()
+_named_stores: Dict[str, TTLMemoryStore] = {}
+_named_lock = threading.Lock()
+
+
+def get_memory_store(name: str, max_entries: int | None = None, default_ttl: int | None = None) -> TTLMemoryStore:
+    """
+    Retourne le store mémoire partagé (singleton par processus) portant ce nom.
+    Les stores de tokens sont instanciés à chaque requête : partager le fallback
+    évite de perdre son contenu entre deux requêtes.
+    """
+    with _named_lock:
+        store = _named_stores.get(name)
+        if store is None:
+            store = TTLMemoryStore(name, max_entries=max_entries, default_ttl=default_ttl)
+            _named_stores[name] = store
+        return store
+
+
+def memory_stores_stats() -> Dict[str, Dict[str, int]]:
+    """Statistiques (taille, hits, évictions...) de tous les stores mémoire nommés."""
+    with _named_lock:
+        stores = dict(_named_stores)
+    return {name: store.stats() for name, store in stores.items()}
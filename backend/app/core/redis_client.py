@@ -0,0 +1,38 @@
+"""
+Client Redis partagé (un par processus).
+Retourne None si REDIS_URL est en mode mémoire ("memory://") ou si Redis ne répond pas,
+pour que les appelants puissent basculer sur leur fallback. Après un échec de
+connexion, une nouvelle tentative a lieu au plus toutes les REDIS_RECONNECT_SECONDS.
+"""
+from __future__ import annotations
+import threading
+import time
+from typing import Optional
+
+import redis
+
+from app.core.settings import settings
+
+_client: Optional[redis.Redis] = None
+_resolved_url: Optional[str] = None
+_failed_at: float = 0.0
+_lock = threading.Lock()
+
+
+def get_redis() -> Optional[redis.Redis]:
+    global _client, _resolved_url, _failed_at
+    url = settings.REDIS_URL
+    if not url or url.startswith("memory://"):
+        return None
+    with _lock:
+        if _resolved_url == url and (_client is not None or time.monotonic() - _failed_at < settings.REDIS_RECONNECT_SECONDS):
+            return _client
+        try:
+            client = redis.from_url(url, decode_responses=True)
+            client.ping()
+        except Exception:
+            # Redis indisponible (ex: pas encore démarré) : fallback, puis nouvel essai plus tard
+            client = None
+            _failed_at = time.monotonic()
+        _client, _resolved_url = client, url
+        return _client
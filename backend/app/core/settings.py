@@ -64,6 +64,17 @@ class Settings(BaseSettings):
     APP_NAME: str = "tesla-fleet-api"
     API_PREFIX: str = "/api"
     ENV: str = "dev"
+    # Codec JSON (réponses, stores, messages VCP) : "auto" (orjson si installé), "orjson" ou "stdlib"
+    JSON_CODEC: str = "auto"
+    # Compression des réponses (zstd/brotli si installés, sinon gzip), hors flux NDJSON/SSE
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # Octets : en dessous, réponse non compressée
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_CACHE_MAX_ENTRIES: int = 256  # Réponses compressées gardées en mémoire (clé = encodage + hash du corps)
+    COMPRESSION_CACHE_TTL_SECONDS: int = 300
+    COMPRESSION_CACHE_MAX_BODY_BYTES: int = 1024 * 1024  # Corps plus gros : compressés sans passer par le cache
 
     # Tesla Auth URLs - IMPORTANT: Séparer authorize et token
     # Authorize (login + consent) : https://auth.tesla.com/oauth2/v3/authorize
@@ -81,6 +92,11 @@ class Settings(BaseSettings):
 
     TESLA_VEHICLES_PATH: str = "/api/1/vehicles"
 
+    # Sessions VCP (websocket /vehicle-commands) réutilisées entre commandes
+    VCP_SESSION_POOL_ENABLED: bool = True
+    VCP_SESSION_IDLE_SECONDS: int = 60  # Fermeture d'une session sans commande pendant ce délai
+    VCP_SESSION_MAX_SESSIONS: int = 200
+
     # Third-party (authorization_code)
     TP_CLIENT_ID: str | None = None
     TP_CLIENT_SECRET: str | None = None
@@ -89,6 +105,7 @@ class Settings(BaseSettings):
 
     DATABASE_URL: str = "postgresql://postgres:postgres@db:5432/postgres"
     REDIS_URL: str = "memory://dev"
+    REDIS_RECONNECT_SECONDS: int = 30  # Après un échec de connexion, nouvel essai au plus à ce rythme
     
     # Supabase Configuration (alternative à Redis)
     SUPABASE_URL: str | None = None
@@ -107,7 +124,25 @@ class Settings(BaseSettings):
     SUPABASE_ANON_KEY: str | None = None  # Anon Key (pour authentification utilisateur - recommandé)
     SUPABASE_SERVICE_ROLE_KEY: str | None = None  # Service Role Key (pour opérations admin - recommandé)
     
+    # Vérification des JWT Supabase dans require_supabase_user :
+    # - "local" : signature/expiration vérifiées localement uniquement (JWKS ou SUPABASE_JWT_SECRET)
+    # - "local_with_fallback" : local, puis appel /auth/v1/user si la vérification locale est impossible
+    # - "remote" : appel /auth/v1/user à chaque requête (ancien comportement)
+    SUPABASE_JWT_VERIFICATION: str = "local_with_fallback"
+    SUPABASE_JWT_SECRET: str | None = None  # Secret HS256 (projets Supabase sans clés asymétriques)
+    SUPABASE_JWT_AUDIENCE: str = "authenticated"
+    SUPABASE_JWT_ISSUER: str | None = None  # Défaut: {SUPABASE_URL}/auth/v1
+    SUPABASE_JWT_VERIFY_ISSUER: bool = True
+    SUPABASE_JWT_LEEWAY_SECONDS: int = 10
+    SUPABASE_JWKS_CACHE_SECONDS: int = 600
+    SUPABASE_JWKS_MIN_REFRESH_SECONDS: int = 30
+    # Cache des principals vérifiés (clé = hash du bearer token), borné par l'exp du JWT
+    SUPABASE_PRINCIPAL_CACHE_ENABLED: bool = True
+    SUPABASE_PRINCIPAL_CACHE_MAX_AGE_SECONDS: int = 60
+    SUPABASE_PRINCIPAL_CACHE_MAX_ENTRIES: int = 5000
+
     SUPABASE_TOKENS_TABLE: str = "tokens"  # Nom de la table pour les tokens
+    SUPABASE_PENDING_LINKS_TABLE: str = "pending_token_links"  # Tokens Tesla en attente de liaison (migration 002)
     
     # Choix du store: "redis", "supabase", ou "memory"
     TOKEN_STORE_TYPE: str = "memory"  # Par défaut: mémoire (dev), changez en "supabase" pour utiliser Supabase
@@ -133,6 +168,15 @@ class Settings(BaseSettings):
 
     PUBLIC_KEY_URL: str = "https://localhost/.well-known/appspecific/com.tesla.3p.public-key.pem"
     PRIVATE_KEY_PATH: str = "/run/secrets/tesla_private_key.pem"
+    PUBLIC_KEY_CACHE_MAX_AGE_SECONDS: int = 3600  # Cache-Control de /.well-known/.../public-key.pem
+    PUBLIC_KEY_RECHECK_SECONDS: int = 30  # Vérification du mtime de la clé source
+
+    # Sessions véhicule pour les commandes signées (sans secret, voir app/keys/keypair_manager.py)
+    # Fichier de sessions (ex: /var/lib/tesla-fleet/vehicle_sessions.json), hors de l'arborescence du code ;
+    # None = sessions en mémoire (compteurs partagés via Redis si disponible)
+    VEHICLE_SESSION_STORE_PATH: str | None = None
+    VEHICLE_SESSION_COUNTER_RESERVE: int = 64  # Compteurs persistés d'avance (une écriture par bloc)
+    VEHICLE_COMMAND_LIFETIME_SECONDS: int = 30
     
     # Frontend URL pour les redirections OAuth
     FRONTEND_URL: str = "http://localhost:5173"
@@ -149,9 +193,90 @@ class Settings(BaseSettings):
     HTTP_TIMEOUT_SECONDS: int = 15
     RETRY_MAX: int = 3
 
-    def tesla_audience_for(self, region: str | None = None) -> str:
+    # Commandes groupées (POST /fleet/direct/batch/command)
+    BATCH_COMMAND_MAX_TARGETS: int = 500
+    BATCH_COMMAND_CONCURRENCY: int = 20  # Commandes simultanées, toutes régions confondues
+    BATCH_COMMAND_MAX_PER_REGION: int = 10  # Une région ne peut pas occuper toute la concurrence
+    BATCH_COMMAND_TIMEOUT_SECONDS: float = 30.0
+    VEHICLE_ID_CACHE_TTL_SECONDS: int = 86400  # id Fleet API -> vehicle_id interne (stable)
+
+    # Lecture groupée (POST /fleet/sync/batch/read) : cache en une requête, manques relus en parallèle
+    BATCH_READ_MAX_ITEMS: int = 200
+    BATCH_READ_CONCURRENCY: int = 10
+
+    # Export NDJSON de la flotte (GET /fleet/supabase/export), lu par blocs depuis le cache
+    EXPORT_CHUNK_SIZE: int = 500
+
+    # Idempotency-Key sur les commandes véhicule (résultat rejoué au lieu d'une nouvelle exécution)
+    IDEMPOTENCY_TTL_SECONDS: int = 86400  # Durée de conservation du résultat
+    IDEMPOTENCY_PENDING_TTL_SECONDS: int = 120  # Réservation, prolongée pendant l'exécution ; reprise après un crash
+    IDEMPOTENCY_WAIT_SECONDS: float = 90.0  # Une relance attend la première exécution, puis 409
+    IDEMPOTENCY_POLL_SECONDS: float = 0.25
+
+    # Cache des GET du proxy générique (règles par chemin, voir app/services/proxy_cache.py)
+    PROXY_CACHE_ENABLED: bool = True
+    PROXY_CACHE_RULES: list[dict] | None = None  # JSON ; None = règles par défaut (DEFAULT_RULES)
+    PROXY_CACHE_MAX_ENTRIES: int = 5000  # Fallback mémoire (sans Redis)
+    PROXY_CACHE_MAX_BODY_BYTES: int = 512 * 1024
+
+    # Flux SSE d'événements véhicule (GET /fleet/events/stream)
+    VEHICLE_EVENTS_BUFFER_SIZE: int = 200  # Derniers événements gardés par compte (reprise Last-Event-ID)
+    VEHICLE_EVENTS_BUFFER_TTL_SECONDS: int = 3600
+    VEHICLE_EVENTS_MAX_ACCOUNTS: int = 1000
+    VEHICLE_EVENTS_CLIENT_QUEUE_SIZE: int = 100  # Au-delà, le client lent est déconnecté
+    VEHICLE_EVENTS_HEARTBEAT_SECONDS: float = 15.0
+    STREAM_TICKET_TTL_SECONDS: int = 60  # Ticket ?ticket= d'EventSource (voir app/auth/stream_tickets.py)
+
+    # Réveil des véhicules avant commande (un seul wake en cours par véhicule)
+    WAKE_BEFORE_COMMANDS: bool = True
+    WAKE_TIMEOUT_SECONDS: float = 60.0
+    WAKE_POLL_INITIAL_SECONDS: float = 1.0  # Puis x2 à chaque interrogation
+    WAKE_POLL_MAX_SECONDS: float = 8.0
+    VEHICLE_STATE_CACHE_SECONDS: int = 30  # Un état "online" observé reste fiable ce délai
+
+    # Jobs asynchrones (rq si Redis, sinon tâche de fond dans le processus API)
+    JOBS_QUEUE_NAME: str = "tesla-jobs"
+    JOBS_TIMEOUT_SECONDS: int = 180
+    JOBS_RESULT_TTL_SECONDS: int = 3600
+    JOBS_STREAM_POLL_SECONDS: float = 0.5
+
+    # Fallbacks mémoire (TokenStore, SupabaseTokenStore, TPStore) : bornés + TTL
+    MEMORY_STORE_MAX_ENTRIES: int = 10000
+    MEMORY_STORE_DEFAULT_TTL_SECONDS: int = 3600
+    MEMORY_STORE_SWEEP_INTERVAL_SECONDS: int = 60
+    PKCE_VERIFIER_TTL_SECONDS: int = 600  # Les codes OAuth expirent rapidement
+
+    # Tokens Tesla en attente de liaison après le callback OAuth
+    PENDING_LINK_TTL_SECONDS: int = 900
+    PENDING_LINK_AUTO_LINK_WINDOW_SECONDS: int = 600  # Liaison automatique des liens créés dans les 10 dernières minutes
+    PENDING_LINK_NEGATIVE_CACHE_SECONDS: int = 10
+
+    # Cache local (read-through) devant SupabaseTokenStore.get
+    # Sans Redis (pas d'invalidation inter-replicas), le max-age borne la durée de péremption
+    TOKEN_LOCAL_CACHE_ENABLED: bool = True
+    TOKEN_LOCAL_CACHE_MAX_AGE_SECONDS: int = 60
+
+    # Refresh proactif des tokens (utilisateur + partenaire) en arrière-plan
+    TOKEN_REFRESH_ENABLED: bool = True
+    TOKEN_REFRESH_LEAD_SECONDS: int = 300  # Rafraîchir ~5 min avant expiration
+    TOKEN_REFRESH_JITTER_SECONDS: int = 120  # Étale les refresh entre workers/replicas
+    TOKEN_REFRESH_RETRY_SECONDS: int = 30
+    TOKEN_REFRESH_MAX_RETRY_SECONDS: int = 900  # Délai exponentiel plafonné entre deux échecs
+    TOKEN_REFRESH_GIVE_UP_AFTER_SECONDS: int = 86400  # Token expiré depuis plus longtemps : plus suivi
+    TOKEN_REFRESH_POLL_SECONDS: int = 60
+    # Verrou distribué du refresh d'un user token (refresh_token rotatif : un seul worker/replica)
+    TOKEN_REFRESH_LOCK_TTL_SECONDS: int = 30
+    TOKEN_REFRESH_LOCK_WAIT_SECONDS: int = 20
+    TOKEN_REFRESH_LOCK_POLL_SECONDS: float = 0.25
+
+    # Single-flight inter-processus pour l'obtention du token partenaire
+    PARTNER_TOKEN_LOCK_TTL_SECONDS: int = 30
+    PARTNER_TOKEN_LOCK_WAIT_SECONDS: int = 20
+    PARTNER_TOKEN_LOCK_POLL_SECONDS: float = 0.25
+
+    def tesla_region_for(self, region: str | None = None) -> str:
         """
-        Retourne l'audience Fleet adaptée à la région souhaitée.
+        Normalise une région en "eu" ou "na".
         - "eu" pour Europe/Middle East/Africa
         - "na" pour North America/Asia Pacific
         Toute autre valeur retombe sur EU par défaut.
@@ -159,13 +284,18 @@ class Settings(BaseSettings):
         reg = (region or self.TESLA_REGION or "").strip().lower()
 
         if reg in {"na", "northamerica", "northamericaasiapacific", "north_america", "northamericaapac"}:
-            return self.TESLA_AUDIENCE_NA
-
-        # Valeurs acceptées pour l'Europe
-        if reg in {"eu", "emea", "europe", "europe-middle-east-africa"}:
-            return self.TESLA_AUDIENCE_EU
+            return "na"
 
+        # Valeurs acceptées pour l'Europe : "eu", "emea", "europe", "europe-middle-east-africa"
         # Fallback sûr : EU
+        return "eu"
+
+    def tesla_audience_for(self, region: str | None = None) -> str:
+        """
+        Retourne l'audience Fleet adaptée à la région souhaitée (voir tesla_region_for).
+        """
+        if self.tesla_region_for(region) == "na":
+            return self.TESLA_AUDIENCE_NA
         return self.TESLA_AUDIENCE_EU
 
 # Logger les fichiers chargés au démarrage
@@ -0,0 +1,35 @@
+"""
+Formats de réponse en flux (NDJSON, Server-Sent Events) partagés par les endpoints streamés.
+"""
+from __future__ import annotations
+from typing import Any, Optional
+
+from app.core import json_codec
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# Empêche les proxys (nginx) de bufferiser le flux
+STREAMING_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def ndjson_line(obj: Any) -> bytes:
+    return json_codec.dumps(obj) + b"\n"
+
+
+def sse_event(data: Any, event: Optional[str] = None, event_id: Optional[str] = None) -> bytes:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    payload = data if isinstance(data, str) else json_codec.dumps_str(data)
+    lines.extend(f"data: {line}" for line in payload.splitlines() or [""])
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def wants_sse(accept: Optional[str], fmt: Optional[str] = None) -> bool:
+    """SSE si demandé explicitement (?format=sse) ou via Accept: text/event-stream."""
+    if fmt:
+        return fmt == "sse"
+    return bool(accept and SSE_MEDIA_TYPE in accept)
@@ -0,0 +1,392 @@
+"""
+Gestion de la clé privée et des sessions véhicule pour les commandes signées.
+
+- La clé privée (EC P-256, PRIVATE_KEY_PATH) est chargée une seule fois par processus.
+- Pour chaque (VIN, domaine), le véhicule fournit une SessionInfo (clé publique,
+  epoch, compteur, horloge). On en dérive la clé de session par ECDH et on garde
+  compteur + décalage d'horloge : une commande signée part ensuite sans aller-retour.
+- Compteurs réservés par blocs (VEHICLE_SESSION_COUNTER_RESERVE), jamais réutilisés
+  entre processus : avec Redis, chaque bloc est pris par INCRBY atomique sur
+  (VIN, domaine, epoch) ; sinon dans le fichier de sessions sous verrou (flock,
+  msvcrt sous Windows), ce qui couvre les workers d'une même machine. Sans Redis
+  ni fichier, les sessions restent en mémoire du processus (un seul worker).
+- Persistance optionnelle (VEHICLE_SESSION_STORE_PATH, désactivée par défaut ;
+  à placer hors de l'arborescence du code) sans aucun secret : la clé de session
+  est re-dérivée au chargement depuis la clé publique du véhicule. Chaque écriture
+  fusionne, sous verrou, avec le contenu du fichier : les sessions des autres
+  processus (ou non relues, ex: clé privée indisponible) ne sont pas perdues.
+- Une commande rejetée invalide la session (ou la resynchronise si le véhicule a
+  renvoyé une nouvelle SessionInfo).
+"""
+from __future__ import annotations
+import hashlib
+import hmac
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from app.core.redis_client import get_redis
+from app.core.settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou de fichier via msvcrt
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Domaines du protocole de commandes véhicule
+DOMAIN_VCSEC = 2  # Sécurité véhicule (verrouillage, coffre...)
+DOMAIN_INFOTAINMENT = 3  # Charge, climatisation...
+
+# Tags des métadonnées signées (TLV)
+TAG_SIGNATURE_TYPE = 0
+TAG_DOMAIN = 1
+TAG_PERSONALIZATION = 2
+TAG_EPOCH = 3
+TAG_EXPIRES_AT = 4
+TAG_COUNTER = 5
+TAG_END = 0xFF
+SIGNATURE_TYPE_HMAC_PERSONALIZED = 8
+
+COUNTER_KEY_PREFIX = "vehicle_session_counter:"
+COUNTER_KEY_TTL_SECONDS = 30 * 86400
+# Bloc suivant à partir de max(compteur stocké, plancher local) : atomique côté Redis
+_RESERVE_SCRIPT = """
+local current = tonumber(redis.call("get", KEYS[1]) or "0")
+local floor = tonumber(ARGV[1])
+if current < floor then current = floor end
+current = current + tonumber(ARGV[2])
+redis.call("set", KEYS[1], current, "EX", ARGV[3])
+return current
+"""
+
+
+class KeypairError(RuntimeError):
+    pass
+
+
+@dataclass
+class SessionInfo:
+    """Informations de session renvoyées par le véhicule."""
+    public_key: bytes  # Point P-256 non compressé (65 octets)
+    epoch: bytes
+    counter: int
+    clock_time: int  # Secondes depuis le début de l'epoch (horloge véhicule)
+
+
+@dataclass
+class SignedCommand:
+    epoch: bytes
+    counter: int
+    expires_at: int
+    tag: bytes
+
+
+@dataclass
+class VehicleSession:
+    vin: str
+    domain: int
+    vehicle_public_key: bytes
+    epoch: bytes
+    counter: int
+    clock_offset: float  # time.time() - clock_time au moment de la synchronisation
+    counter_reserved: int  # Fin du bloc de compteurs réservé par ce processus
+    hmac_key: bytes = b""
+    installed_at: float = 0.0  # Entre deux processus, la SessionInfo la plus récente l'emporte
+
+    def vehicle_clock(self) -> int:
+        return int(time.time() - self.clock_offset)
+
+    def to_json(self) -> dict:
+        # Jamais de clé dérivée sur disque
+        return {
+            "vin": self.vin,
+            "domain": self.domain,
+            "vehicle_public_key": self.vehicle_public_key.hex(),
+            "epoch": self.epoch.hex(),
+            "counter": self.counter_reserved,
+            "clock_offset": self.clock_offset,
+            "installed_at": self.installed_at,
+        }
+
+
+def _tlv(tag: int, value: bytes) -> bytes:
+    if len(value) > 255:
+        raise KeypairError("Valeur de métadonnée trop longue")
+    return bytes([tag, len(value)]) + value
+
+
+def signature_metadata(vin: str, domain: int, epoch: bytes, expires_at: int, counter: int) -> bytes:
+    """Métadonnées authentifiées avec la commande (ordre des tags croissant, terminées par 0xFF)."""
+    return b"".join([
+        _tlv(TAG_SIGNATURE_TYPE, bytes([SIGNATURE_TYPE_HMAC_PERSONALIZED])),
+        _tlv(TAG_DOMAIN, bytes([domain])),
+        _tlv(TAG_PERSONALIZATION, vin.encode()),
+        _tlv(TAG_EPOCH, epoch),
+        _tlv(TAG_EXPIRES_AT, struct.pack(">I", expires_at)),
+        _tlv(TAG_COUNTER, struct.pack(">I", counter)),
+    ]) + bytes([TAG_END])
+
+
+def derive_hmac_key(private_key: ec.EllipticCurvePrivateKey, peer_public_key: bytes) -> bytes:
+    """Clé de session = SHA1(secret ECDH)[:16], puis sous-clé HMAC dédiée aux commandes."""
+    peer = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), peer_public_key)
+    shared = private_key.exchange(ec.ECDH(), peer)
+    session_key = hashlib.sha1(shared).digest()[:16]
+    return hmac.new(session_key, b"authenticated command", hashlib.sha256).digest()
+
+
+class KeypairManager:
+    def __init__(self, private_key_path: Optional[str] = None, store_path: Optional[str] = None):
+        self._private_key_path = private_key_path
+        self._store_path = store_path
+        self._private_key: Optional[ec.EllipticCurvePrivateKey] = None
+        self._sessions: Dict[Tuple[str, int], VehicleSession] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # ---- Clé privée ----
+
+    @property
+    def private_key(self) -> ec.EllipticCurvePrivateKey:
+        if self._private_key is None:
+            with self._lock:
+                if self._private_key is None:
+                    self._private_key = self._load_private_key()
+        return self._private_key
+
+    def _load_private_key(self) -> ec.EllipticCurvePrivateKey:
+        path = Path(self._private_key_path or settings.PRIVATE_KEY_PATH)
+        try:
+            key = serialization.load_pem_private_key(path.read_bytes(), password=None)
+        except FileNotFoundError as exc:
+            raise KeypairError(f"Clé privée introuvable: {path}") from exc
+        if not isinstance(key, ec.EllipticCurvePrivateKey) or not isinstance(key.curve, ec.SECP256R1):
+            raise KeypairError("Les commandes signées nécessitent une clé EC P-256 (prime256v1)")
+        logger.info("Clé privée chargée depuis %s", path)
+        return key
+
+    def public_key_bytes(self) -> bytes:
+        """Clé publique au format point non compressé (envoyée au véhicule)."""
+        return self.private_key.public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        )
+
+    # ---- Sessions ----
+
+    def session(self, vin: str, domain: int) -> Optional[VehicleSession]:
+        self._ensure_loaded()
+        return self._sessions.get((vin, domain))
+
+    def has_session(self, vin: str, domain: int) -> bool:
+        return self.session(vin, domain) is not None
+
+    def update_session(self, vin: str, domain: int, info: SessionInfo) -> VehicleSession:
+        """Installe (ou remplace) la session à partir de la SessionInfo du véhicule."""
+        self._ensure_loaded()
+        hmac_key = derive_hmac_key(self.private_key, info.public_key)
+        with self._lock:
+            session = VehicleSession(
+                vin=vin,
+                domain=domain,
+                vehicle_public_key=info.public_key,
+                epoch=info.epoch,
+                counter=info.counter,
+                clock_offset=time.time() - info.clock_time,
+                counter_reserved=info.counter,
+                hmac_key=hmac_key,
+                installed_at=time.time(),
+            )
+            self._sessions[(vin, domain)] = session
+            self._reserve_counter(session)
+            return session
+
+    def sign(self, vin: str, domain: int, payload: bytes, lifetime: Optional[int] = None) -> SignedCommand:
+        """Signe une commande avec la session en cache (KeypairError si aucune session)."""
+        self._ensure_loaded()
+        with self._lock:
+            session = self._sessions.get((vin, domain))
+            if session is None:
+                raise KeypairError(f"Aucune session pour {vin[-6:]} (domaine {domain})")
+            if session.counter >= session.counter_reserved:
+                self._reserve_counter(session)
+            session.counter += 1
+            counter = session.counter
+            expires_at = session.vehicle_clock() + (lifetime or settings.VEHICLE_COMMAND_LIFETIME_SECONDS)
+            metadata = signature_metadata(vin, domain, session.epoch, expires_at, counter)
+            tag = hmac.new(session.hmac_key, metadata + payload, hashlib.sha256).digest()
+            return SignedCommand(epoch=session.epoch, counter=counter, expires_at=expires_at, tag=tag)
+
+    def handle_rejection(self, vin: str, domain: int, info: Optional[SessionInfo] = None) -> Optional[VehicleSession]:
+        """
+        Commande refusée (compteur, epoch ou horloge désynchronisés).
+        Avec la SessionInfo renvoyée par le véhicule, la session est resynchronisée
+        directement ; sinon elle est invalidée et un nouveau handshake sera nécessaire.
+        """
+        if info is not None:
+            return self.update_session(vin, domain, info)
+        self.invalidate(vin, domain)
+        return None
+
+    def invalidate(self, vin: str, domain: Optional[int] = None) -> None:
+        self._ensure_loaded()
+        with self._lock:
+            keys = [k for k in self._sessions if k[0] == vin and (domain is None or k[1] == domain)]
+            for key in keys:
+                del self._sessions[key]
+            if keys:
+                self._persist(removed=keys)
+
+    # ---- Persistance ----
+
+    def _path(self) -> Optional[Path]:
+        path = self._store_path or settings.VEHICLE_SESSION_STORE_PATH
+        return Path(path) if path else None
+
+    def _reserve_counter(self, session: VehicleSession) -> None:
+        """
+        Réserve le bloc de compteurs suivant (appelé avec self._lock) : après l'appel,
+        les compteurs ]session.counter, session.counter_reserved] sont à ce processus seul.
+        """
+        reserve = settings.VEHICLE_SESSION_COUNTER_RESERVE
+        client = get_redis()
+        if client is not None:
+            key = f"{COUNTER_KEY_PREFIX}{session.vin}:{session.domain}:{session.epoch.hex()}"
+            try:
+                end = int(client.eval(_RESERVE_SCRIPT, 1, key, session.counter, reserve, COUNTER_KEY_TTL_SECONDS))
+            except Exception as exc:
+                # Sans réservation partagée, un autre processus pourrait réutiliser nos compteurs
+                raise KeypairError(f"Réservation de compteurs impossible: {exc}") from exc
+            session.counter = end - reserve
+            session.counter_reserved = end
+            self._persist()
+            return
+
+        def reserve_from(stored: Dict[Tuple[str, int], dict]) -> None:
+            entry = stored.get((session.vin, session.domain))
+            if entry and entry.get("epoch") == session.epoch.hex():
+                # Bloc déjà pris par un autre processus (ou avant un redémarrage) : on repart après
+                session.counter = max(session.counter, int(entry.get("counter", 0)))
+            session.counter_reserved = session.counter + reserve
+
+        if self._path() is None:
+            reserve_from({})
+            return
+        self._persist(before_merge=reserve_from)
+
+    def _persist(
+        self,
+        removed: Iterable[Tuple[str, int]] = (),
+        before_merge: Optional[Callable[[Dict[Tuple[str, int], dict]], None]] = None,
+    ) -> None:
+        """Fusionne nos sessions dans le fichier, sous verrou exclusif (lecture + écriture atomique)."""
+        path = self._path()
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(f"{path}.lock", "a") as lock_file:
+                _lock_file(lock_file)
+                try:
+                    stored = {(e["vin"], int(e["domain"])): e for e in _read_entries(path)}
+                    if before_merge is not None:
+                        before_merge(stored)
+                    for key in removed:
+                        stored.pop(key, None)
+                    for key, session in self._sessions.items():
+                        entry = session.to_json()
+                        current = stored.get(key)
+                        if current and current.get("epoch") == entry["epoch"]:
+                            entry["counter"] = max(entry["counter"], int(current.get("counter", 0)))
+                        elif current and float(current.get("installed_at", 0)) > session.installed_at:
+                            # Un autre processus a installé une SessionInfo plus récente
+                            continue
+                        stored[key] = entry
+                    _write_entries(path, list(stored.values()))
+                finally:
+                    _unlock_file(lock_file)
+        except OSError as exc:
+            logger.warning("Persistance des sessions véhicule impossible (%s): %s", path, exc)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            path = self._path()
+            if path is None or not path.exists():
+                return
+            for entry in _read_entries(path):
+                try:
+                    public_key = bytes.fromhex(entry["vehicle_public_key"])
+                    session = VehicleSession(
+                        vin=entry["vin"],
+                        domain=int(entry["domain"]),
+                        vehicle_public_key=public_key,
+                        epoch=bytes.fromhex(entry["epoch"]),
+                        # Reprise au-delà du bloc réservé : jamais de compteur réutilisé
+                        counter=int(entry["counter"]),
+                        clock_offset=float(entry["clock_offset"]),
+                        counter_reserved=int(entry["counter"]),
+                        hmac_key=derive_hmac_key(self.private_key, public_key),
+                        installed_at=float(entry.get("installed_at", 0)),
+                    )
+                except (KeyError, ValueError, KeypairError) as exc:
+                    # Laissée dans le fichier : _persist fusionne au lieu d'écraser
+                    logger.warning("Session véhicule ignorée: %s", exc)
+                    continue
+                self._sessions[(session.vin, session.domain)] = session
+
+
+def _lock_file(lock_file) -> None:
+    """Verrou exclusif bloquant sur le fichier .lock (flock, ou msvcrt sous Windows)."""
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    lock_file.seek(0)
+    # LK_LOCK réessaie pendant ~10 s puis lève OSError (persistance ignorée, journalisée)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(lock_file) -> None:
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+    lock_file.seek(0)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _read_entries(path: Path) -> list:
+    if not path.exists():
+        return []
+    try:
+        return json.loads(path.read_text() or "{}").get("sessions", [])
+    except (OSError, ValueError) as exc:
+        logger.warning("Sessions véhicule illisibles (%s): %s", path, exc)
+        return []
+
+
+def _write_entries(path: Path, entries: list) -> None:
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=".vehicle_sessions.")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"sessions": entries}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+keypair_manager = KeypairManager()
@@ -1,12 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 from app.core.settings import settings
+from app.core.json_codec import FastJSONResponse
+from app.core.compression import CompressionMiddleware
 from app.api import api_router
-from app.api.routes_public import get_public_key
+from app.api.routes_public import get_public_key, public_key_cache
+from app.auth.token_refresher import token_refresher
+from app.auth.jwt_verifier import jwt_verifier
+from app.tesla.vcp import vcp_session_pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clé publique résolue une fois au démarrage (servie ensuite depuis la mémoire)
+    public_key_cache.load()
+    # Tâches d'arrière-plan : démarrées avec le serveur, arrêtées proprement à la fin
+    if settings.TOKEN_REFRESH_ENABLED:
+        await token_refresher.start()
+    if settings.SUPABASE_JWT_VERIFICATION != "remote":
+        await jwt_verifier.start()
+    try:
+        yield
+    finally:
+        await vcp_session_pool.close_all()
+        await jwt_verifier.stop()
+        await token_refresher.stop()
 
 def create_app() -> FastAPI:
-    app = FastAPI(title=settings.APP_NAME)
+    app = FastAPI(title=settings.APP_NAME, lifespan=lifespan, default_response_class=FastJSONResponse)
     
     # Configuration CORS - Parse les origines depuis les settings
     cors_origins = [
@@ -27,6 +49,9 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(CompressionMiddleware)
+    
     # Prometheus metrics
     instrumentator = Instrumentator()
     instrumentator.instrument(app).expose(app, endpoint="/metrics")
@@ -0,0 +1,44 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field, model_validator
+
+AudienceRegion = Literal["eu", "na"]
+StreamFormat = Literal["ndjson", "sse"]
+# Commandes véhicule exposées (endpoints unitaires, commandes groupées, jobs).
+# Liste fermée : la valeur sert aussi de label Prometheus (vcp_phase_seconds, file de commandes).
+VehicleCommand = Literal["wake_up", "door_lock", "door_unlock", "charge_start", "charge_stop"]
+
+
+class BatchTarget(BaseModel):
+    vehicle_id: str = Field(description="ID Tesla du véhicule (id Fleet API).")
+    region: Optional[AudienceRegion] = Field(default=None, description="Région Fleet du véhicule (défaut: TESLA_REGION).")
+
+
+class BatchVehicleFilter(BaseModel):
+    account_name: Optional[str] = Field(default=None, description="Nom du compte Tesla (défaut: premier compte actif).")
+    state: Optional[str] = Field(default=None, description="Filtrer par état en cache (online, offline, asleep).")
+    max_age_minutes: int = Field(default=1440, ge=1, le=10080, description="Âge maximum du cache véhicules.")
+
+
+class BatchCommandRequest(BaseModel):
+    command: VehicleCommand = Field(description="Commande véhicule (wake_up, door_lock, door_unlock, charge_start, charge_stop).")
+    command_params: Dict[str, Any] = Field(default_factory=dict)
+    targets: Optional[List[BatchTarget]] = Field(default=None, description="Véhicules ciblés explicitement.")
+    filter: Optional[BatchVehicleFilter] = Field(default=None, description="Cibler les véhicules en cache Supabase.")
+
+    @model_validator(mode="after")
+    def ensure_targets(self):
+        if not self.targets and self.filter is None:
+            raise ValueError("Fournir 'targets' ou 'filter'.")
+        return self
+
+
+class BatchReadItem(BaseModel):
+    vehicle_id: str = Field(description="ID Tesla du véhicule (tesla_id).")
+    endpoint: str = Field(pattern=r"^[a-z][a-z0-9_]*$", description="Endpoint Tesla (ex: charge_state, vehicle_data).")
+
+
+class BatchReadRequest(BaseModel):
+    items: List[BatchReadItem] = Field(min_length=1, description="Couples (véhicule, endpoint) à lire.")
+    force_refresh: bool = Field(default=False, description="Ignorer le cache et tout relire depuis Tesla.")
+    ttl_minutes: int = Field(default=5, ge=1, le=60, description="Durée de vie en cache des données relues.")
@@ -0,0 +1,201 @@
+"""
+Clés d'idempotence (en-tête Idempotency-Key) pour les commandes véhicule.
+
+Un client qui relance une commande après un timeout réseau renvoie la même clé :
+- la première requête réserve la clé (SET NX, état "pending") puis exécute la commande ;
+- une relance pendant l'exécution attend le résultat de la première
+  (au plus IDEMPOTENCY_WAIT_SECONDS, sinon 409) ;
+- une relance après coup rejoue le résultat enregistré (en-tête Idempotent-Replayed),
+  sans nouvelle session VCP ni nouvelle action sur le véhicule ;
+- la même clé avec une autre requête (autre véhicule, autre commande...) : 422.
+
+Les clés sont propres à chaque utilisateur. Stockage dans Redis quand il répond
+(partagé entre workers et replicas), sinon dans un store mémoire du processus.
+
+Si Redis est configuré mais ne répond plus en cours de route, la réservation et
+la lecture de la clé échouent en 503 : repli mémoire exclu, une relance reçue par
+un autre replica réexécuterait la commande.
+
+Une clé n'est jamais libérée pour réexécuter la commande : après un 502/504 la
+commande a pu atteindre le véhicule. Toute réponse d'erreur (y compris 5xx) est
+enregistrée et rejouée ; pour réessayer, le client envoie une nouvelle clé.
+Sur exception inattendue ou annulation, la réservation reste "pending" jusqu'à
+expiration. Pendant l'exécution (réveil, file du véhicule, commande), elle est
+prolongée régulièrement : IDEMPOTENCY_PENDING_TTL_SECONDS ne borne que la reprise
+d'une clé dont le processus a disparu.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException, Response
+from prometheus_client import Counter
+
+from app.core import json_codec
+from app.core.memory_store import get_memory_store
+from app.core.redis_client import get_redis
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "idempotency:"
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+PENDING, DONE = "pending", "done"
+
+IDEMPOTENCY_REQUESTS = Counter(
+    "idempotency_requests_total",
+    "Requêtes avec Idempotency-Key (executed, replayed, conflict = toujours en cours, mismatch = autre requête)",
+    ["result"],
+)
+
+_local = get_memory_store("idempotency", default_ttl=settings.IDEMPOTENCY_TTL_SECONDS)
+_local_claim_lock = threading.Lock()
+
+
+def fingerprint(parts: Dict[str, Any]) -> str:
+    """Empreinte de la requête : une clé réutilisée doit désigner la même commande."""
+    return hashlib.blake2b(json_codec.dumps(parts), digest_size=16).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    SET NX + lecture/écriture d'un état JSON, Redis ou mémoire.
+    Appels synchrones (client Redis) : depuis la boucle, via asyncio.to_thread.
+    """
+
+    def claim(self, key: str, record: Dict[str, Any], ttl: int) -> bool:
+        raw = json_codec.dumps_str(record)
+        client = get_redis()
+        if client is not None:
+            return bool(client.set(key, raw, nx=True, ex=ttl))
+        with _local_claim_lock:
+            if _local.get(key) is not None:
+                return False
+            _local.set(key, raw, ttl=ttl)
+            return True
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        client = get_redis()
+        raw = client.get(key) if client is not None else _local.get(key)
+        return json_codec.loads(raw) if raw else None
+
+    def put(self, key: str, record: Dict[str, Any], ttl: int) -> None:
+        raw = json_codec.dumps_str(record)
+        client = get_redis()
+        if client is not None:
+            client.set(key, raw, ex=ttl)
+        else:
+            _local.set(key, raw, ttl=ttl)
+
+    def touch(self, key: str, ttl: int) -> None:
+        """Prolonge la réservation en cours."""
+        client = get_redis()
+        if client is not None:
+            client.expire(key, ttl)
+            return
+        raw = _local.get(key)
+        if raw is not None:
+            _local.set(key, raw, ttl=ttl)
+
+
+store = IdempotencyStore()
+
+
+def _replay(record: Dict[str, Any], response: Response) -> Any:
+    response.headers[REPLAYED_HEADER] = "true"
+    if record.get("status_code", 200) >= 400:
+        raise HTTPException(status_code=record["status_code"], detail=record.get("detail"), headers={REPLAYED_HEADER: "true"})
+    return record.get("body")
+
+
+async def _keep_pending(key: str) -> None:
+    ttl = settings.IDEMPOTENCY_PENDING_TTL_SECONDS
+    while True:
+        await asyncio.sleep(ttl / 3)
+        try:
+            await asyncio.to_thread(store.touch, key, ttl)
+        except Exception as exc:
+            logger.warning("Prolongation de la clé idempotente impossible (%s): %s", key, exc)
+
+
+async def run_idempotent(
+    user_id: Optional[str],
+    idempotency_key: Optional[str],
+    request_parts: Dict[str, Any],
+    response: Response,
+    run: Callable[[], Awaitable[Any]],
+) -> Any:
+    """
+    Exécute `run()` une seule fois par (utilisateur, Idempotency-Key).
+    Sans clé, `run()` est simplement appelé.
+    """
+    if not idempotency_key:
+        return await run()
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{HEADER} trop long (max {MAX_KEY_LENGTH} caractères)")
+
+    key = f"{KEY_PREFIX}{user_id}:{idempotency_key}"
+    expected = fingerprint(request_parts)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+
+    while True:
+        if await _checked(store.claim, key, {"state": PENDING, "fingerprint": expected}, settings.IDEMPOTENCY_PENDING_TTL_SECONDS):
+            break
+        record = await _checked(store.get, key)
+        if record is None:
+            # Réservation expirée entre-temps : on retente de la prendre
+            continue
+        if record.get("fingerprint") != expected:
+            IDEMPOTENCY_REQUESTS.labels("mismatch").inc()
+            raise HTTPException(status_code=422, detail=f"{HEADER} déjà utilisée pour une autre requête")
+        if record.get("state") == DONE:
+            IDEMPOTENCY_REQUESTS.labels("replayed").inc()
+            return _replay(record, response)
+        if time.monotonic() >= deadline:
+            IDEMPOTENCY_REQUESTS.labels("conflict").inc()
+            raise HTTPException(status_code=409, detail="Requête identique toujours en cours d'exécution")
+        await asyncio.sleep(settings.IDEMPOTENCY_POLL_SECONDS)
+
+    IDEMPOTENCY_REQUESTS.labels("executed").inc()
+    done = {"state": DONE, "fingerprint": expected}
+    heartbeat = asyncio.ensure_future(_keep_pending(key))
+    try:
+        result = await run()
+    except HTTPException as exc:
+        # 502/504 compris : la commande a pu être exécutée, la relance rejoue l'échec
+        record = {**done, "status_code": exc.status_code, "detail": exc.detail}
+        await _finish(key, record, heartbeat)
+        raise
+    except BaseException:
+        # Exception inattendue ou requête annulée : issue inconnue, la réservation
+        # expire d'elle-même (les relances reçoivent 409 d'ici là)
+        heartbeat.cancel()
+        raise
+    await _finish(key, {**done, "status_code": 200, "body": result}, heartbeat)
+    return result
+
+
+async def _checked(call: Callable[..., Any], *args) -> Any:
+    """Réservation/lecture de la clé : sans stockage fiable, la commande n'est pas exécutée."""
+    try:
+        return await asyncio.to_thread(call, *args)
+    except Exception as exc:
+        logger.warning("Stockage des clés idempotentes indisponible: %s", exc)
+        raise HTTPException(status_code=503, detail=f"{HEADER} indisponible, réessayez plus tard")
+
+
+async def _finish(key: str, record: Dict[str, Any], heartbeat: asyncio.Future) -> None:
+    # Arrêt de la prolongation avant l'écriture : elle raccourcirait le TTL du résultat
+    heartbeat.cancel()
+    try:
+        await asyncio.to_thread(store.put, key, record, settings.IDEMPOTENCY_TTL_SECONDS)
+    except Exception as exc:
+        # On rend tout de même la réponse ; la réservation expirera sans réexécution entre-temps
+        logger.warning("Enregistrement du résultat idempotent impossible (%s): %s", key, exc)
@@ -0,0 +1,205 @@
+"""
+Jobs asynchrones (commandes véhicule, synchronisation de flotte).
+
+Avec Redis (REDIS_URL redis://...), les jobs sont placés dans une file rq et
+exécutés par des workers séparés :
+
+    rq worker --url $REDIS_URL tesla-jobs
+
+Sans Redis (REDIS_URL=memory://), ils sont exécutés dans le processus API en
+tâche de fond, et leur état est gardé en mémoire (dev / instance unique).
+
+Les jobs ne transportent jamais de token : le worker récupère le token Tesla de
+l'utilisateur dans le store partagé (ensure_user_access_token).
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from app.core.memory_store import get_memory_store
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUED, STARTED, FINISHED, FAILED = "queued", "started", "finished", "failed"
+TERMINAL_STATUSES = {FINISHED, FAILED}
+
+# Fallback mémoire (sans Redis) : état des jobs exécutés en tâche de fond
+_local_jobs = get_memory_store("jobs", default_ttl=settings.JOBS_RESULT_TTL_SECONDS)
+_local_tasks: set[asyncio.Task] = set()
+
+
+class JobNotFound(Exception):
+    pass
+
+
+# ============================================================================
+# Travail effectué par les jobs (exécuté par le worker rq ou en tâche de fond)
+# ============================================================================
+
+async def _user_token(user_id: str) -> str:
+    from app.auth.oauth_third_party import ensure_user_access_token
+    token = await ensure_user_access_token(user_id=user_id)
+    if not token:
+        raise RuntimeError("Token Tesla utilisateur non trouvé")
+    return token
+
+
+async def _run_command(user_id: str, vehicle_id: str, command_name: str, command_params: Dict[str, Any], region: Optional[str]) -> Dict[str, Any]:
+    from app.tesla.client import TeslaClient
+    client = TeslaClient(base_url=settings.tesla_audience_for(region), access_token=await _user_token(user_id))
+    if command_name == "wake_up":
+        return await client.wake_up(vehicle_id, wait=True)
+    status = await client.run_vcp(vehicle_id, command_name, command_params)
+    return {"success": status.success, "error": status.error, "response": status.raw}
+
+
+async def _run_sync(user_id: str, account_name: Optional[str]) -> Dict[str, Any]:
+    from app.tesla.vehicles import sync_account_vehicles
+    return await sync_account_vehicles(user_id, await _user_token(user_id), account_name)
+
+
+async def _in_worker(coro) -> Any:
+    from app.tesla.vcp import vcp_session_pool
+    try:
+        return await coro
+    finally:
+        # Chaque job rq a sa propre boucle : les websockets ne lui survivent pas
+        await vcp_session_pool.close_all()
+
+
+def command_job(user_id: str, vehicle_id: str, command_name: str, command_params: Dict[str, Any], region: Optional[str] = None) -> Dict[str, Any]:
+    """Point d'entrée rq (synchrone) pour une commande véhicule."""
+    return asyncio.run(_in_worker(_run_command(user_id, vehicle_id, command_name, command_params, region)))
+
+
+def sync_job(user_id: str, account_name: Optional[str] = None) -> Dict[str, Any]:
+    """Point d'entrée rq (synchrone) pour une synchronisation complète de la flotte."""
+    return asyncio.run(_in_worker(_run_sync(user_id, account_name)))
+
+
+# ============================================================================
+# File : rq si Redis est disponible, sinon tâche de fond locale
+# ============================================================================
+
+_rq_queues: Dict[str, Any] = {}
+
+
+def _rq_queue():
+    """File rq, ou None sans Redis (rq stocke des pickles : connexion sans decode_responses)."""
+    from app.core.redis_client import get_redis
+    if get_redis() is None:
+        return None
+    key = f"{settings.REDIS_URL}|{settings.JOBS_QUEUE_NAME}"
+    queue = _rq_queues.get(key)
+    if queue is None:
+        import redis
+        from rq import Queue
+        queue = _rq_queues[key] = Queue(settings.JOBS_QUEUE_NAME, connection=redis.from_url(settings.REDIS_URL))
+    return queue
+
+
+def _enqueue_rq(queue, func: Callable[..., Dict[str, Any]], job_id: str, meta: Dict[str, Any], *args) -> Dict[str, Any]:
+    queue.enqueue(
+        func,
+        *args,
+        job_id=job_id,
+        meta=meta,
+        job_timeout=settings.JOBS_TIMEOUT_SECONDS,
+        result_ttl=settings.JOBS_RESULT_TTL_SECONDS,
+        failure_ttl=settings.JOBS_RESULT_TTL_SECONDS,
+    )
+    return get_job(job_id, meta["user_id"])
+
+
+async def _enqueue(kind: str, user_id: str, func: Callable[..., Dict[str, Any]], coro_factory: Callable[[], Any], *args) -> Dict[str, Any]:
+    job_id = str(uuid.uuid4())
+    meta = {"kind": kind, "user_id": user_id}
+    # rq et le ping Redis sont synchrones : hors de la boucle
+    queue = await asyncio.to_thread(_rq_queue)
+    if queue is not None:
+        return await asyncio.to_thread(_enqueue_rq, queue, func, job_id, meta, *args)
+
+    state = {"job_id": job_id, **meta, "status": QUEUED, "result": None, "error": None, "enqueued_at": time.time(), "ended_at": None}
+    _local_jobs.set(job_id, state)
+
+    async def run():
+        state["status"] = STARTED
+        try:
+            state["result"] = await coro_factory()
+            state["status"] = FINISHED
+        except Exception as exc:
+            logger.warning("Job %s (%s) failed: %s", job_id, kind, exc)
+            state["error"] = str(exc) or exc.__class__.__name__
+            state["status"] = FAILED
+        finally:
+            state["ended_at"] = time.time()
+
+    task = asyncio.get_running_loop().create_task(run(), name=f"job-{kind}-{job_id[:8]}")
+    _local_tasks.add(task)
+    task.add_done_callback(_local_tasks.discard)
+    return _public(state)
+
+
+async def enqueue_command(user_id: str, vehicle_id: str, command_name: str, command_params: Optional[Dict[str, Any]] = None, region: Optional[str] = None) -> Dict[str, Any]:
+    command_params = command_params or {}
+    return await _enqueue(
+        "command",
+        user_id,
+        command_job,
+        lambda: _run_command(user_id, vehicle_id, command_name, command_params, region),
+        user_id, vehicle_id, command_name, command_params, region,
+    )
+
+
+async def enqueue_sync(user_id: str, account_name: Optional[str] = None) -> Dict[str, Any]:
+    return await _enqueue("sync", user_id, sync_job, lambda: _run_sync(user_id, account_name), user_id, account_name)
+
+
+def get_job(job_id: str, user_id: str) -> Dict[str, Any]:
+    """État d'un job de l'utilisateur (JobNotFound si inconnu, expiré ou appartenant à un autre utilisateur)."""
+    state = _local_jobs.get(job_id)
+    if state is None:
+        state = _rq_job_state(job_id)
+    if state is None or state.get("user_id") != user_id:
+        raise JobNotFound(job_id)
+    return _public(state)
+
+
+def _rq_job_state(job_id: str) -> Optional[Dict[str, Any]]:
+    queue = _rq_queue()
+    if queue is None:
+        return None
+    from rq.exceptions import NoSuchJobError
+    from rq.job import Job
+    try:
+        job = Job.fetch(job_id, connection=queue.connection)
+    except NoSuchJobError:
+        return None
+
+    status = job.get_status(refresh=False)
+    status = getattr(status, "value", status)
+    if status not in (STARTED, FINISHED, FAILED):
+        status = QUEUED if status in ("queued", "deferred", "scheduled") else FAILED
+    error = None
+    if status == FAILED:
+        latest = job.latest_result()
+        error = (latest.exc_string if latest else None) or "Job failed"
+        error = error.strip().splitlines()[-1]
+    return {
+        "job_id": job.id,
+        "kind": job.meta.get("kind"),
+        "user_id": job.meta.get("user_id"),
+        "status": status,
+        "result": job.return_value() if status == FINISHED else None,
+        "error": error,
+        "enqueued_at": job.enqueued_at.timestamp() if job.enqueued_at else None,
+        "ended_at": job.ended_at.timestamp() if job.ended_at else None,
+    }
+
+
+def _public(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in state.items() if k != "user_id"}
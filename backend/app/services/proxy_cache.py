@@ -0,0 +1,238 @@
+"""
+Cache des GET idempotents du proxy générique (POST /fleet/direct/proxy).
+
+- Règles par motif de chemin (PROXY_CACHE_RULES, sinon DEFAULT_RULES) : durée de
+  vie, portée ("user" : une entrée par utilisateur, "shared" : commune à tous) et
+  commandes qui invalident l'entrée ("*" = toutes).
+- `{vehicle_id}` dans un motif capture l'id du véhicule ; `*` remplace un segment.
+  `params` restreint la règle à une query string donnée (ex: endpoints=vehicle_config).
+- Invalidation par génération : chaque (règle, véhicule) a un compteur inclus dans
+  la clé ; une commande sur le véhicule l'incrémente et les anciennes entrées ne
+  sont plus jamais lues (elles expirent d'elles-mêmes).
+- La Fleet API accepte l'id ou le VIN dans le chemin : une commande incrémente les
+  générations des deux formes dès que la correspondance est connue du processus
+  (liste des véhicules, résolution de l'id interne, voir `remember_vehicle`).
+  Une entrée lue par VIN pour un véhicule jamais vu par ce processus n'est
+  invalidée que par une commande envoyée avec ce même VIN (sinon : expiration).
+- Stockage dans Redis quand il répond (partagé entre workers et replicas), sinon
+  dans un store mémoire du processus.
+
+Seules les réponses 200 de taille raisonnable sont mises en cache.
+"""
+from __future__ import annotations
+import hashlib
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from app.core import json_codec
+from app.core.memory_store import get_memory_store
+from app.core.redis_client import get_redis
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "proxy_cache:"
+# Bien au-delà de toute durée de vie d'entrée : un compteur expiré ne peut pas
+# faire réapparaître une entrée périmée
+_GENERATION_TTL_SECONDS = 7 * 86400
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"pattern": "/status", "ttl": 60, "scope": "shared"},
+    {"pattern": "/api/1/partner_accounts/public_key", "ttl": 3600, "scope": "shared"},
+    {
+        "pattern": "/api/1/vehicles/{vehicle_id}/vehicle_data",
+        "params": {"endpoints": "vehicle_config"},
+        "ttl": 3600,
+        "scope": "user",
+    },
+    {"pattern": "/api/1/vehicles/{vehicle_id}/vehicle_data", "ttl": 30, "scope": "user", "invalidate_on": ["*"]},
+    {"pattern": "/api/1/vehicles/{vehicle_id}", "ttl": 30, "scope": "user", "invalidate_on": ["*"]},
+]
+
+# Commande envoyée au travers du proxy (POST .../command/<nom> ou .../wake_up)
+_COMMAND_PATH = re.compile(r"^/api/1/vehicles/(?P<vehicle_id>[^/]+)/(?:command/(?P<command>[^/]+)|(?P<wake>wake_up))/?$")
+
+PROXY_CACHE_REQUESTS = Counter(
+    "proxy_cache_requests_total",
+    "GET du proxy générique servis par le cache (hit), relayés à Tesla (miss) ou hors règle (bypass)",
+    ["rule", "result"],
+)
+PROXY_CACHE_INVALIDATIONS = Counter(
+    "proxy_cache_invalidations_total",
+    "Générations de cache incrémentées par une commande véhicule",
+    ["command"],
+)
+
+
+@dataclass(frozen=True)
+class ProxyCacheRule:
+    pattern: str
+    ttl: int
+    scope: str = "user"
+    params: Dict[str, str] = field(default_factory=dict)
+    invalidate_on: FrozenSet[str] = frozenset()
+    name: str = ""
+
+    def __post_init__(self):
+        if self.scope not in ("user", "shared"):
+            raise ValueError(f"Portée de cache inconnue: {self.scope}")
+        if not self.name:
+            label = self.pattern + "".join(f"?{k}={v}" for k, v in sorted(self.params.items()))
+            object.__setattr__(self, "name", label)
+        object.__setattr__(self, "_regex", _compile(self.pattern))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ProxyCacheRule":
+        return cls(
+            pattern=data["pattern"],
+            ttl=int(data["ttl"]),
+            scope=data.get("scope", "user"),
+            params={k: str(v) for k, v in (data.get("params") or {}).items()},
+            invalidate_on=frozenset(data.get("invalidate_on") or ()),
+            name=data.get("name", ""),
+        )
+
+    def match(self, path: str, params: Dict[str, Any]) -> Optional[re.Match]:
+        m = self._regex.match(path)
+        if m is None:
+            return None
+        if any(str(params.get(k)) != v for k, v in self.params.items()):
+            return None
+        return m
+
+    def invalidated_by(self, command: str) -> bool:
+        return "*" in self.invalidate_on or command in self.invalidate_on
+
+
+def _compile(pattern: str) -> re.Pattern:
+    regex = re.escape(pattern.rstrip("/") or "/")
+    regex = regex.replace(re.escape("{vehicle_id}"), r"(?P<vehicle_id>[^/]+)").replace(re.escape("*"), r"[^/]+")
+    return re.compile(f"^{regex}/?$")
+
+
+@dataclass
+class CachedProxyResponse:
+    status_code: int
+    headers: Dict[str, str]
+    body: Any
+
+
+class ProxyResponseCache:
+    def __init__(self, rules: Optional[List[ProxyCacheRule]] = None):
+        self._rules = rules
+        self._entries = get_memory_store("proxy_cache", max_entries=settings.PROXY_CACHE_MAX_ENTRIES)
+        self._generations = get_memory_store("proxy_cache_generations", default_ttl=_GENERATION_TTL_SECONDS)
+        # id Fleet API <-> VIN, dans les deux sens
+        self._aliases = get_memory_store("proxy_cache_vehicle_aliases", default_ttl=_GENERATION_TTL_SECONDS)
+
+    @property
+    def rules(self) -> List[ProxyCacheRule]:
+        if self._rules is None:
+            self._rules = [ProxyCacheRule.from_dict(r) for r in (settings.PROXY_CACHE_RULES or DEFAULT_RULES)]
+        return self._rules
+
+    def rule_for(self, method: str, path: str, params: Optional[Dict[str, Any]]) -> Optional[Tuple[ProxyCacheRule, Optional[str]]]:
+        """Première règle applicable à l'appel : (règle, vehicle_id capturé), ou None (GET compté en bypass)."""
+        if not settings.PROXY_CACHE_ENABLED or method.upper() != "GET":
+            return None
+        path = path.split("?", 1)[0]
+        for rule in self.rules:
+            m = rule.match(path, params or {})
+            if m is not None:
+                return rule, m.groupdict().get("vehicle_id")
+        PROXY_CACHE_REQUESTS.labels("", "bypass").inc()
+        return None
+
+    def key(self, rule: ProxyCacheRule, vehicle_id: Optional[str], *, user_id: Optional[str], region: str, path: str, params: Optional[Dict[str, Any]]) -> str:
+        owner = user_id if rule.scope == "user" else "*"
+        generation = self._generation(rule, vehicle_id) if vehicle_id and rule.invalidate_on else 0
+        query = "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+        digest = hashlib.blake2b(f"{owner}|{region}|{path}?{query}".encode(), digest_size=16).hexdigest()
+        return f"{KEY_PREFIX}{digest}:{generation}"
+
+    def get(self, key: str, rule: ProxyCacheRule) -> Optional[CachedProxyResponse]:
+        raw = None
+        client = get_redis()
+        if client is not None:
+            try:
+                raw = client.get(key)
+            except Exception as exc:
+                logger.debug("Lecture du cache proxy impossible (%s): %s", key, exc)
+        else:
+            raw = self._entries.get(key)
+        PROXY_CACHE_REQUESTS.labels(rule.name, "hit" if raw else "miss").inc()
+        if not raw:
+            return None
+        return CachedProxyResponse(**json_codec.loads(raw))
+
+    def set(self, key: str, rule: ProxyCacheRule, response: CachedProxyResponse) -> None:
+        if response.status_code != 200:
+            return
+        raw = json_codec.dumps_str(response.__dict__)
+        if len(raw) > settings.PROXY_CACHE_MAX_BODY_BYTES:
+            return
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(key, raw, ex=rule.ttl)
+            except Exception as exc:
+                logger.debug("Écriture du cache proxy impossible (%s): %s", key, exc)
+            return
+        self._entries.set(key, raw, ttl=rule.ttl)
+
+    def remember_vehicle(self, vehicle_id: Any, vin: Optional[str]) -> None:
+        """Correspondance id <-> VIN : une commande par l'un invalide aussi les GET par l'autre."""
+        if vehicle_id is None or not vin:
+            return
+        self._aliases.set(str(vehicle_id), vin)
+        self._aliases.set(vin, str(vehicle_id))
+
+    def vehicle_command(self, vehicle_id: str, command: str) -> None:
+        """Une commande a été envoyée au véhicule : ses entrées concernées ne sont plus lues."""
+        rules = [r for r in self.rules if r.invalidated_by(command)]
+        if not rules:
+            return
+        PROXY_CACHE_INVALIDATIONS.labels(command).inc()
+        client = get_redis()
+        alias = self._aliases.get(vehicle_id)
+        for rule, target in ((r, v) for r in rules for v in (vehicle_id, alias) if v):
+            gen_key = self._generation_key(rule, target)
+            if client is not None:
+                try:
+                    pipe = client.pipeline()
+                    pipe.incr(gen_key)
+                    pipe.expire(gen_key, _GENERATION_TTL_SECONDS)
+                    pipe.execute()
+                except Exception as exc:
+                    logger.warning("Invalidation du cache proxy impossible (%s): %s", gen_key, exc)
+            else:
+                self._generations.set(gen_key, int(self._generations.get(gen_key, 0)) + 1)
+
+    def request_sent(self, method: str, path: str) -> None:
+        """Invalide le cache si l'appel proxy est lui-même une commande véhicule."""
+        if method.upper() == "GET":
+            return
+        m = _COMMAND_PATH.match(path.split("?", 1)[0])
+        if m is not None:
+            self.vehicle_command(m.group("vehicle_id"), m.group("command") or m.group("wake"))
+
+    def _generation(self, rule: ProxyCacheRule, vehicle_id: str) -> int:
+        gen_key = self._generation_key(rule, vehicle_id)
+        client = get_redis()
+        if client is not None:
+            try:
+                return int(client.get(gen_key) or 0)
+            except Exception:
+                return 0
+        return int(self._generations.get(gen_key, 0))
+
+    @staticmethod
+    def _generation_key(rule: ProxyCacheRule, vehicle_id: str) -> str:
+        return f"{KEY_PREFIX}gen:{rule.name}:{vehicle_id}"
+
+
+proxy_cache = ProxyResponseCache()
@@ -2,13 +2,23 @@
 Service pour gérer le cache des véhicules dans Supabase.
 """
 from __future__ import annotations
-from typing import Optional, List, Dict, Any
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from datetime import datetime, timedelta
 from supabase import create_client
+from app.core.etag import combine_etags, compute_etag
 from app.core.settings import settings
+from app.services.vehicle_events import vehicle_events
 import json
 
 
+@dataclass
+class CachedPayload:
+    """Donnée en cache et son ETag (calculé à l'écriture, voir migrations/003_add_data_etags.sql)."""
+    data: Any
+    etag: str
+
+
 class VehicleCacheService:
     """Service pour gérer le cache des véhicules et données Tesla dans Supabase."""
     
@@ -71,6 +81,7 @@ class VehicleCacheService:
     def cache_vehicles(self, account_id: str, vehicles_data: List[Dict[str, Any]]) -> None:
         """
         Met en cache les données des véhicules.
+        Un événement "vehicle" est publié pour chaque véhicule nouveau ou modifié (flux SSE).
         
         Args:
             account_id: UUID du compte Tesla
@@ -83,6 +94,7 @@ class VehicleCacheService:
                 'tesla_vehicle_id': vehicle['vehicle_id'],
                 'vin': vehicle['vin'],
                 'vehicle_data': vehicle,
+                'data_etag': compute_etag(vehicle),
                 'display_name': vehicle.get('display_name'),
                 'access_type': vehicle.get('access_type'),
                 'state': vehicle.get('state'),
@@ -93,7 +105,7 @@ class VehicleCacheService:
             
             # Vérifier si le véhicule existe déjà
             existing = self.supabase.table('vehicles')\
-                .select('id')\
+                .select('id, data_etag')\
                 .eq('tesla_account_id', account_id)\
                 .eq('tesla_id', vehicle['id'])\
                 .limit(1)\
@@ -105,11 +117,22 @@ class VehicleCacheService:
                     .update(vehicle_data)\
                     .eq('id', existing.data[0]['id'])\
                     .execute()
+                changed = existing.data[0].get('data_etag') != vehicle_data['data_etag']
             else:
                 # Insérer une nouvelle entrée
                 self.supabase.table('vehicles')\
                     .insert(vehicle_data)\
                     .execute()
+                changed = True
+            
+            if changed:
+                vehicle_events.publish(account_id, {
+                    "type": "vehicle",
+                    "tesla_id": vehicle['id'],
+                    "vin": vehicle['vin'],
+                    "state": vehicle.get('state'),
+                    "vehicle": vehicle,
+                })
     
     def get_cached_vehicles(
         self, 
@@ -128,32 +151,118 @@ class VehicleCacheService:
         Returns:
             Liste des véhicules ou None si le cache est expiré
         """
+        cached = self.get_cached_vehicles_with_etag(account_id, max_age_minutes=max_age_minutes, state=state)
+        return cached.data if cached else None
+    
+    def get_cached_vehicles_with_etag(
+        self,
+        account_id: str,
+        max_age_minutes: int = 5,
+        state: Optional[str] = None
+    ) -> Optional[CachedPayload]:
+        """
+        Comme get_cached_vehicles, avec l'ETag de la liste.
+        L'ETag de la liste est dérivé des ETags des véhicules (stockés à l'écriture).
+        
+        Returns:
+            CachedPayload(liste des véhicules, etag) ou None si le cache est expiré
+        """
         cutoff_time = datetime.utcnow() - timedelta(minutes=max_age_minutes)
         
         query = self.supabase.table('vehicles')\
-            .select('vehicle_data')\
+            .select('vehicle_data, data_etag')\
             .eq('tesla_account_id', account_id)\
             .gte('last_synced_at', cutoff_time.isoformat())
         
         if state:
             query = query.eq('state', state)
         
-        result = query.execute()
+        result = query.order('tesla_id').execute()
         
         if result.data and len(result.data) > 0:
-            return [item['vehicle_data'] for item in result.data]
+            vehicles = [item['vehicle_data'] for item in result.data]
+            # Lignes antérieures à la migration 003 : ETag calculé à la volée
+            etags = [item.get('data_etag') or compute_etag(item['vehicle_data']) for item in result.data]
+            return CachedPayload(data=vehicles, etag=combine_etags(etags, account_id, state or ""))
         return None
     
+    def iter_cached_vehicles(
+        self,
+        account_id: str,
+        chunk_size: int = 500,
+        state: Optional[str] = None,
+        vins: Optional[List[str]] = None,
+        max_age_minutes: Optional[int] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Parcourt les véhicules en cache par blocs de `chunk_size` (pagination par tesla_id,
+        sans OFFSET) : un seul bloc en mémoire à la fois, quelle que soit la taille de la flotte.
+        
+        Yields:
+            Listes de lignes {id, tesla_id, vin, state, vehicle_data, last_synced_at}
+        """
+        last_tesla_id = None
+        cutoff = (datetime.utcnow() - timedelta(minutes=max_age_minutes)).isoformat() if max_age_minutes else None
+        while True:
+            query = self.supabase.table('vehicles')\
+                .select('id, tesla_id, vin, state, vehicle_data, last_synced_at')\
+                .eq('tesla_account_id', account_id)
+            if state:
+                query = query.eq('state', state)
+            if vins:
+                query = query.in_('vin', vins)
+            if cutoff:
+                query = query.gte('last_synced_at', cutoff)
+            if last_tesla_id is not None:
+                query = query.gt('tesla_id', last_tesla_id)
+            
+            rows = query.order('tesla_id').limit(chunk_size).execute().data or []
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            last_tesla_id = rows[-1]['tesla_id']
+    
+    def get_endpoints_for_vehicles(
+        self,
+        vehicle_ids: List[str],
+        endpoint_names: List[str],
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Récupère en une requête les réponses d'endpoints en cache pour plusieurs véhicules
+        (y compris expirées : c'est la dernière valeur connue).
+        
+        Returns:
+            Dict {vehicle_id (UUID): {endpoint_name: {"response": ..., "fetched_at": ...}}}
+        """
+        if not vehicle_ids or not endpoint_names:
+            return {}
+        result = self.supabase.table('vehicle_data_cache')\
+            .select('vehicle_id, endpoint_name, response_data, last_fetched_at')\
+            .in_('vehicle_id', list(vehicle_ids))\
+            .in_('endpoint_name', list(endpoint_names))\
+            .execute()
+        
+        data: Dict[str, Dict[str, Any]] = {}
+        for item in result.data or []:
+            data.setdefault(item['vehicle_id'], {})[item['endpoint_name']] = {
+                "response": item['response_data'],
+                "fetched_at": item.get('last_fetched_at'),
+            }
+        return data
+    
     def cache_endpoint_response(
         self,
         account_id: str,
         vehicle_id: str,
         endpoint_name: str,
         response_data: Dict[str, Any],
-        ttl_minutes: int = 5
+        ttl_minutes: int = 5,
+        tesla_id: Optional[str] = None
     ) -> None:
         """
-        Met en cache une réponse d'endpoint Tesla.
+        Met en cache une réponse d'endpoint Tesla et publie un événement "endpoint" (flux SSE).
         
         Args:
             account_id: UUID du compte Tesla
@@ -161,6 +270,7 @@ class VehicleCacheService:
             endpoint_name: Nom de l'endpoint (ex: 'charge_state', 'vehicle_state')
             response_data: Données de la réponse
             ttl_minutes: Durée de vie du cache en minutes
+            tesla_id: ID Tesla du véhicule (filtrage du flux d'événements par véhicule)
         """
         expires_at = datetime.utcnow() + timedelta(minutes=ttl_minutes)
         
@@ -169,9 +279,18 @@ class VehicleCacheService:
             'vehicle_id': vehicle_id,
             'endpoint_name': endpoint_name,
             'response_data': response_data,
+            'data_etag': compute_etag(response_data),
             'expires_at': expires_at.isoformat(),
             'last_fetched_at': datetime.utcnow().isoformat()
         }).execute()
+        
+        vehicle_events.publish(account_id, {
+            "type": "endpoint",
+            "vehicle_id": vehicle_id,
+            "tesla_id": tesla_id,
+            "endpoint": endpoint_name,
+            "data": response_data,
+        })
     
     def get_cached_endpoint(
         self,
@@ -188,17 +307,118 @@ class VehicleCacheService:
         Returns:
             Données de la réponse ou None si non trouvé/expiré
         """
+        cached = self.get_cached_endpoint_with_etag(vehicle_id, endpoint_name)
+        return cached.data if cached else None
+    
+    def get_cached_endpoint_with_etag(
+        self,
+        vehicle_id: str,
+        endpoint_name: str
+    ) -> Optional[CachedPayload]:
+        """
+        Comme get_cached_endpoint, avec l'ETag stocké à l'écriture.
+        
+        Returns:
+            CachedPayload(réponse, etag) ou None si non trouvé/expiré
+        """
         result = self.supabase.table('vehicle_data_cache')\
-            .select('response_data')\
+            .select('response_data, data_etag')\
             .eq('vehicle_id', vehicle_id)\
             .eq('endpoint_name', endpoint_name)\
             .gt('expires_at', datetime.utcnow().isoformat())\
             .execute()
         
         if result.data and len(result.data) > 0:
-            return result.data[0]['response_data']
+            item = result.data[0]
+            return CachedPayload(data=item['response_data'], etag=item.get('data_etag') or compute_etag(item['response_data']))
         return None
     
+    def get_cached_endpoints_bulk(
+        self,
+        vehicle_ids: List[str],
+        endpoint_names: List[str],
+    ) -> Dict[Tuple[str, str], CachedPayload]:
+        """
+        Lit en une requête les réponses d'endpoints non expirées de plusieurs véhicules.
+        
+        Returns:
+            Dict {(vehicle_id (UUID), endpoint_name): CachedPayload}
+        """
+        if not vehicle_ids or not endpoint_names:
+            return {}
+        result = self.supabase.table('vehicle_data_cache')\
+            .select('vehicle_id, endpoint_name, response_data, data_etag')\
+            .in_('vehicle_id', list(vehicle_ids))\
+            .in_('endpoint_name', list(endpoint_names))\
+            .gt('expires_at', datetime.utcnow().isoformat())\
+            .execute()
+        
+        return {
+            (item['vehicle_id'], item['endpoint_name']): CachedPayload(
+                data=item['response_data'],
+                etag=item.get('data_etag') or compute_etag(item['response_data']),
+            )
+            for item in (result.data or [])
+            if item.get('response_data')
+        }
+    
+    def cache_endpoint_responses(
+        self,
+        account_id: str,
+        entries: List[Dict[str, Any]],
+        ttl_minutes: int = 5,
+    ) -> None:
+        """
+        Met en cache plusieurs réponses d'endpoints en un seul upsert.
+        
+        Args:
+            account_id: UUID du compte Tesla
+            entries: Liste de {vehicle_id (UUID), tesla_id, endpoint_name, response_data}
+            ttl_minutes: Durée de vie du cache en minutes
+        """
+        if not entries:
+            return
+        now = datetime.utcnow()
+        expires_at = (now + timedelta(minutes=ttl_minutes)).isoformat()
+        self.supabase.table('vehicle_data_cache').upsert([
+            {
+                'tesla_account_id': account_id,
+                'vehicle_id': entry['vehicle_id'],
+                'endpoint_name': entry['endpoint_name'],
+                'response_data': entry['response_data'],
+                'data_etag': compute_etag(entry['response_data']),
+                'expires_at': expires_at,
+                'last_fetched_at': now.isoformat(),
+            }
+            for entry in entries
+        ], on_conflict='vehicle_id,endpoint_name').execute()
+        
+        for entry in entries:
+            vehicle_events.publish(account_id, {
+                "type": "endpoint",
+                "vehicle_id": entry['vehicle_id'],
+                "tesla_id": entry.get('tesla_id'),
+                "endpoint": entry['endpoint_name'],
+                "data": entry['response_data'],
+            })
+    
+    def get_vehicle_uuids(self, account_id: str, tesla_ids: List[str]) -> Dict[str, str]:
+        """
+        Récupère en une requête les UUID (table vehicles) de plusieurs véhicules.
+        
+        Returns:
+            Dict {tesla_id: UUID} pour les véhicules trouvés
+        """
+        if not tesla_ids:
+            return {}
+        result = self.supabase.table('vehicles')\
+            .select('id, tesla_id')\
+            .eq('tesla_account_id', account_id)\
+            .in_('tesla_id', list(tesla_ids))\
+            .execute()
+        
+        return {str(item['tesla_id']): item['id'] for item in (result.data or [])}
+    
     def get_vehicle_by_tesla_id(self, account_id: str, tesla_id: str) -> Optional[str]:
         """
         Récupère l'UUID d'un véhicule depuis son ID Tesla.
@@ -217,3 +437,44 @@ class VehicleCacheService:
             return result.data[0]['id']
         return None
 
+    def get_internal_vehicle_ids(self, account_id: str, tesla_ids: List[str]) -> Dict[str, str]:
+        """
+        Récupère en une requête les vehicle_id internes (utilisés par VCP) des véhicules en cache.
+        
+        Returns:
+            Dict {tesla_id: tesla_vehicle_id} pour les véhicules trouvés
+        """
+        if not tesla_ids:
+            return {}
+        result = self.supabase.table('vehicles')\
+            .select('tesla_id, tesla_vehicle_id')\
+            .eq('tesla_account_id', account_id)\
+            .in_('tesla_id', list(tesla_ids))\
+            .execute()
+        
+        return {
+            str(item['tesla_id']): str(item['tesla_vehicle_id'])
+            for item in (result.data or [])
+            if item.get('tesla_vehicle_id')
+        }
+
+    def expand_vehicle_identifiers(self, account_id: str, identifiers: List[str]) -> List[str]:
+        """
+        Complète un filtre de véhicules (tesla_id, VIN ou UUID, au choix du client) avec
+        les deux autres identifiants de chaque véhicule en cache : les événements "endpoint"
+        ne portent pas le VIN, un filtre par VIN doit aussi retenir leur tesla_id et UUID.
+        
+        Returns:
+            Identifiants demandés, plus ceux des véhicules correspondants
+        """
+        wanted = {str(i) for i in identifiers}
+        expanded = set(wanted)
+        result = self.supabase.table('vehicles')\
+            .select('id, tesla_id, vin')\
+            .eq('tesla_account_id', account_id)\
+            .execute()
+        for item in (result.data or []):
+            ids = {str(item[k]) for k in ('id', 'tesla_id', 'vin') if item.get(k) is not None}
+            if ids & wanted:
+                expanded |= ids
+        return sorted(expanded)
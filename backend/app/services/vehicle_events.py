@@ -0,0 +1,201 @@
+"""
+Événements véhicule en temps réel (flux SSE GET /fleet/events/stream).
+
+- Alimenté à l'écriture du cache : cache_vehicles (véhicule modifié) et
+  cache_endpoint_response ; un ingest de télémétrie peut publier de la même façon
+  via vehicle_events.publish().
+- Chaque compte Tesla a un tampon circulaire des derniers événements : un client
+  qui se reconnecte avec Last-Event-ID reçoit ce qu'il a manqué. Si l'écart ne
+  tient plus dans le tampon, il reçoit un événement "reset" et doit recharger
+  l'état complet.
+- Les ids SSE sont "<epoch>-<numéro>", l'epoch étant tiré au démarrage du
+  processus : un id émis par un autre processus (autre replica, redémarrage) ne
+  peut pas être confondu avec un id local et donne aussi un "reset".
+- Chaque client a une file bornée : un client trop lent est déconnecté (EventSource
+  se reconnecte avec Last-Event-ID) plutôt que de faire grossir la mémoire.
+- Avec Redis, les événements publiés par les autres processus (workers rq,
+  autres replicas) sont relayés via un canal pub/sub.
+"""
+from __future__ import annotations
+import asyncio
+import itertools
+import logging
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from app.core import json_codec
+from app.core.invalidation import InvalidationBus
+from app.core.memory_store import get_memory_store
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "vehicle_events"
+NAMESPACE = "vehicle_event"
+
+VEHICLE_EVENT_SUBSCRIBERS = Gauge(
+    "vehicle_event_subscribers",
+    "Clients connectés au flux SSE d'événements véhicule",
+)
+VEHICLE_EVENTS_DROPPED = Counter(
+    "vehicle_events_dropped_clients_total",
+    "Clients SSE déconnectés car leur file d'événements était pleine",
+)
+
+Event = Tuple[int, Dict[str, Any]]
+
+
+class Subscription:
+    __slots__ = ("loop", "queue", "account_id", "vehicles", "reset", "last_id", "closed")
+
+    def __init__(self, account_id: str, vehicles: Optional[Iterable[str]] = None):
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.VEHICLE_EVENTS_CLIENT_QUEUE_SIZE)
+        self.account_id = account_id
+        self.vehicles: Optional[Set[str]] = {str(v) for v in vehicles} if vehicles else None
+        self.reset = False  # Événements manqués : le client doit recharger l'état complet
+        self.last_id = 0
+        self.closed = False
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.vehicles is None:
+            return True
+        return any(str(event.get(k)) in self.vehicles for k in ("tesla_id", "vin", "vehicle_id") if event.get(k) is not None)
+
+    def deliver(self, item: Event) -> None:
+        """Appelable depuis n'importe quel thread."""
+        if not self.matches(item[1]):
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            pass  # Boucle fermée : client parti
+
+    def _put(self, item: Optional[Event]) -> None:
+        if self.closed or (item is not None and item[0] <= self.last_id):
+            return  # Flux fermé, ou événement déjà envoyé (rejeu du tampon)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Client trop lent : on vide sa file et on ferme le flux (reprise via Last-Event-ID)
+            VEHICLE_EVENTS_DROPPED.inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            self.closed = True
+            return
+        if item is not None:
+            self.last_id = item[0]
+
+
+class _Buffer:
+    """Derniers événements d'un compte ; `evicted_id` = plus grand id sorti du tampon."""
+    __slots__ = ("events", "evicted_id")
+
+    def __init__(self):
+        self.events: Deque[Event] = deque(maxlen=settings.VEHICLE_EVENTS_BUFFER_SIZE)
+        self.evicted_id = 0
+
+    def append(self, item: Event) -> None:
+        if len(self.events) == self.events.maxlen:
+            self.evicted_id = self.events[0][0]
+        self.events.append(item)
+
+
+class VehicleEventBus:
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._buffers = get_memory_store(
+            "vehicle_event_buffers",
+            max_entries=settings.VEHICLE_EVENTS_MAX_ACCOUNTS,
+            default_ttl=settings.VEHICLE_EVENTS_BUFFER_TTL_SECONDS,
+        )
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._remote = InvalidationBus(channel=CHANNEL)
+        self._remote_subscribed = False
+
+    def publish(self, account_id: str, event: Dict[str, Any], *, broadcast: bool = True) -> int:
+        """Publie un événement pour un compte Tesla ; retourne son id (local au processus)."""
+        event = {"account_id": account_id, "ts": time.time(), **event}
+        with self._lock:
+            event_id = self._last_seq = next(self._seq)
+            buffer: Optional[_Buffer] = self._buffers.get(account_id)
+            if buffer is None:
+                buffer = _Buffer()
+            buffer.append((event_id, event))
+            self._buffers.set(account_id, buffer)  # Rafraîchit le TTL du tampon
+            subscribers = list(self._subscribers.get(account_id, ()))
+        for subscription in subscribers:
+            subscription.deliver((event_id, event))
+        if broadcast:
+            self._remote.publish(NAMESPACE, json_codec.dumps_str(event))
+        return event_id
+
+    def format_id(self, event_id: int) -> str:
+        """Id SSE (Last-Event-ID) d'un événement de ce processus."""
+        return f"{self.epoch}-{event_id}"
+
+    def _parse_id(self, last_event_id: str) -> int:
+        """Numéro local de l'id SSE, -1 s'il n'a pas été émis par ce processus."""
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return -1
+        return int(seq)
+
+    def _on_remote(self, raw: str) -> None:
+        try:
+            event = json_codec.loads(raw)
+            self.publish(event.pop("account_id"), event, broadcast=False)
+        except Exception as exc:
+            logger.debug("Événement véhicule distant ignoré: %s", exc)
+
+    def subscribe(self, account_id: str, vehicles: Optional[Iterable[str]] = None, last_event_id: Optional[str] = None) -> Subscription:
+        """Abonne le client (dans sa boucle asyncio) ; rejoue le tampon depuis last_event_id."""
+        if not self._remote_subscribed:
+            self._remote.subscribe(NAMESPACE, self._on_remote)
+            # Redis indisponible : l'écoute sera retentée au prochain abonnement
+            self._remote_subscribed = self._remote.distributed
+
+        subscription = Subscription(account_id, vehicles)
+        with self._lock:
+            replay: List[Event] = []
+            if last_event_id is not None:
+                buffer: Optional[_Buffer] = self._buffers.get(account_id)
+                since = self._parse_id(last_event_id)
+                if since < 0 or since > self._last_seq:
+                    subscription.reset = True  # Id inconnu (autre processus, redémarrage)
+                elif buffer is not None:
+                    replay = [item for item in buffer.events if item[0] > since]
+                    # Des événements postérieurs à `since` sont déjà sortis du tampon
+                    subscription.reset = buffer.evicted_id > since
+            self._subscribers.setdefault(account_id, set()).add(subscription)
+        VEHICLE_EVENT_SUBSCRIBERS.inc()
+
+        replay = [item for item in replay if subscription.matches(item[1])]
+        if len(replay) > subscription.queue.maxsize:
+            replay = replay[-subscription.queue.maxsize:]
+            subscription.reset = True
+        for item in replay:
+            subscription._put(item)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.account_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.account_id]
+        VEHICLE_EVENT_SUBSCRIBERS.dec()
+
+
+vehicle_events = VehicleEventBus()
@@ -1,8 +1,18 @@
 from __future__ import annotations
+import hashlib
 import httpx
-from typing import Any, Dict, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from app.core import json_codec
 from app.core.settings import settings
 from app.tesla.vcp import VehicleCommandProtocol, CommandStatus, VCPError
+from app.tesla.commands import command_queue
+from app.tesla.wake import wake_coordinator, is_asleep_error
+from app.core.memory_store import get_memory_store
+from app.services.proxy_cache import proxy_cache
+
+# id Fleet API -> vehicle_id interne (utilisé par VCP), stable pour un véhicule donné
+_internal_ids = get_memory_store("vehicle_internal_ids", default_ttl=settings.VEHICLE_ID_CACHE_TTL_SECONDS)
 
 class TeslaClient:
     def __init__(self, base_url: Optional[str]=None, access_token: Optional[str]=None):
@@ -47,6 +57,31 @@ class TeslaClient:
             raise httpx.HTTPStatusError(f"{resp.status_code} {resp.reason_phrase}: {await self._safe_text(resp)}", request=None, response=resp)
         return resp
 
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, *, json: Any = None, params: dict | None = None, headers: Dict[str, str] | None = None) -> AsyncIterator[httpx.Response]:
+        """
+        Requête en mode flux : la réponse est rendue sans lire son corps
+        (resp.aiter_raw() pour relayer les octets tels quels). Même fallback 421
+        que request() ; la connexion est fermée à la sortie du contexte.
+        """
+        url = f"{self.base_url}{path}"
+        async with httpx.AsyncClient(timeout=settings.HTTP_TIMEOUT_SECONDS, http2=True) as client:
+            for attempt in range(2):
+                req = client.build_request(method, url, headers={**self._headers(), **(headers or {})}, json=json, params=params)
+                resp = await client.send(req, stream=True)
+                if resp.status_code == 421 and attempt == 0:
+                    # Mauvaise région : on rejoue sur la région indiquée (ou l'autre)
+                    loc = resp.headers.get("location")
+                    await resp.aclose()
+                    alt = settings.TESLA_AUDIENCE_NA if self.base_url.startswith(settings.TESLA_AUDIENCE_EU) else settings.TESLA_AUDIENCE_EU
+                    url = loc or f"{alt.rstrip('/')}{path}"
+                    continue
+                try:
+                    yield resp
+                finally:
+                    await resp.aclose()
+                return
+
     async def _safe_text(self, resp: httpx.Response) -> str:
         try:
             t = resp.text
@@ -66,30 +101,52 @@ class TeslaClient:
         path = settings.TESLA_VEHICLES_PATH
         params = {"page": page, "page_size": page_size}
         resp = await self.request("GET", path, params=params)
-        return resp.json()
+        # Décodage direct des octets par le codec de l'application (orjson si installé)
+        data = json_codec.loads(resp.content)
+        # La liste donne l'état de chaque véhicule sans les réveiller
+        for vehicle in data.get("response") or []:
+            if isinstance(vehicle, dict):
+                wake_coordinator.observe(vehicle.get("id"), vehicle.get("state"))
+                proxy_cache.remember_vehicle(vehicle.get("id"), vehicle.get("vin"))
+        return data
 
     async def partner_fleet_telemetry_errors(self) -> dict:
         resp = await self.request("GET", "/api/1/partner_accounts/fleet_telemetry_errors")
         return resp.json()
     
-    async def wake_up(self, vehicle_id: str) -> dict:
-        status = await self._run_vcp(vehicle_id, "wake_up")
-        return {"success": status.success, "error": status.error, "response": status.raw}
+    async def wake_up(self, vehicle_id: str, wait: bool = False) -> dict:
+        """
+        Réveille le véhicule (un seul wake_up en cours par véhicule, voir WakeCoordinator).
+        wait=False : rend la main dès que Tesla a accepté le wake_up (success=False avec
+        l'erreur s'il est refusé) ; le suivi jusqu'à l'état online continue en arrière-plan.
+        wait=True : attend l'état online (VCPError si le réveil échoue ou expire).
+        """
+        try:
+            if wait:
+                state = await wake_coordinator.ensure_online(self, vehicle_id)
+            else:
+                try:
+                    state = await wake_coordinator.send_wake(self, vehicle_id)
+                except (VCPError, httpx.HTTPError) as exc:
+                    return {"success": False, "error": str(exc) or exc.__class__.__name__, "response": {"state": wake_coordinator.known_state(vehicle_id)}}
+        finally:
+            proxy_cache.vehicle_command(str(vehicle_id), "wake_up")
+        return {"success": True, "error": None, "response": {"state": state}}
 
     async def door_lock(self, vehicle_id: str) -> dict:
-        status = await self._run_vcp(vehicle_id, "door_lock")
+        status = await self.run_vcp(vehicle_id, "door_lock")
         return {"success": status.success, "error": status.error, "response": status.raw}
 
     async def door_unlock(self, vehicle_id: str) -> dict:
-        status = await self._run_vcp(vehicle_id, "door_unlock")
+        status = await self.run_vcp(vehicle_id, "door_unlock")
         return {"success": status.success, "error": status.error, "response": status.raw}
 
     async def charge_start(self, vehicle_id: str) -> dict:
-        status = await self._run_vcp(vehicle_id, "charge_start")
+        status = await self.run_vcp(vehicle_id, "charge_start")
         return {"success": status.success, "error": status.error, "response": status.raw}
 
     async def charge_stop(self, vehicle_id: str) -> dict:
-        status = await self._run_vcp(vehicle_id, "charge_stop")
+        status = await self.run_vcp(vehicle_id, "charge_stop")
         return {"success": status.success, "error": status.error, "response": status.raw}
     
     async def partner_register(self, domain: str, public_key_url: str | None = None) -> dict:
@@ -105,24 +162,69 @@ class TeslaClient:
         return resp.json()
 
     async def _resolve_internal_vehicle_id(self, vehicle_id: str) -> str:
+        cached = _internal_ids.get(str(vehicle_id))
+        if cached:
+            return cached
         try:
             resp = await self.request("GET", f"/api/1/vehicles/{vehicle_id}")
             data = resp.json()
+            wake_coordinator.observe(vehicle_id, data.get("response", {}).get("state"))
+            proxy_cache.remember_vehicle(data.get("response", {}).get("id"), data.get("response", {}).get("vin"))
             internal_id = data.get("response", {}).get("vehicle_id")
             if not internal_id:
                 raise VCPError("vehicle_id introuvable dans la réponse Tesla")
+            remember_internal_vehicle_id(vehicle_id, internal_id)
             return str(internal_id)
         except httpx.HTTPStatusError as exc:
             raise VCPError(f"Impossible de récupérer les informations du véhicule {vehicle_id}: {exc}") from exc
 
-    async def _run_vcp(
+    async def run_vcp(
         self,
         vehicle_id: str,
         command_name: str,
         command_params: dict | None = None,
+        *,
+        internal_id: str | None = None,
+        timeout: float = 20.0,
     ) -> CommandStatus:
+        """
+        Exécute une commande VCP via la file du véhicule.
+        `internal_id` (vehicle_id interne, ex: depuis le cache Supabase) évite l'appel GET /vehicles/{id}.
+        """
         if not self.access_token:
             raise VCPError("Access token requis pour exécuter une commande VCP")
-        vcp = VehicleCommandProtocol(access_token=self.access_token, region=self.region)
-        internal_id = await self._resolve_internal_vehicle_id(vehicle_id)
-        return await vcp.execute(vehicle_id=internal_id, command_name=command_name, command_params=command_params)
+
+        wake_first = settings.WAKE_BEFORE_COMMANDS and command_name != "wake_up"
+
+        async def run() -> CommandStatus:
+            vcp = VehicleCommandProtocol(access_token=self.access_token, region=self.region)
+            target_id = internal_id or await self._resolve_internal_vehicle_id(vehicle_id)
+            if wake_first:
+                # Les commandes suivantes attendent dans la file pendant le réveil
+                await wake_coordinator.ensure_online(self, vehicle_id)
+            try:
+                status = await vcp.execute(vehicle_id=target_id, command_name=command_name, command_params=command_params, timeout=timeout)
+                asleep = not status.success and is_asleep_error(status.error)
+            except VCPError as exc:
+                if not (wake_first and is_asleep_error(str(exc))):
+                    raise
+                asleep = True
+            if wake_first and asleep:
+                # La voiture s'est endormie depuis le dernier état observé : réveil puis une seule relance
+                wake_coordinator.forget(vehicle_id)
+                await wake_coordinator.ensure_online(self, vehicle_id)
+                status = await vcp.execute(vehicle_id=target_id, command_name=command_name, command_params=command_params, timeout=timeout)
+            return status
+
+        # Une file par véhicule : ordre garanti, lock/unlock et doublons fusionnés
+        try:
+            owner = hashlib.sha256(self.access_token.encode()).hexdigest()[:16]
+            return await command_queue.submit(str(vehicle_id), command_name, run, command_params, owner=owner)
+        finally:
+            # Même en échec, l'état du véhicule a pu changer : les GET proxy concernés sont relus
+            proxy_cache.vehicle_command(str(vehicle_id), command_name)
+
+
+def remember_internal_vehicle_id(vehicle_id: str, internal_id: str | int) -> None:
+    """Mémorise la correspondance id Fleet API -> vehicle_id interne (ex: lors d'une synchro)."""
+    _internal_ids.set(str(vehicle_id), str(internal_id))
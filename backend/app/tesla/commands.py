@@ -0,0 +1,263 @@
+"""
+File de commandes par véhicule.
+
+Les commandes d'un même véhicule sont exécutées une par une, dans l'ordre
+d'arrivée. Tant qu'une commande attend son tour elle peut être fusionnée :
+- lock/unlock et charge start/stop : la dernière demande l'emporte, la
+  précédente n'est pas envoyée. Ses appelants sont départagés quand la gagnante
+  part : ceux qui demandaient le même état (lock, unlock puis lock) reçoivent
+  son résultat, les autres un statut "superseded" ;
+- commande identique déjà en attente (double clic, relance) : l'appelant
+  partage le résultat de celle déjà en file, à condition qu'elle ait été
+  soumise avec le même token (`owner`) : un appelant ne reçoit jamais le
+  résultat d'une commande autorisée par le token d'un autre utilisateur.
+  Le remplacement (dernière demande l'emporte) s'applique, lui, quel que soit
+  l'appelant : c'est l'état final demandé pour le véhicule qui compte. Une
+  demande du même état par un autre token reste en file pour son propre compte.
+
+Les réveils ne passent pas par cette file (voir app/tesla/wake.py).
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.tesla.vcp import CommandStatus
+
+logger = logging.getLogger(__name__)
+
+# Commandes mutuellement exclusives : une seule par groupe peut attendre dans la file
+COALESCE_GROUPS: Dict[str, str] = {
+    "door_lock": "doors",
+    "door_unlock": "doors",
+    "charge_start": "charging",
+    "charge_stop": "charging",
+}
+
+COMMAND_QUEUE_DEPTH = Gauge(
+    "vehicle_command_queue_depth",
+    "Commandes véhicule en attente d'exécution (tous véhicules)",
+)
+COMMAND_QUEUE_WAIT = Histogram(
+    "vehicle_command_queue_wait_seconds",
+    "Temps passé dans la file avant exécution de la commande",
+    ["command"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+COMMAND_QUEUE_COALESCED = Counter(
+    "vehicle_command_queue_coalesced_total",
+    "Commandes fusionnées avant exécution (duplicate = identique déjà en file, superseded = remplacée)",
+    ["command", "reason"],
+)
+
+Runner = Callable[[], Awaitable[CommandStatus]]
+
+
+@dataclass
+class _QueuedCommand:
+    command_name: str
+    command_params: Dict[str, Any]
+    runner: Runner
+    owner: Optional[str] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    waiters: List[asyncio.Future] = field(default_factory=list)
+    # Commandes remplacées par celle-ci, d'un autre état : en échec quand elle part
+    displaced: List["_QueuedCommand"] = field(default_factory=list)
+
+    @property
+    def group(self) -> Optional[str]:
+        return COALESCE_GROUPS.get(self.command_name)
+
+    def same_intent(self, other: "_QueuedCommand") -> bool:
+        return self.command_name == other.command_name and self.command_params == other.command_params
+
+
+class _VehicleQueue:
+    def __init__(self, vehicle_id: str):
+        self.vehicle_id = vehicle_id
+        self.pending: List[_QueuedCommand] = []
+        self.running: Optional[_QueuedCommand] = None
+        self.worker: Optional[asyncio.Task] = None
+
+
+class VehicleCommandQueue:
+    """Une file (et une tâche d'exécution) par véhicule, créée à la demande."""
+
+    def __init__(self):
+        self._queues: Dict[str, _VehicleQueue] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def submit(
+        self,
+        vehicle_id: str,
+        command_name: str,
+        runner: Runner,
+        command_params: Optional[Dict[str, Any]] = None,
+        owner: Optional[str] = None,
+    ) -> CommandStatus:
+        """
+        Met la commande en file et attend son résultat (ou celui de la commande qui l'a absorbée).
+        `owner` identifie le token qui autorise la commande : seuls les doublons du même owner sont fusionnés.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Files créées dans une autre boucle (tests, rechargement) : inutilisables ici
+            self._queues = {}
+            self._loop = loop
+
+        queue = self._queues.get(vehicle_id)
+        if queue is None:
+            queue = self._queues[vehicle_id] = _VehicleQueue(vehicle_id)
+
+        future = loop.create_future()
+        command_params = command_params or {}
+        self._enqueue(queue, _QueuedCommand(command_name, command_params, runner, owner=owner, waiters=[future]))
+
+        if queue.worker is None or queue.worker.done():
+            queue.worker = loop.create_task(self._drain(queue), name=f"vehicle-cmd-queue-{str(vehicle_id)[-6:]}")
+        return await future
+
+    def _enqueue(self, queue: _VehicleQueue, cmd: _QueuedCommand) -> None:
+        for queued in queue.pending:
+            if queued.same_intent(cmd) and queued.owner == cmd.owner:
+                # Doublon : on partage le résultat de la commande déjà en file
+                queued.waiters.extend(cmd.waiters)
+                COMMAND_QUEUE_COALESCED.labels(cmd.command_name, "duplicate").inc()
+                return
+        if cmd.group is not None:
+            for queued in list(queue.pending):
+                if queued.group != cmd.group or queued.same_intent(cmd):
+                    continue
+                # La dernière demande l'emporte (ex: unlock après lock)
+                queue.pending.remove(queued)
+                COMMAND_QUEUE_DEPTH.dec()
+                COMMAND_QUEUE_COALESCED.labels(queued.command_name, "superseded").inc()
+                displaced, queued.displaced = [queued, *queued.displaced], []
+                for previous in displaced:
+                    if not previous.same_intent(cmd):
+                        cmd.displaced.append(previous)
+                    elif previous.owner == cmd.owner:
+                        # Même état demandé à nouveau (lock, unlock, lock) : résultat partagé
+                        cmd.waiters.extend(previous.waiters)
+                    else:
+                        queue.pending.append(previous)
+                        COMMAND_QUEUE_DEPTH.inc()
+        queue.pending.append(cmd)
+        COMMAND_QUEUE_DEPTH.inc()
+
+    @staticmethod
+    def _fail_displaced(cmd: _QueuedCommand) -> None:
+        superseded = CommandStatus(
+            success=False,
+            error=f"superseded by {cmd.command_name}",
+            raw={"superseded_by": cmd.command_name},
+        )
+        for previous in cmd.displaced:
+            for waiter in previous.waiters:
+                if not waiter.done():
+                    waiter.set_result(superseded)
+        cmd.displaced = []
+
+    async def _drain(self, queue: _VehicleQueue) -> None:
+        try:
+            while queue.pending:
+                cmd = queue.pending.pop(0)
+                COMMAND_QUEUE_DEPTH.dec()
+                COMMAND_QUEUE_WAIT.labels(cmd.command_name).observe(time.monotonic() - cmd.enqueued_at)
+                self._fail_displaced(cmd)
+                waiters = [w for w in cmd.waiters if not w.done()]
+                if not waiters:
+                    # Tous les appelants sont partis (requêtes annulées) : inutile d'envoyer
+                    continue
+                queue.running = cmd
+                try:
+                    result = await cmd.runner()
+                except Exception as exc:
+                    for waiter in cmd.waiters:
+                        if not waiter.done():
+                            waiter.set_exception(exc)
+                else:
+                    for waiter in cmd.waiters:
+                        if not waiter.done():
+                            waiter.set_result(result)
+                finally:
+                    queue.running = None
+        finally:
+            if not queue.pending and self._queues.get(queue.vehicle_id) is queue:
+                self._queues.pop(queue.vehicle_id, None)
+
+    def depth(self, vehicle_id: str) -> int:
+        """Commandes en attente (hors commande en cours) pour ce véhicule."""
+        queue = self._queues.get(vehicle_id)
+        return len(queue.pending) if queue else 0
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            vehicle_id: {
+                "pending": [c.command_name for c in q.pending],
+                "running": q.running.command_name if q.running else None,
+            }
+            for vehicle_id, q in self._queues.items()
+        }
+
+
+command_queue = VehicleCommandQueue()
+
+
+async def run_batch(
+    targets: Iterable[Tuple[str, str]],
+    execute: Callable[[str, str], Awaitable[Dict[str, Any]]],
+    *,
+    concurrency: int,
+    per_region: int,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Exécute `execute(region, vehicle_id)` pour chaque (région, vehicle_id) et produit
+    les résultats dans l'ordre de complétion.
+
+    - `concurrency` borne le nombre total d'exécutions simultanées ;
+    - chaque région a au plus `per_region` workers, qui se partagent la concurrence
+      globale via un sémaphore FIFO : une région avec 300 véhicules n'affame pas
+      une région qui en a 3.
+    Une exception de `execute` produit un résultat {"success": False, "error": ...}.
+    """
+    by_region: Dict[str, Deque[str]] = {}
+    for region, vehicle_id in targets:
+        by_region.setdefault(region, deque()).append(vehicle_id)
+
+    results: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def worker(region: str, pending: Deque[str]) -> None:
+        while pending:
+            vehicle_id = pending.popleft()
+            started = time.monotonic()
+            async with slots:
+                try:
+                    result = await execute(region, vehicle_id)
+                except Exception as exc:
+                    result = {"success": False, "error": str(exc) or exc.__class__.__name__}
+            result.setdefault("vehicle_id", vehicle_id)
+            result.setdefault("region", region)
+            result["elapsed_ms"] = int((time.monotonic() - started) * 1000)
+            await results.put(result)
+
+    workers = [
+        asyncio.create_task(worker(region, pending), name=f"batch-{region}-{i}")
+        for region, pending in by_region.items()
+        for i in range(min(max(1, per_region), len(pending)))
+    ]
+    remaining = sum(len(p) for p in by_region.values())
+    try:
+        for _ in range(remaining):
+            yield await results.get()
+    finally:
+        # Client déconnecté : on abandonne les commandes pas encore parties
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
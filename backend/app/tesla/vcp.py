@@ -1,30 +1,117 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import hashlib
+import time
 import uuid
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
+import jwt
 import websockets
+from prometheus_client import Counter, Histogram
 from pydantic import BaseModel
 
+from app.core import json_codec
 from app.core.settings import settings
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+VCP_PHASE_SECONDS = Histogram(
+    "vcp_phase_seconds",
+    "Durée des phases d'une commande VCP (connect = handshake websocket, connection_info = "
+    "attente du connection_id, first_status = envoi -> premier command_status, response = envoi -> command_response)",
+    ["phase", "region", "command"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30),
+)
+VCP_ERRORS = Counter(
+    "vcp_command_errors_total",
+    "Échecs de commandes VCP par type (timeout, handshake, websocket, closed, protocol, rejected)",
+    ["region", "command", "type"],
+)
+
+
 class VCPError(RuntimeError):
     pass
 
 
+class _Phases:
+    """Chronométrage des phases d'une commande VCP (labels région + commande)."""
+
+    def __init__(self, region: str | None, command: str):
+        self.region = (region or "").lower()
+        self.command = command
+        self.sent_at: Optional[float] = None
+        self.status_seen = False
+
+    def observe(self, phase: str, started: float) -> None:
+        VCP_PHASE_SECONDS.labels(phase, self.region, self.command).observe(time.monotonic() - started)
+
+    def sent(self) -> None:
+        self.sent_at = time.monotonic()
+
+    def status(self) -> None:
+        if not self.status_seen and self.sent_at is not None:
+            self.status_seen = True
+            self.observe("first_status", self.sent_at)
+
+    def response(self, result: "CommandStatus") -> "CommandStatus":
+        if self.sent_at is not None:
+            self.observe("response", self.sent_at)
+        if not result.success:
+            self.error("rejected")
+        return result
+
+    def error(self, kind: str) -> None:
+        VCP_ERRORS.labels(self.region, self.command, kind).inc()
+
+
 class CommandStatus(BaseModel):
     success: bool
     error: Optional[str] = None
     raw: Dict[str, Any]
 
 
+def _command_request(
+    connection_id: str,
+    vehicle_id: str,
+    command_name: str,
+    command_params: Dict[str, Any],
+) -> Tuple[str, Dict[str, Any]]:
+    request_id = str(uuid.uuid4())
+    payload = {
+        "message_type": "command_request",
+        "message_id": str(uuid.uuid4()),
+        "command_request": {
+            "request_id": request_id,
+            "connection_id": connection_id,
+            "command_name": command_name,
+            "command_params": command_params,
+            "deliver_to_vehicle": True,
+            "response_required": True,
+            "vehicle_id": str(vehicle_id),
+        },
+    }
+    return request_id, payload
+
+
+def _command_status(data: Dict[str, Any], region: str | None, vehicle_id: str) -> CommandStatus:
+    cmd_resp = data.get("command_response", {})
+    status = cmd_resp.get("status") or cmd_resp.get("result")
+    success = (status or "").lower() in {"success", "succeeded", "ok"}
+    error = None if success else cmd_resp.get("error") or status
+    logger.debug(
+        "VCP command_response (region=%s, vehicle_suffix=%s, success=%s, status=%s)",
+        region,
+        str(vehicle_id)[-6:],
+        success,
+        status,
+    )
+    return CommandStatus(success=success, error=error, raw=data)
+
+
 @dataclass
 class VehicleCommandProtocol:
     access_token: str
@@ -67,6 +154,37 @@ class VehicleCommandProtocol:
             ping_interval=None,
         )
 
+    async def _open(self, vehicle_id: str, timeout: float, phases: _Phases):
+        """Handshake websocket puis connection_info, chaque phase chronométrée. Retourne (ws, connection_id)."""
+        started = time.monotonic()
+        ws = await asyncio.wait_for(self._connect(vehicle_id), timeout=timeout)
+        phases.observe("connect", started)
+        started = time.monotonic()
+        try:
+            connection_id = await self._read_connection_info(ws, vehicle_id, timeout)
+        except BaseException:
+            await ws.close()
+            raise
+        phases.observe("connection_info", started)
+        return ws, connection_id
+
+    async def _read_connection_info(self, ws, vehicle_id: str, timeout: float) -> str:
+        """Premier message du serveur : connection_info (contient le connection_id)."""
+        connection_info = await asyncio.wait_for(ws.recv(), timeout=timeout)
+        info = json_codec.loads(connection_info)
+        if info.get("message_type") != "connection_info":
+            raise VCPError(f"Unexpected first message: {info}")
+        connection_id = info.get("connection_info", {}).get("connection_id")
+        if not connection_id:
+            raise VCPError("Missing connection_id in connection_info")
+        logger.debug(
+            "VCP connection established (region=%s, vehicle_suffix=%s, connection_id=%s)",
+            self.region,
+            str(vehicle_id)[-6:],
+            connection_id,
+        )
+        return connection_id
+
     async def execute(
         self,
         vehicle_id: str,
@@ -76,59 +194,42 @@ class VehicleCommandProtocol:
         timeout: float = 20.0,
     ) -> CommandStatus:
         command_params = command_params or {}
+        if settings.VCP_SESSION_POOL_ENABLED:
+            while True:
+                session = vcp_session_pool.session_for(self.access_token, self.region, str(vehicle_id))
+                try:
+                    return await session.execute(command_name, command_params, timeout=timeout)
+                except _SessionRetired:
+                    continue  # Session fermée par le pool entre-temps : on en prend une neuve
+        return await self._execute_once(vehicle_id, command_name, command_params, timeout=timeout)
+
+    async def _execute_once(
+        self,
+        vehicle_id: str,
+        command_name: str,
+        command_params: Dict[str, Any],
+        *,
+        timeout: float = 20.0,
+    ) -> CommandStatus:
+        """Ancien mode : un websocket dédié, ouvert puis fermé pour cette seule commande."""
+        phases = _Phases(self.region, command_name)
         try:
-            async with await self._connect(vehicle_id) as ws:
-                connection_info = await asyncio.wait_for(ws.recv(), timeout=timeout)
-                info = json.loads(connection_info)
-                if info.get("message_type") != "connection_info":
-                    raise VCPError(f"Unexpected first message: {info}")
-                connection_id = info.get("connection_info", {}).get("connection_id")
-                if not connection_id:
-                    raise VCPError("Missing connection_id in connection_info")
-                logger.debug(
-                    "VCP connection established (region=%s, vehicle_suffix=%s, connection_id=%s)",
-                    self.region,
-                    str(vehicle_id)[-6:],
-                    connection_id,
-                )
-
-                request_id = str(uuid.uuid4())
-                message_id = str(uuid.uuid4())
-                payload = {
-                    "message_type": "command_request",
-                    "message_id": message_id,
-                    "command_request": {
-                        "request_id": request_id,
-                        "connection_id": connection_id,
-                        "command_name": command_name,
-                        "command_params": command_params,
-                        "deliver_to_vehicle": True,
-                        "response_required": True,
-                        "vehicle_id": str(vehicle_id),
-                    },
-                }
-                await ws.send(json.dumps(payload))
+            ws, connection_id = await self._open(vehicle_id, timeout, phases)
+            async with ws:
+                _request_id, payload = _command_request(connection_id, vehicle_id, command_name, command_params)
+                await ws.send(json_codec.dumps_str(payload))
+                phases.sent()
 
                 while True:
                     raw_msg = await asyncio.wait_for(ws.recv(), timeout=timeout)
-                    data = json.loads(raw_msg)
+                    data = json_codec.loads(raw_msg)
                     msg_type = data.get("message_type")
 
                     if msg_type == "command_response":
-                        cmd_resp = data.get("command_response", {})
-                        status = cmd_resp.get("status") or cmd_resp.get("result")
-                        success = (status or "").lower() in {"success", "succeeded", "ok"}
-                        error = None if success else cmd_resp.get("error") or status
-                        logger.debug(
-                            "VCP command_response (region=%s, vehicle_suffix=%s, success=%s, status=%s)",
-                            self.region,
-                            str(vehicle_id)[-6:],
-                            success,
-                            status,
-                        )
-                        return CommandStatus(success=success, error=error, raw=data)
+                        return phases.response(_command_status(data, self.region, vehicle_id))
 
                     if msg_type == "command_status":
+                        phases.status()
                         # Interim status update; continue to wait
                         logger.debug(
                             "VCP command_status update (region=%s, vehicle_suffix=%s, payload=%s)",
@@ -142,9 +243,14 @@ class VehicleCommandProtocol:
                         err = data.get("error", {}).get("message") or "Unknown VCP error"
                         raise VCPError(err)
 
+        except VCPError:
+            phases.error("protocol")
+            raise
         except asyncio.TimeoutError as exc:
+            phases.error("timeout")
             raise VCPError("Vehicle command timed out") from exc
         except websockets.InvalidStatusCode as exc:
+            phases.error("handshake")
             logger.error(
                 "VCP handshake failed (region=%s, vehicle_suffix=%s, status=%s)",
                 self.region,
@@ -153,6 +259,7 @@ class VehicleCommandProtocol:
             )
             raise VCPError(f"WebSocket handshake failed: HTTP {getattr(exc, 'status_code', '?')}") from exc
         except websockets.WebSocketException as exc:
+            phases.error("websocket")
             logger.error(
                 "VCP websocket error (region=%s, vehicle_suffix=%s): %s",
                 self.region,
@@ -163,3 +270,271 @@ class VehicleCommandProtocol:
 
         raise VCPError("No command response received")
 
+
+def _token_subject(access_token: str) -> str:
+    """`sub` du token Tesla (sans vérification) ; à défaut, empreinte du token."""
+    try:
+        sub = jwt.decode(access_token, options={"verify_signature": False}).get("sub")
+        if sub:
+            return str(sub)
+    except Exception:
+        pass
+    return hashlib.sha256(access_token.encode()).hexdigest()[:32]
+
+
+class VCPSession:
+    """
+    Websocket VCP persistant pour un véhicule.
+
+    Une tâche de lecture unique reçoit tous les messages et les route vers la
+    commande en attente correspondante (par request_id) : plusieurs commandes
+    peuvent être en vol sur le même socket. En cas de fermeture, les commandes
+    en vol échouent et la commande suivante rouvre la connexion.
+    """
+
+    def __init__(self, access_token: str, region: str | None, vehicle_id: str):
+        self.access_token = access_token
+        self.region = region
+        self.vehicle_id = vehicle_id
+        self.last_used = time.monotonic()
+        self._ws = None
+        self._connection_id: Optional[str] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._phases: Dict[str, _Phases] = {}
+        self._connect_lock = asyncio.Lock()
+        self._loop = asyncio.get_running_loop()
+        self._active = 0  # Commandes en cours, connexion comprise (avant l'entrée dans _pending)
+        self.retired = False  # Retirée du pool : ne doit plus ouvrir de socket
+
+    @property
+    def connected(self) -> bool:
+        return self._reader is not None and not self._reader.done()
+
+    @property
+    def idle(self) -> bool:
+        return not self._pending and not self._active
+
+    async def execute(
+        self,
+        command_name: str,
+        command_params: Dict[str, Any],
+        *,
+        timeout: float = 20.0,
+    ) -> CommandStatus:
+        if self.retired:
+            raise _SessionRetired()
+        self.last_used = time.monotonic()
+        self._active += 1
+        phases = _Phases(self.region, command_name)
+        try:
+            try:
+                return await self._execute(command_name, command_params, timeout, phases)
+            except _SendFailed:
+                # Socket fermé par Tesla entre deux commandes : une seule reconnexion
+                await self.close()
+                return await self._execute(command_name, command_params, timeout, phases)
+        except _SendFailed as exc:
+            phases.error("closed")
+            raise VCPError("VCP websocket closed before the command was sent") from exc
+        except _SocketClosed:
+            phases.error("closed")
+            raise
+        except VCPError:
+            phases.error("protocol")
+            raise
+        except asyncio.TimeoutError as exc:
+            phases.error("timeout")
+            raise VCPError("Vehicle command timed out") from exc
+        except websockets.InvalidStatusCode as exc:
+            phases.error("handshake")
+            logger.error(
+                "VCP handshake failed (region=%s, vehicle_suffix=%s, status=%s)",
+                self.region,
+                self.vehicle_id[-6:],
+                getattr(exc, "status_code", "?"),
+            )
+            raise VCPError(f"WebSocket handshake failed: HTTP {getattr(exc, 'status_code', '?')}") from exc
+        except websockets.WebSocketException as exc:
+            phases.error("websocket")
+            await self.close()
+            raise VCPError(f"WebSocket error: {exc}") from exc
+        finally:
+            self._active -= 1
+            self.last_used = time.monotonic()
+
+    async def _execute(self, command_name: str, command_params: Dict[str, Any], timeout: float, phases: _Phases) -> CommandStatus:
+        await self._ensure_connected(timeout, phases)
+        request_id, payload = _command_request(self._connection_id, self.vehicle_id, command_name, command_params)
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        self._phases[request_id] = phases
+        try:
+            try:
+                await self._ws.send(json_codec.dumps_str(payload))
+            except websockets.ConnectionClosed as exc:
+                raise _SendFailed() from exc
+            phases.sent()
+            return phases.response(await asyncio.wait_for(future, timeout=timeout))
+        finally:
+            self._pending.pop(request_id, None)
+            self._phases.pop(request_id, None)
+
+    async def _ensure_connected(self, timeout: float, phases: _Phases) -> None:
+        if self.connected:
+            return
+        async with self._connect_lock:
+            if self.connected:
+                return
+            if self.retired:
+                # Pas de socket orphelin : une session retirée n'est plus fermée par personne
+                raise _SessionRetired()
+            vcp = VehicleCommandProtocol(access_token=self.access_token, region=self.region)
+            # Chronométré avec la commande qui a déclenché la (re)connexion
+            ws, self._connection_id = await vcp._open(self.vehicle_id, timeout, phases)
+            self._ws = ws
+            self._reader = asyncio.create_task(self._read_loop(ws), name=f"vcp-reader-{self.vehicle_id[-6:]}")
+
+    async def _read_loop(self, ws) -> None:
+        error: Exception = _SocketClosed("VCP websocket closed")
+        try:
+            async for raw_msg in ws:
+                self._dispatch(json_codec.loads(raw_msg))
+        except websockets.ConnectionClosed as exc:
+            error = _SocketClosed(f"VCP websocket closed: {exc}")
+        except Exception as exc:
+            logger.warning("VCP reader stopped (vehicle_suffix=%s): %s", self.vehicle_id[-6:], exc)
+            error = _SocketClosed(f"VCP reader error: {exc}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    def _dispatch(self, data: Dict[str, Any]) -> None:
+        msg_type = data.get("message_type")
+        body = data.get(msg_type) if isinstance(data.get(msg_type), dict) else {}
+        request_id = body.get("request_id")
+        if request_id is None and len(self._pending) == 1:
+            # Réponse sans request_id : sans ambiguïté s'il n'y a qu'une commande en vol
+            request_id = next(iter(self._pending))
+        elif request_id is not None and request_id not in self._pending:
+            # Réponse tardive d'une commande expirée : ne doit résoudre aucune autre commande
+            logger.debug("VCP response for unknown request ignored (vehicle_suffix=%s)", self.vehicle_id[-6:])
+            return
+        future = self._pending.get(request_id)
+
+        if msg_type == "command_response":
+            if future is not None and not future.done():
+                future.set_result(_command_status(data, self.region, self.vehicle_id))
+            return
+
+        if msg_type == "command_status":
+            if request_id in self._phases:
+                self._phases[request_id].status()
+            # Interim status update; continue to wait
+            logger.debug(
+                "VCP command_status update (region=%s, vehicle_suffix=%s, payload=%s)",
+                self.region,
+                self.vehicle_id[-6:],
+                body,
+            )
+            return
+
+        if msg_type == "error":
+            err = VCPError(data.get("error", {}).get("message") or "Unknown VCP error")
+            targets = [future] if future is not None else list(self._pending.values())
+            for target in targets:
+                if not target.done():
+                    target.set_exception(err)
+
+    async def retire(self) -> None:
+        """Fermeture définitive (pool) : une commande qui tenait encore la session en prend une autre."""
+        self.retired = True
+        await self.close()
+
+    async def close(self) -> None:
+        ws, reader = self._ws, self._reader
+        self._ws = self._reader = None
+        self._connection_id = None
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        if reader is not None:
+            reader.cancel()
+            try:
+                await reader
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+class _SendFailed(Exception):
+    """Le socket était fermé au moment d'envoyer : la commande n'est pas partie."""
+
+
+class _SocketClosed(VCPError):
+    """Le socket s'est fermé alors que la commande attendait sa réponse."""
+
+
+class _SessionRetired(Exception):
+    """La session a été retirée du pool avant d'être utilisée."""
+
+
+class VCPSessionPool:
+    """Sessions VCP par (sujet du token, région, vehicle_id), fermées après VCP_SESSION_IDLE_SECONDS."""
+
+    def __init__(self):
+        self._sessions: Dict[Tuple[str, str, str], VCPSession] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def session_for(self, access_token: str, region: str | None, vehicle_id: str) -> VCPSession:
+        loop = asyncio.get_running_loop()
+        key = (_token_subject(access_token), (region or "").lower(), str(vehicle_id))
+        session = self._sessions.get(key)
+        if session is not None and (session._loop is not loop or session.retired):
+            # Session créée dans une autre boucle (tests, rechargement) ou fermée : inutilisable ici
+            self._sessions.pop(key, None)
+            session = None
+        if session is None:
+            if len(self._sessions) >= settings.VCP_SESSION_MAX_SESSIONS:
+                self._evict_oldest_idle()
+            session = VCPSession(access_token, region, str(vehicle_id))
+            self._sessions[key] = session
+        # Token rafraîchi : utilisé à la prochaine (re)connexion
+        session.access_token = access_token
+        if self._reaper is None or self._reaper.done() or self._reaper.get_loop() is not loop:
+            self._reaper = loop.create_task(self._reap_idle(), name="vcp-session-reaper")
+        return session
+
+    def _evict_oldest_idle(self) -> None:
+        idle = [(s.last_used, k) for k, s in self._sessions.items() if s.idle]
+        if idle:
+            _, key = min(idle)
+            session = self._sessions.pop(key)
+            asyncio.get_running_loop().create_task(session.retire())
+
+    async def _reap_idle(self) -> None:
+        interval = max(1.0, settings.VCP_SESSION_IDLE_SECONDS / 2)
+        while self._sessions:
+            await asyncio.sleep(interval)
+            cutoff = time.monotonic() - settings.VCP_SESSION_IDLE_SECONDS
+            for key, session in list(self._sessions.items()):
+                # Re-vérifié à chaque tour : la session a pu être reprise pendant un await
+                if session.idle and session.last_used < cutoff and self._sessions.get(key) is session:
+                    self._sessions.pop(key, None)
+                    await session.retire()
+
+    async def close_all(self) -> None:
+        sessions, self._sessions = list(self._sessions.values()), {}
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for session in sessions:
+            await session.retire()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+vcp_session_pool = VCPSessionPool()
@@ -0,0 +1,58 @@
+"""
+Récupération de la liste complète des véhicules (toutes les pages) et synchronisation du cache.
+Utilisé par les endpoints /fleet/sync et par les jobs de synchronisation en arrière-plan.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from app.tesla.client import TeslaClient
+
+if TYPE_CHECKING:
+    from app.services.vehicle_cache import VehicleCacheService
+
+
+async def fetch_all_vehicles(client: TeslaClient, page_size: int = 50) -> List[Dict[str, Any]]:
+    """Parcourt toutes les pages de /api/1/vehicles."""
+    all_vehicles: List[Dict[str, Any]] = []
+    page = 1
+    while True:
+        result = await client.vehicles_list(page=page, page_size=page_size)
+        vehicles = result.get("response", [])
+        if not vehicles:
+            break
+        
+        all_vehicles.extend(vehicles)
+        
+        pagination = result.get("pagination", {})
+        if not pagination.get("next"):
+            break
+        
+        page += 1
+    return all_vehicles
+
+
+async def sync_account_vehicles(
+    user_id: str,
+    user_token: str,
+    account_name: Optional[str] = None,
+    cache: Optional["VehicleCacheService"] = None,
+) -> Dict[str, Any]:
+    """
+    Synchronise tous les véhicules de l'utilisateur avec Tesla et met à jour le cache Supabase.
+    """
+    from app.services.vehicle_cache import VehicleCacheService
+
+    cache = cache or VehicleCacheService()
+    account_id = cache.get_active_tesla_account(user_id, account_name)
+    if not account_id:
+        account_id = cache.create_or_get_tesla_account(user_id, account_name or "Compte principal")
+
+    all_vehicles = await fetch_all_vehicles(TeslaClient(access_token=user_token))
+    if all_vehicles:
+        cache.cache_vehicles(account_id, all_vehicles)
+
+    return {
+        "success": True,
+        "vehicles_synced": len(all_vehicles),
+        "account_id": account_id,
+    }
@@ -0,0 +1,169 @@
+"""
+Coordination du réveil des véhicules.
+
+Avant une commande, le véhicule doit être "online". Le coordinateur :
+- réutilise l'état observé récemment (liste des véhicules, GET /vehicles/{id}) ;
+- n'envoie qu'un seul wake_up (REST) à la fois par véhicule, les appelants
+  concurrents attendent le même réveil ;
+- suit ensuite l'état via GET /api/1/vehicles/{id} (ne réveille pas la voiture)
+  avec un intervalle exponentiel, et rend la main dès que l'état est "online".
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from prometheus_client import Counter, Histogram
+
+from app.core.memory_store import get_memory_store
+from app.core.settings import settings
+from app.tesla.vcp import VCPError
+
+if TYPE_CHECKING:
+    from app.tesla.client import TeslaClient
+
+logger = logging.getLogger(__name__)
+
+ONLINE = "online"
+# Erreurs VCP indiquant que la voiture dort : réveil puis une nouvelle tentative
+ASLEEP_ERRORS = ("asleep", "offline", "vehicle unavailable", "vehicle_unavailable", "not online")
+
+WAKE_REQUESTS = Counter(
+    "vehicle_wake_requests_total",
+    "Demandes de réveil (sent = wake_up envoyé, coalesced = réveil en cours partagé, already_online = évité)",
+    ["result"],
+)
+WAKE_DURATION = Histogram(
+    "vehicle_wake_duration_seconds",
+    "Durée entre l'envoi du wake_up et l'état online",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 45, 60, 90),
+)
+
+_states = get_memory_store("vehicle_states", default_ttl=settings.VEHICLE_STATE_CACHE_SECONDS)
+
+
+def is_asleep_error(error: Optional[str]) -> bool:
+    text = (error or "").lower()
+    return any(marker in text for marker in ASLEEP_ERRORS)
+
+
+class WakeCoordinator:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def observe(self, vehicle_id: str | int, state: Optional[str]) -> None:
+        """Mémorise l'état d'un véhicule vu ailleurs (liste, données en cache...)."""
+        if vehicle_id is None or not state:
+            return
+        _states.set(str(vehicle_id), state, ttl=settings.VEHICLE_STATE_CACHE_SECONDS)
+
+    def forget(self, vehicle_id: str) -> None:
+        _states.delete(str(vehicle_id))
+
+    def known_state(self, vehicle_id: str) -> Optional[str]:
+        return _states.get(str(vehicle_id))
+
+    async def ensure_online(self, client: "TeslaClient", vehicle_id: str, *, timeout: float | None = None) -> str:
+        """Retourne quand le véhicule est online (VCPError si le réveil échoue ou expire)."""
+        task = self.start_wake(client, vehicle_id, timeout=timeout)
+        if task is None:
+            return ONLINE
+        return await asyncio.shield(task)
+
+    async def send_wake(self, client: "TeslaClient", vehicle_id: str) -> str:
+        """
+        Lance (ou rejoint) le réveil sans attendre l'état online, mais après la réponse
+        de Tesla au wake_up : retourne l'état annoncé, VCPError si le réveil est refusé.
+        """
+        task = self.start_wake(client, vehicle_id)
+        if task is None:
+            return ONLINE
+        return await asyncio.shield(task.wake_sent)
+
+    def start_wake(self, client: "TeslaClient", vehicle_id: str, *, timeout: float | None = None) -> Optional[asyncio.Task]:
+        """
+        Lance (ou rejoint) le réveil du véhicule sans l'attendre.
+        Retourne None si le véhicule est déjà connu comme online.
+        `task.wake_sent` est résolu dès la réponse de Tesla au wake_up.
+        """
+        vehicle_id = str(vehicle_id)
+        if self.known_state(vehicle_id) == ONLINE:
+            WAKE_REQUESTS.labels("already_online").inc()
+            return None
+
+        task = self._inflight.get(vehicle_id)
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            WAKE_REQUESTS.labels("coalesced").inc()
+            return task
+        sent = asyncio.get_running_loop().create_future()
+        # Personne n'attend forcément l'envoi : éviter "Future exception was never retrieved"
+        sent.add_done_callback(lambda f: f.cancelled() or f.exception())
+        task = asyncio.create_task(self._wake(client, vehicle_id, timeout or settings.WAKE_TIMEOUT_SECONDS, sent))
+        task.wake_sent = sent
+        self._inflight[vehicle_id] = task
+        task.add_done_callback(lambda t, vid=vehicle_id: self._done(vid, t))
+        return task
+
+    def _done(self, vehicle_id: str, task: asyncio.Task) -> None:
+        if self._inflight.get(vehicle_id) is task:
+            self._inflight.pop(vehicle_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Wake failed (vehicle_suffix=%s): %s", vehicle_id[-6:], task.exception())
+
+    async def _wake(self, client: "TeslaClient", vehicle_id: str, timeout: float, sent: asyncio.Future) -> str:
+        try:
+            state = await self._send(client, vehicle_id)
+        except BaseException as exc:
+            if not sent.done():
+                sent.set_exception(exc if isinstance(exc, Exception) else VCPError("wake_up annulé"))
+            raise
+        sent.set_result(state)
+        if state == ONLINE:
+            return ONLINE
+
+        started = time.monotonic()
+
+        delay = settings.WAKE_POLL_INITIAL_SECONDS
+        deadline = started + timeout
+        while state != ONLINE:
+            if time.monotonic() + delay > deadline:
+                raise VCPError(f"Véhicule {vehicle_id} toujours '{state}' après {int(timeout)}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.WAKE_POLL_MAX_SECONDS)
+            state = await self._fetch_state(client, vehicle_id)
+
+        WAKE_DURATION.observe(time.monotonic() - started)
+        logger.debug("Vehicle online after wake (vehicle_suffix=%s, %.1fs)", vehicle_id[-6:], time.monotonic() - started)
+        return ONLINE
+
+    async def _send(self, client: "TeslaClient", vehicle_id: str) -> str:
+        # Un état frais (GET, ne réveille pas la voiture) évite un wake inutile
+        state = await self._fetch_state(client, vehicle_id)
+        if state == ONLINE:
+            WAKE_REQUESTS.labels("already_online").inc()
+            return ONLINE
+
+        WAKE_REQUESTS.labels("sent").inc()
+        resp = await client.request("POST", settings.TESLA_CMD_WAKE.format(id=vehicle_id), allow_error=True)
+        if resp.is_error:
+            raise VCPError(f"wake_up refusé ({resp.status_code}) pour le véhicule {vehicle_id}")
+        return _state_from(resp) or state or "waking"
+
+    async def _fetch_state(self, client: "TeslaClient", vehicle_id: str) -> Optional[str]:
+        resp = await client.request("GET", f"/api/1/vehicles/{vehicle_id}", allow_error=True)
+        if resp.is_error:
+            return None
+        state = _state_from(resp)
+        self.observe(vehicle_id, state)
+        return state
+
+
+def _state_from(resp) -> Optional[str]:
+    try:
+        return (resp.json().get("response") or {}).get("state")
+    except Exception:
+        return None
+
+
+wake_coordinator = WakeCoordinator()
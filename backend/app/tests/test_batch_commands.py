@@ -0,0 +1,83 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth.supabase_auth import require_supabase_user
+from app.tesla.commands import run_batch
+from app.tesla.client import TeslaClient
+from app.tesla.vcp import CommandStatus
+
+
+@pytest.mark.asyncio
+async def test_run_batch_bounds_concurrency_per_region():
+    running = {"eu": 0, "na": 0, "total": 0}
+    peak = {"eu": 0, "na": 0, "total": 0}
+    order = []
+
+    async def execute(region, vehicle_id):
+        running[region] += 1
+        running["total"] += 1
+        peak[region] = max(peak[region], running[region])
+        peak["total"] = max(peak["total"], running["total"])
+        await asyncio.sleep(0.01)
+        running[region] -= 1
+        running["total"] -= 1
+        order.append(region)
+        if vehicle_id == "eu-3":
+            raise RuntimeError("vcp down")
+        return {"success": True}
+
+    targets = [("eu", f"eu-{i}") for i in range(20)] + [("na", f"na-{i}") for i in range(2)]
+    results = [r async for r in run_batch(targets, execute, concurrency=4, per_region=3)]
+
+    assert len(results) == 22
+    assert peak["total"] <= 4 and peak["eu"] <= 3
+    # La petite région n'attend pas la fin de la grande
+    assert order.index("na") < 10
+    failed = [r for r in results if not r["success"]]
+    assert failed == [dict(failed[0], vehicle_id="eu-3", region="eu", error="vcp down")]
+
+
+def test_batch_endpoint_streams_ndjson(monkeypatch):
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+
+    async def fake_token(user_id=None):
+        return "userTok"
+
+    async def fake_run_vcp(self, vehicle_id, command_name, command_params=None, *, internal_id=None, timeout=20.0):
+        return CommandStatus(success=vehicle_id != "2", error=None if vehicle_id != "2" else "asleep", raw={"id": vehicle_id})
+
+    monkeypatch.setattr("app.api.routes_fleet_direct.ensure_user_access_token", fake_token)
+    monkeypatch.setattr(TeslaClient, "run_vcp", fake_run_vcp)
+    try:
+        client = TestClient(app)
+        r = client.post(
+            "/api/fleet/direct/batch/command",
+            json={"command": "door_lock", "targets": [{"vehicle_id": "1"}, {"vehicle_id": "2"}, {"vehicle_id": "1"}]},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert sorted(l["vehicle_id"] for l in lines if l["type"] == "result") == ["1", "2"]
+    assert lines[-1] == {"type": "summary", "command": "door_lock", "total": 2, "succeeded": 1, "failed": 1}
+
+
+def test_batch_endpoint_rejects_unlisted_commands():
+    from typing import get_args
+    from app.schemas.fleet_batch import VehicleCommand
+    from app.tesla.commands import COALESCE_GROUPS
+
+    assert set(COALESCE_GROUPS) <= set(get_args(VehicleCommand))
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    try:
+        r = TestClient(app).post(
+            "/api/fleet/direct/batch/command",
+            json={"command": "remote_boombox", "targets": [{"vehicle_id": "1"}]},
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert r.status_code == 422
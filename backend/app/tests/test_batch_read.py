@@ -0,0 +1,70 @@
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import routes_fleet_sync
+from app.auth.supabase_auth import require_supabase_user
+from app.services.vehicle_cache import CachedPayload
+from app.tesla.client import TeslaClient
+
+
+class FakeCache:
+    def __init__(self):
+        self.calls = []
+        self.written = []
+
+    def get_active_tesla_account(self, user_id, account_name=None):
+        self.calls.append("account")
+        return "acc-1"
+
+    def get_vehicle_uuids(self, account_id, tesla_ids):
+        self.calls.append("vehicles")
+        return {t: f"uuid-{t}" for t in tesla_ids if t != "404"}
+
+    def get_cached_endpoints_bulk(self, vehicle_ids, endpoint_names):
+        self.calls.append("cache")
+        return {("uuid-1", "charge_state"): CachedPayload({"battery_level": 42}, "e1")}
+
+    def cache_endpoint_responses(self, account_id, entries, ttl_minutes=5):
+        self.written.extend(entries)
+
+
+def test_batch_read_serves_hits_and_fetches_misses_once(monkeypatch):
+    fake = FakeCache()
+    requested = []
+
+    async def fake_token(user_id=None):
+        return "userTok"
+
+    async def fake_request(self, method, path, **kwargs):
+        requested.append(path)
+        if path.endswith("/2/vehicle_state"):
+            response = httpx.Response(408, request=httpx.Request("GET", "https://x" + path))
+            raise httpx.HTTPStatusError("408 vehicle unavailable", request=response.request, response=response)
+        return httpx.Response(200, json={"response": {"path": path}})
+
+    monkeypatch.setattr(routes_fleet_sync, "ensure_user_access_token", fake_token)
+    monkeypatch.setattr(TeslaClient, "request", fake_request)
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    app.dependency_overrides[routes_fleet_sync.get_cache_service] = lambda: fake
+    try:
+        r = TestClient(app).post("/api/fleet/sync/batch/read", json={"items": [
+            {"vehicle_id": "1", "endpoint": "charge_state"},
+            {"vehicle_id": "1", "endpoint": "vehicle_state"},
+            {"vehicle_id": "2", "endpoint": "vehicle_state"},
+            {"vehicle_id": "404", "endpoint": "charge_state"},
+            {"vehicle_id": "1", "endpoint": "charge_state"},
+        ]})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert r.status_code == 200
+    body = r.json()
+    assert fake.calls == ["account", "vehicles", "cache"]
+    assert sorted(requested) == ["/api/1/vehicles/1/vehicle_state", "/api/1/vehicles/2/vehicle_state"]
+    results = {(x["vehicle_id"], x["endpoint"]): x for x in body["results"]}
+    assert results[("1", "charge_state")] == {"vehicle_id": "1", "endpoint": "charge_state", "cached": True, "response": {"battery_level": 42}}
+    assert results[("1", "vehicle_state")]["cached"] is False
+    assert results[("2", "vehicle_state")]["status_code"] == 408
+    assert results[("404", "charge_state")]["status_code"] == 404
+    assert (body["count"], body["cached"], body["fetched"], body["failed"]) == (4, 1, 1, 2)
+    assert [e["endpoint_name"] for e in fake.written] == ["vehicle_state"]
@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from app.tesla.commands import VehicleCommandQueue
+from app.tesla.vcp import CommandStatus
+
+
+def recorder(executed, name, gate=None):
+    async def run():
+        if gate is not None:
+            await gate.wait()
+        executed.append(name)
+        return CommandStatus(success=True, raw={"command": name})
+    return run
+
+
+@pytest.mark.asyncio
+async def test_commands_run_in_order_and_last_lock_state_wins():
+    queue = VehicleCommandQueue()
+    executed = []
+    gate = asyncio.Event()
+
+    first = asyncio.create_task(queue.submit("v1", "charge_start", recorder(executed, "charge_start", gate)))
+    await asyncio.sleep(0)
+    lock = asyncio.create_task(queue.submit("v1", "door_lock", recorder(executed, "door_lock")))
+    await asyncio.sleep(0)
+    unlock = asyncio.create_task(queue.submit("v1", "door_unlock", recorder(executed, "door_unlock")))
+    await asyncio.sleep(0)
+    assert queue.depth("v1") == 1
+
+    gate.set()
+    results = await asyncio.gather(first, lock, unlock)
+
+    assert executed == ["charge_start", "door_unlock"]
+    assert results[1].success is False and results[1].raw == {"superseded_by": "door_unlock"}
+    assert results[2].raw == {"command": "door_unlock"}
+    assert queue.depth("v1") == 0
+
+
+@pytest.mark.asyncio
+async def test_duplicate_commands_share_one_execution():
+    queue = VehicleCommandQueue()
+    executed = []
+    gate = asyncio.Event()
+
+    blocker = asyncio.create_task(queue.submit("v1", "door_lock", recorder(executed, "door_lock", gate)))
+    await asyncio.sleep(0)
+    honks = [asyncio.create_task(queue.submit("v1", "honk_horn", recorder(executed, "honk_horn"), owner="a")) for _ in range(3)]
+    # Même commande, autre token : exécutée séparément
+    other = asyncio.create_task(queue.submit("v1", "honk_horn", recorder(executed, "honk_horn"), owner="b"))
+    await asyncio.sleep(0)
+    gate.set()
+    await blocker
+    results = await asyncio.gather(*honks, other)
+
+    assert executed == ["door_lock", "honk_horn", "honk_horn"]
+    assert all(r.success for r in results)
+
+
+@pytest.mark.asyncio
+async def test_vehicles_are_independent_and_errors_propagate():
+    queue = VehicleCommandQueue()
+
+    async def boom():
+        raise RuntimeError("vcp down")
+
+    executed = []
+    with pytest.raises(RuntimeError):
+        await queue.submit("v1", "door_lock", boom)
+    ok = await queue.submit("v2", "door_lock", recorder(executed, "door_lock"))
+    assert ok.success and executed == ["door_lock"]
+
+
+@pytest.mark.asyncio
+async def test_superseded_caller_whose_state_wins_gets_the_result():
+    queue = VehicleCommandQueue()
+    executed = []
+    gate = asyncio.Event()
+
+    blocker = asyncio.create_task(queue.submit("v1", "charge_start", recorder(executed, "charge_start", gate)))
+    await asyncio.sleep(0)
+    # lock, unlock puis lock : l'état final demandé est celui du premier appelant
+    lock = asyncio.create_task(queue.submit("v1", "door_lock", recorder(executed, "door_lock"), owner="a"))
+    await asyncio.sleep(0)
+    unlock = asyncio.create_task(queue.submit("v1", "door_unlock", recorder(executed, "door_unlock"), owner="a"))
+    await asyncio.sleep(0)
+    relock = asyncio.create_task(queue.submit("v1", "door_lock", recorder(executed, "door_lock"), owner="a"))
+    await asyncio.sleep(0)
+    assert queue.depth("v1") == 1
+
+    gate.set()
+    await blocker
+    results = await asyncio.gather(lock, unlock, relock)
+
+    assert executed == ["charge_start", "door_lock"]
+    assert results[0].success and results[0].raw == {"command": "door_lock"}
+    assert results[1].success is False and results[1].raw == {"superseded_by": "door_lock"}
+    assert results[2].success
+
+
+@pytest.mark.asyncio
+async def test_same_state_from_another_token_runs_on_its_own():
+    queue = VehicleCommandQueue()
+    executed = []
+    gate = asyncio.Event()
+
+    blocker = asyncio.create_task(queue.submit("v1", "charge_start", recorder(executed, "charge_start", gate)))
+    await asyncio.sleep(0)
+    lock_a = asyncio.create_task(queue.submit("v1", "door_lock", recorder(executed, "lock-a"), owner="a"))
+    await asyncio.sleep(0)
+    unlock_b = asyncio.create_task(queue.submit("v1", "door_unlock", recorder(executed, "unlock-b"), owner="b"))
+    await asyncio.sleep(0)
+    lock_c = asyncio.create_task(queue.submit("v1", "door_lock", recorder(executed, "lock-c"), owner="c"))
+    await asyncio.sleep(0)
+
+    gate.set()
+    await blocker
+    results = await asyncio.gather(lock_a, unlock_b, lock_c)
+
+    assert executed == ["charge_start", "lock-a", "lock-c"]
+    assert results[0].raw == {"command": "lock-a"}
+    assert results[1].raw == {"superseded_by": "door_lock"}
+    assert results[2].raw == {"command": "lock-c"}
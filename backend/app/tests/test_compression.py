@@ -0,0 +1,99 @@
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from app.core import compression
+from app.core.compression import CompressionMiddleware, choose_encoding
+
+BIG = {"vehicles": [{"id": i, "vin": f"5YJ3E7EB{i:09d}", "state": "online"} for i in range(500)]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    compression._compressed_cache.clear()
+    calls = []
+    gzip_encoder = compression.ENCODERS["gzip"]
+
+    def counting(data):
+        calls.append(len(data))
+        return gzip_encoder(data)
+
+    monkeypatch.setitem(compression.ENCODERS, "gzip", counting)
+
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/big")
+    def big():
+        return BIG
+
+    @app.get("/big-etag")
+    def big_etag():
+        return Response(content=b"x" * 4096, media_type="application/json", headers={"ETag": '"v1"'})
+
+    @app.get("/other-etag")
+    def other_etag():
+        # Même ETag et même taille que /big-etag, corps différent
+        return Response(content=b"y" * 4096, media_type="application/json", headers={"ETag": '"v1"'})
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b'{"a":1}\n' * 200, b'{"b":2}\n' * 200]), media_type="application/x-ndjson")
+
+    return TestClient(app), calls
+
+
+def test_large_json_gzipped_and_cached(client):
+    http, calls = client
+    first = http.get("/big", headers={"Accept-Encoding": "gzip"})
+    second = http.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in first.headers["vary"].lower()
+    assert first.json() == second.json() == BIG
+    assert len(calls) == 1  # Deuxième réponse servie depuis le cache compressé
+
+
+def test_strong_etag_becomes_weak(client):
+    http, _ = client
+    response = http.get("/big-etag", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["etag"] == 'W/"v1"'
+    assert response.content == b"x" * 4096
+
+
+def test_cache_is_keyed_by_body_not_etag(client):
+    http, calls = client
+    assert http.get("/big-etag", headers={"Accept-Encoding": "gzip"}).content == b"x" * 4096
+    assert http.get("/other-etag", headers={"Accept-Encoding": "gzip"}).content == b"y" * 4096
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("path,headers", [
+    ("/small", {"Accept-Encoding": "gzip"}),
+    ("/big", {"Accept-Encoding": "identity"}),
+    ("/stream", {"Accept-Encoding": "gzip"}),
+])
+def test_not_compressed(client, path, headers):
+    http, calls = client
+    response = http.get(path, headers=headers)
+    assert "content-encoding" not in response.headers
+    assert calls == []
+
+
+def test_choose_encoding_honours_q_values():
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("deflate, gzip;q=0.5") == "gzip"
+    assert choose_encoding("*") == next(iter(compression.ENCODERS))
+    assert choose_encoding(None) is None
+
+
+def test_bodies_above_cache_limit_are_not_cached(client, monkeypatch):
+    monkeypatch.setattr(compression.settings, "COMPRESSION_CACHE_MAX_BODY_BYTES", 2048, raising=False)
+    http, calls = client
+    for _ in range(2):
+        assert http.get("/big-etag", headers={"Accept-Encoding": "gzip"}).content == b"x" * 4096
+    assert len(calls) == 2
+    assert not compression._compressed_cache.items()
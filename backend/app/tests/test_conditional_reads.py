@@ -0,0 +1,74 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import routes_fleet_supabase
+from app.auth.supabase_auth import require_supabase_user
+from app.core.etag import compute_etag, etag_matches
+from app.services.vehicle_cache import CachedPayload
+
+VEHICLES = [{"id": 1, "vin": "VIN1", "state": "online"}]
+CHARGE = {"response": {"battery_level": 80}}
+
+
+class FakeCache:
+    def __init__(self):
+        self.vehicles = CachedPayload(VEHICLES, compute_etag(VEHICLES))
+
+    def get_active_tesla_account(self, user_id, account_name=None):
+        return "acc-1"
+
+    def get_vehicle_by_tesla_id(self, account_id, tesla_id):
+        return "uuid-1"
+
+    def get_cached_vehicles_with_etag(self, account_id, max_age_minutes=5, state=None):
+        return self.vehicles
+
+    def get_cached_endpoint_with_etag(self, vehicle_id, endpoint_name):
+        return CachedPayload(CHARGE, "charge-v1")
+
+
+def make_client(fake):
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    app.dependency_overrides[routes_fleet_supabase.get_cache_service] = lambda: fake
+    return TestClient(app)
+
+
+def test_vehicles_304_until_data_changes():
+    fake = FakeCache()
+    try:
+        client = make_client(fake)
+        first = client.get("/api/fleet/supabase/vehicles")
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "private, no-cache"
+
+        again = client.get("/api/fleet/supabase/vehicles", headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["etag"] == etag
+
+        changed = [dict(VEHICLES[0], state="asleep")]
+        fake.vehicles = CachedPayload(changed, compute_etag(changed))
+        updated = client.get("/api/fleet/supabase/vehicles", headers={"If-None-Match": etag})
+        assert updated.status_code == 200
+        assert updated.json()["response"] == changed
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_endpoint_data_uses_stored_etag():
+    try:
+        client = make_client(FakeCache())
+        url = "/api/fleet/supabase/vehicles/123/data/charge_state"
+        first = client.get(url)
+        assert first.headers["etag"] == '"charge-v1"'
+        assert client.get(url, headers={"If-None-Match": 'W/"charge-v1"'}).status_code == 304
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_etag_matching():
+    assert etag_matches('"a", W/"b"', "b")
+    assert etag_matches("*", "x")
+    assert not etag_matches('"a"', "b")
+    assert not etag_matches(None, "a")
+    assert compute_etag({"a": 1}) == compute_etag({"a": 1}) != compute_etag({"a": 2})
@@ -0,0 +1,93 @@
+import json
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import routes_fleet_supabase
+from app.auth.supabase_auth import require_supabase_user
+from app.core.settings import settings
+from app.services.vehicle_cache import VehicleCacheService
+
+
+class FakeQuery:
+    """Sous-ensemble du query builder PostgREST utilisé par VehicleCacheService."""
+
+    def __init__(self, rows, log):
+        self.rows = rows
+        self.log = log
+        self._limit = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, col, value):
+        self.rows = [r for r in self.rows if r.get(col) == value]
+        return self
+
+    def gt(self, col, value):
+        self.rows = [r for r in self.rows if r[col] > value]
+        return self
+
+    def gte(self, col, value):
+        self.rows = [r for r in self.rows if r[col] >= value]
+        return self
+
+    def in_(self, col, values):
+        self.rows = [r for r in self.rows if r.get(col) in values]
+        return self
+
+    def order(self, col):
+        self.rows = sorted(self.rows, key=lambda r: r[col])
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def execute(self):
+        rows = self.rows[: self._limit] if self._limit else self.rows
+        self.log.append(len(rows))
+        return SimpleNamespace(data=rows)
+
+
+def make_service(vehicles, endpoints=()):
+    service = VehicleCacheService.__new__(VehicleCacheService)
+    service.queries = []
+    tables = {"vehicles": vehicles, "vehicle_data_cache": list(endpoints)}
+    service.supabase = SimpleNamespace(table=lambda name: FakeQuery(list(tables[name]), service.queries))
+    service.get_active_tesla_account = lambda user_id, account_name=None: "acc-1"
+    return service
+
+
+VEHICLES = [
+    {"id": f"uuid-{i}", "tesla_account_id": "acc-1", "tesla_id": 100 + i, "vin": f"VIN{i}",
+     "state": "online" if i % 2 else "asleep", "vehicle_data": {"id": 100 + i}, "last_synced_at": "2024-01-01T00:00:00"}
+    for i in range(7)
+]
+
+
+def test_iter_cached_vehicles_uses_keyset_chunks():
+    service = make_service(list(reversed(VEHICLES)))
+    chunks = list(service.iter_cached_vehicles("acc-1", chunk_size=3))
+    assert [len(c) for c in chunks] == [3, 3, 1]
+    assert [r["tesla_id"] for c in chunks for r in c] == [100 + i for i in range(7)]
+
+
+def test_export_streams_ndjson_with_filters_and_endpoint_data(monkeypatch):
+    endpoints = [{"vehicle_id": "uuid-1", "endpoint_name": "charge_state", "response_data": {"battery_level": 50}, "last_fetched_at": "t"}]
+    service = make_service(VEHICLES, endpoints)
+    monkeypatch.setattr(settings, "EXPORT_CHUNK_SIZE", 2, raising=False)
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    app.dependency_overrides[routes_fleet_supabase.get_cache_service] = lambda: service
+    try:
+        r = TestClient(app).get("/api/fleet/supabase/export", params={"state": "online", "include": "charge_state"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    vehicles = [l for l in lines if l["type"] == "vehicle"]
+    assert [v["vehicle"]["id"] for v in vehicles] == [101, 103, 105]
+    assert vehicles[0]["data"] == {"charge_state": {"response": {"battery_level": 50}, "fetched_at": "t"}}
+    assert vehicles[1]["data"] == {}
+    assert lines[-1] == {"type": "summary", "count": 3, "account_id": "acc-1"}
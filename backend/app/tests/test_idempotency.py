@@ -0,0 +1,152 @@
+import asyncio
+import pytest
+from fastapi import HTTPException, Response
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth.supabase_auth import require_supabase_user
+from app.core.settings import settings
+from app.services import idempotency
+from app.services.idempotency import run_idempotent
+from app.tesla.client import TeslaClient
+
+
+@pytest.fixture(autouse=True)
+def clear_store():
+    idempotency._local.clear()
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    sent = []
+
+    async def fake_token(user_id=None):
+        return "userTok"
+
+    async def fake_unlock(self, vehicle_id):
+        sent.append(("door_unlock", vehicle_id))
+        return {"success": True, "error": None, "response": {"result": True}}
+
+    monkeypatch.setattr("app.api.routes_fleet_direct.ensure_user_access_token", fake_token)
+    monkeypatch.setattr(TeslaClient, "door_unlock", fake_unlock)
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    yield sent
+    app.dependency_overrides.clear()
+
+
+def test_retry_with_same_key_replays_result(commands):
+    client = TestClient(app)
+    headers = {"Idempotency-Key": "k-1"}
+    first = client.post("/api/fleet/direct/vehicles/42/unlock", headers=headers)
+    retry = client.post("/api/fleet/direct/vehicles/42/unlock", headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert commands == [("door_unlock", "42")]
+
+    # Sans clé, ou avec une autre clé, la commande repart
+    client.post("/api/fleet/direct/vehicles/42/unlock")
+    client.post("/api/fleet/direct/vehicles/42/unlock", headers={"Idempotency-Key": "k-2"})
+    assert len(commands) == 3
+
+
+def test_same_key_for_another_request_is_rejected(commands):
+    client = TestClient(app)
+    client.post("/api/fleet/direct/vehicles/42/unlock", headers={"Idempotency-Key": "k-1"})
+    r = client.post("/api/fleet/direct/vehicles/43/unlock", headers={"Idempotency-Key": "k-1"})
+    assert r.status_code == 422
+    assert commands == [("door_unlock", "42")]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retry_waits_for_first_execution(monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_POLL_SECONDS", 0.01, raising=False)
+    calls = []
+
+    async def command():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"success": True}
+
+    first, retry = Response(), Response()
+    results = await asyncio.gather(
+        run_idempotent("u1", "k", {"command": "door_lock"}, first, command),
+        run_idempotent("u1", "k", {"command": "door_lock"}, retry, command),
+    )
+    assert results == [{"success": True}, {"success": True}]
+    assert len(calls) == 1
+    assert retry.headers.get("idempotent-replayed") == "true"
+
+
+@pytest.mark.asyncio
+async def test_errors_are_replayed_server_errors_included():
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        raise HTTPException(status_code=502, detail="vcp timeout")
+
+    for _ in range(3):
+        with pytest.raises(HTTPException) as exc:
+            await run_idempotent("u1", "k", {"command": "door_lock"}, Response(), failing)
+    # La commande a pu atteindre le véhicule : pas de réexécution avec la même clé
+    assert exc.value.status_code == 502
+    assert exc.value.headers == {"Idempotent-Replayed": "true"}
+    assert len(attempts) == 1
+
+
+@pytest.mark.asyncio
+async def test_pending_key_is_kept_alive_while_running(monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_PENDING_TTL_SECONDS", 0.06, raising=False)
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 0.05, raising=False)
+    monkeypatch.setattr(settings, "IDEMPOTENCY_POLL_SECONDS", 0.01, raising=False)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.25)
+        return {"success": True}
+
+    first = asyncio.ensure_future(run_idempotent("u1", "k", {"command": "door_lock"}, Response(), slow))
+    await asyncio.sleep(0.15)  # Plus de deux fois le TTL de réservation
+    with pytest.raises(HTTPException) as exc:
+        await run_idempotent("u1", "k", {"command": "door_lock"}, Response(), slow)
+    assert exc.value.status_code == 409
+    assert await first == {"success": True}
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_execution_keeps_the_reservation():
+    async def hangs():
+        await asyncio.sleep(10)
+
+    task = asyncio.ensure_future(run_idempotent("u1", "k", {"command": "door_lock"}, Response(), hangs))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert idempotency.store.get(f"{idempotency.KEY_PREFIX}u1:k")["state"] == idempotency.PENDING
+
+
+@pytest.mark.asyncio
+async def test_unreachable_redis_fails_closed(monkeypatch):
+    class DownRedis:
+        def set(self, *args, **kwargs):
+            raise ConnectionError("redis down")
+
+        def get(self, key):
+            raise ConnectionError("redis down")
+
+    calls = []
+
+    async def run():
+        calls.append(1)
+        return {"success": True}
+
+    monkeypatch.setattr(idempotency, "get_redis", lambda: DownRedis())
+    with pytest.raises(HTTPException) as exc:
+        await run_idempotent("u1", "k", {"command": "door_unlock"}, Response(), run)
+    assert exc.value.status_code == 503
+    assert calls == []
@@ -0,0 +1,58 @@
+from app.core import invalidation
+from app.core.invalidation import InvalidationBus
+from app.core.settings import settings
+
+
+class FakeListener:
+    def is_alive(self):
+        return True
+
+
+class FakePubSub:
+    def subscribe(self, **channels):
+        self.channels = channels
+
+    def run_in_thread(self, **kwargs):
+        return FakeListener()
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+
+    def pubsub(self, **kwargs):
+        return FakePubSub()
+
+    def publish(self, channel, data):
+        self.published.append(channel)
+
+
+def test_listener_started_on_later_publish_once_redis_answers(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_RECONNECT_SECONDS", 0, raising=False)
+    redis = None
+    monkeypatch.setattr(invalidation, "get_redis", lambda: redis)
+
+    bus = InvalidationBus(channel="test")
+    bus.subscribe("ns", lambda key: None)
+    assert not bus.distributed  # Redis indisponible au premier abonnement
+
+    redis = FakeRedis()
+    bus.publish("ns", "k")
+    assert bus.distributed
+    assert redis.published == ["test"]
+
+
+def test_listener_retry_is_throttled(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_RECONNECT_SECONDS", 60, raising=False)
+    calls = []
+
+    def get_redis():
+        calls.append(1)
+        return None
+
+    monkeypatch.setattr(invalidation, "get_redis", get_redis)
+    bus = InvalidationBus(channel="test")
+    bus.subscribe("ns", lambda key: None)
+    for _ in range(5):
+        bus.ensure_listener()
+    assert len(calls) == 1
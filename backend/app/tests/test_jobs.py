@@ -0,0 +1,68 @@
+import asyncio
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth.supabase_auth import require_supabase_user
+from app.services import jobs
+
+
+def test_command_job_runs_in_background_and_can_be_polled(monkeypatch):
+    calls = []
+
+    async def fake_run_command(user_id, vehicle_id, command_name, command_params, region):
+        calls.append((user_id, vehicle_id, command_name))
+        await asyncio.sleep(0.05)
+        return {"success": True, "error": None, "response": {"result": True}}
+
+    monkeypatch.setattr(jobs, "_run_command", fake_run_command)
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    try:
+        with TestClient(app) as client:
+            r = client.post("/api/fleet/jobs/commands", json={"vehicle_id": "123", "command": "door_lock"})
+            assert r.status_code == 202
+            job = r.json()
+            assert job["status"] in ("queued", "started")
+
+            for _ in range(50):
+                job = client.get(f"/api/fleet/jobs/{job['job_id']}").json()
+                if job["status"] == "finished":
+                    break
+                time.sleep(0.02)
+
+            stream = client.get(f"/api/fleet/jobs/{job['job_id']}/stream")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert job["status"] == "finished"
+    assert job["result"]["success"] is True
+    assert calls == [("u1", "123", "door_lock")]
+    assert "event: done" in stream.text
+
+
+def test_jobs_are_private_to_their_owner(monkeypatch):
+    async def failing(user_id, account_name):
+        raise RuntimeError("Tesla indisponible")
+
+    monkeypatch.setattr(jobs, "_run_sync", failing)
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    try:
+        with TestClient(app) as client:
+            job_id = client.post("/api/fleet/jobs/sync", json={}).json()["job_id"]
+            time.sleep(0.05)
+            job = client.get(f"/api/fleet/jobs/{job_id}").json()
+            app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u2"}
+            other = client.get(f"/api/fleet/jobs/{job_id}")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert job["status"] == "failed" and job["error"] == "Tesla indisponible"
+    assert other.status_code == 404
+
+
+def test_command_job_rejects_unlisted_commands():
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    try:
+        r = TestClient(app).post("/api/fleet/jobs/commands", json={"vehicle_id": "123", "command": "set_sentry_mode"})
+    finally:
+        app.dependency_overrides.clear()
+    assert r.status_code == 422
@@ -0,0 +1,53 @@
+import datetime
+import importlib
+import uuid
+import pytest
+from app.core import json_codec
+from app.core.settings import settings
+
+
+@pytest.fixture(params=["auto", "stdlib"])
+def codec(request, monkeypatch):
+    monkeypatch.setattr(settings, "JSON_CODEC", request.param, raising=False)
+    yield importlib.reload(json_codec)
+    monkeypatch.undo()
+    importlib.reload(json_codec)
+
+
+def test_roundtrip_compact_and_non_json_types(codec):
+    when = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    vid = uuid.UUID("12345678-1234-5678-1234-567812345678")
+    payload = {"vehicles": [{"id": 1, "name": "Modèle Y", "at": when, "uuid": vid}], 42: True}
+
+    data = codec.dumps(payload)
+    assert isinstance(data, bytes)
+    assert data.startswith('{"vehicles":[{"id":1,"name":"Modèle Y",'.encode())
+    decoded = codec.loads(data)
+    assert decoded["vehicles"][0]["name"] == "Modèle Y"
+    assert decoded["vehicles"][0]["uuid"] == str(vid)
+    assert decoded["vehicles"][0]["at"].startswith("2024-01-02")
+    assert decoded["42"] is True
+    assert codec.loads(codec.dumps_str(payload)) == decoded
+
+
+def test_response_class_uses_codec(codec):
+    response = codec.FastJSONResponse({"ok": True, "items": [1, 2]})
+    assert response.body == b'{"ok":true,"items":[1,2]}'
+    assert response.media_type == "application/json"
+
+
+def test_json_response_keeps_route_headers():
+    from fastapi import FastAPI, Response
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+
+    @app.get("/vehicles")
+    def vehicles(response: Response):
+        response.headers["ETag"] = '"v1"'
+        return json_codec.json_response({"response": [{"id": 1}], "count": 1}, headers_from=response)
+
+    r = TestClient(app).get("/vehicles")
+    assert r.content == b'{"response":[{"id":1}],"count":1}'
+    assert r.headers["etag"] == '"v1"'
+    assert r.headers["content-type"] == "application/json"
@@ -0,0 +1,126 @@
+import hashlib
+import hmac
+import json
+import os
+import time
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from app.keys.keypair_manager import (
+    DOMAIN_INFOTAINMENT, KeypairError, KeypairManager, SessionInfo, signature_metadata,
+)
+
+VIN = "5YJ3E1EA7KF000001"
+
+
+class SimulatedVehicle:
+    """Pair véhicule local : fournit la SessionInfo et vérifie les commandes signées."""
+
+    def __init__(self, client_public_key: bytes):
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        self.epoch = os.urandom(16)
+        self.counter = 0
+        self.started = time.time() - 1000
+        peer = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), client_public_key)
+        session_key = hashlib.sha1(self.key.exchange(ec.ECDH(), peer)).digest()[:16]
+        self.hmac_key = hmac.new(session_key, b"authenticated command", hashlib.sha256).digest()
+
+    def session_info(self) -> SessionInfo:
+        public = self.key.public_key().public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+        return SessionInfo(public_key=public, epoch=self.epoch, counter=self.counter, clock_time=int(time.time() - self.started))
+
+    def accept(self, payload: bytes, signed) -> bool:
+        if signed.epoch != self.epoch or signed.counter <= self.counter:
+            return False
+        if signed.expires_at < int(time.time() - self.started):
+            return False
+        metadata = signature_metadata(VIN, DOMAIN_INFOTAINMENT, signed.epoch, signed.expires_at, signed.counter)
+        expected = hmac.new(self.hmac_key, metadata + payload, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, signed.tag):
+            return False
+        self.counter = signed.counter
+        return True
+
+
+@pytest.fixture
+def key_path(tmp_path):
+    key = ec.generate_private_key(ec.SECP256R1())
+    path = tmp_path / "private_key.pem"
+    path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return path
+
+
+def test_signed_commands_accepted_without_new_handshake(key_path, tmp_path):
+    store = tmp_path / "sessions.json"
+    manager = KeypairManager(str(key_path), str(store))
+    vehicle = SimulatedVehicle(manager.public_key_bytes())
+    manager.update_session(VIN, DOMAIN_INFOTAINMENT, vehicle.session_info())
+
+    for payload in (b"charge_start", b"charge_stop", b"charge_start"):
+        assert vehicle.accept(payload, manager.sign(VIN, DOMAIN_INFOTAINMENT, payload))
+    # Rejeu refusé
+    replay = manager.sign(VIN, DOMAIN_INFOTAINMENT, b"x")
+    assert vehicle.accept(b"x", replay) and not vehicle.accept(b"x", replay)
+
+    # Aucun secret sur disque
+    content = store.read_text()
+    assert manager.session(VIN, DOMAIN_INFOTAINMENT).hmac_key.hex() not in content
+
+
+def test_sessions_survive_restart_with_monotonic_counter(key_path, tmp_path):
+    store = tmp_path / "sessions.json"
+    manager = KeypairManager(str(key_path), str(store))
+    vehicle = SimulatedVehicle(manager.public_key_bytes())
+    manager.update_session(VIN, DOMAIN_INFOTAINMENT, vehicle.session_info())
+    assert vehicle.accept(b"a", manager.sign(VIN, DOMAIN_INFOTAINMENT, b"a"))
+
+    restarted = KeypairManager(str(key_path), str(store))
+    assert vehicle.accept(b"b", restarted.sign(VIN, DOMAIN_INFOTAINMENT, b"b"))
+
+
+def test_rejection_resyncs_or_invalidates(key_path, tmp_path):
+    manager = KeypairManager(str(key_path), str(tmp_path / "sessions.json"))
+    vehicle = SimulatedVehicle(manager.public_key_bytes())
+    manager.update_session(VIN, DOMAIN_INFOTAINMENT, vehicle.session_info())
+
+    # Le véhicule a redémarré : nouvel epoch, la commande est refusée
+    vehicle.epoch = os.urandom(16)
+    assert not vehicle.accept(b"a", manager.sign(VIN, DOMAIN_INFOTAINMENT, b"a"))
+    manager.handle_rejection(VIN, DOMAIN_INFOTAINMENT, vehicle.session_info())
+    assert vehicle.accept(b"a", manager.sign(VIN, DOMAIN_INFOTAINMENT, b"a"))
+
+    manager.handle_rejection(VIN, DOMAIN_INFOTAINMENT)
+    with pytest.raises(KeypairError):
+        manager.sign(VIN, DOMAIN_INFOTAINMENT, b"a")
+
+
+def test_rsa_key_is_refused(tmp_path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = tmp_path / "rsa.pem"
+    path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    with pytest.raises(KeypairError):
+        KeypairManager(str(path), None).public_key_bytes()
+
+
+def test_processes_sharing_the_store_never_reuse_counters(key_path, tmp_path):
+    store = tmp_path / "sessions.json"
+    first = KeypairManager(str(key_path), str(store))
+    vehicle = SimulatedVehicle(first.public_key_bytes())
+    first.update_session(VIN, DOMAIN_INFOTAINMENT, vehicle.session_info())
+    second = KeypairManager(str(key_path), str(store))
+
+    counters = [m.sign(VIN, DOMAIN_INFOTAINMENT, b"x").counter for m in (first, second, first, second)]
+    assert len(set(counters)) == len(counters)
+
+
+def test_unloadable_sessions_are_kept_in_the_store(key_path, tmp_path):
+    store = tmp_path / "sessions.json"
+    unreadable = {"vin": "OTHERVIN", "domain": DOMAIN_INFOTAINMENT, "vehicle_public_key": "00", "epoch": "00", "counter": 7}
+    store.write_text(json.dumps({"sessions": [unreadable]}))
+
+    # Entrée ignorée au chargement, mais pas effacée par l'écriture suivante
+    manager = KeypairManager(str(key_path), str(store))
+    vehicle = SimulatedVehicle(manager.public_key_bytes())
+    manager.update_session(VIN, DOMAIN_INFOTAINMENT, vehicle.session_info())
+    vins = {e["vin"] for e in json.loads(store.read_text())["sessions"]}
+    assert vins == {VIN, "OTHERVIN"}
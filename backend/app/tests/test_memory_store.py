@@ -0,0 +1,39 @@
+import time
+from app.core.memory_store import TTLMemoryStore
+from app.auth.tp_store import TPStore
+
+
+def test_ttl_expiry_is_lazy_and_swept(monkeypatch):
+    store = TTLMemoryStore("test_ttl", max_entries=10, default_ttl=60)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    store.set("a", 1, ttl=5)
+    store.set("b", 2, ttl=50)
+    assert store.get("a") == 1
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert store.get("a") is None
+    assert len(store) == 1
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 100)
+    assert store.sweep() == 1
+    assert len(store) == 0
+    assert store.stats()["expirations"] == 2
+
+
+def test_lru_eviction_keeps_size_bounded():
+    store = TTLMemoryStore("test_lru", max_entries=3)
+    for k in ("a", "b", "c"):
+        store.set(k, k)
+    store.get("a")  # "a" devient le plus récent, "b" le plus ancien
+    store.set("d", "d")
+    assert len(store) == 3
+    assert "b" not in store
+    assert store.get("a") == "a"
+    assert store.stats()["evictions"] == 1
+
+
+def test_pkce_verifier_is_one_time():
+    TPStore.set_pkce_verifier("state-x", "verifier-x")
+    assert TPStore.pop_pkce_verifier("state-x") == "verifier-x"
+    assert TPStore.pop_pkce_verifier("state-x") is None
@@ -15,6 +15,7 @@ def token_store(monkeypatch):
     ts = TokenStore("redis://localhost/0")
     # remplace le client Redis interne par un dummy en mémoire
     monkeypatch.setattr(ts, "r", DummyRedis())
+    ts._mem.clear()  # fallback mémoire partagé par processus
     return ts
 
 @pytest.mark.asyncio
@@ -47,4 +48,78 @@ async def test_partner_token_fetch(monkeypatch, token_store):
 
     # 4) Appel testé : doit récupérer le token et le mettre en cache
     token = await get_partner_token_cached(token_store)
-    assert token == "abc123"
\ No newline at end of file
+    assert token == "abc123"
+
+@pytest.mark.asyncio
+async def test_partner_token_single_flight_per_region(monkeypatch, token_store):
+    audiences = []
+    def handler(request: Request) -> Response:
+        audiences.append(dict(httpx.QueryParams(request.content.decode()))["audience"])
+        return Response(200, json={"access_token": "tok-" + str(len(audiences)), "expires_in": 3600})
+    transport = httpx.MockTransport(handler)
+
+    monkeypatch.setattr(settings, "TESLA_CLIENT_ID", "id", raising=False)
+    monkeypatch.setattr(settings, "TESLA_CLIENT_SECRET", "secret", raising=False)
+    RealAsyncClient = httpx.AsyncClient
+    class FakeAsyncClient:
+        def __init__(self, *args, **kwargs):
+            self._client = RealAsyncClient(transport=transport)
+        async def __aenter__(self):
+            return self._client
+        async def __aexit__(self, exc_type, exc, tb):
+            await self._client.aclose()
+    monkeypatch.setattr(httpx, "AsyncClient", FakeAsyncClient)
+
+    import asyncio
+    eu = await asyncio.gather(*(get_partner_token_cached(token_store, region="eu") for _ in range(5)))
+    na = await get_partner_token_cached(token_store, region="na")
+
+    assert len(set(eu)) == 1
+    assert na != eu[0]
+    assert audiences == [settings.TESLA_AUDIENCE_EU, settings.TESLA_AUDIENCE_NA]
+
+
+@pytest.mark.asyncio
+async def test_partner_token_waits_for_lock_holder(monkeypatch, token_store):
+    import asyncio
+    from app.auth.distributed_lock import LocalLock
+    from app.auth.partner_tokens import partner_cache_key
+
+    async def fail_fetch(**kwargs):
+        raise AssertionError("fleet-auth ne doit pas être appelé pendant que le verrou est détenu")
+    monkeypatch.setattr("app.auth.partner_tokens.fetch_partner_token", fail_fetch)
+    monkeypatch.setattr(settings, "PARTNER_TOKEN_LOCK_POLL_SECONDS", 0.01, raising=False)
+
+    # Un autre "processus" détient le verrou et publie le token un peu plus tard
+    key = partner_cache_key("na")
+    owner = LocalLock().acquire(key, ttl=5)
+    async def holder():
+        await asyncio.sleep(0.05)
+        token_store.set(key, {"access_token": "from-other-worker", "expires_in": 3600}, ttl=3600)
+        LocalLock().release(key, owner)
+
+    _, token = await asyncio.gather(holder(), get_partner_token_cached(token_store, region="na"))
+    assert token == "from-other-worker"
+
+
+def test_fleet_status_uses_the_requested_region(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.api import routes_fleet
+    from app.tesla.client import TeslaClient
+
+    seen = {}
+
+    async def fake_cached(store, use_tp_credentials=False, region=None):
+        seen["token_region"] = region
+        return "partnerTok"
+
+    async def fake_status(self):
+        seen["client_region"] = self.region
+        return {"ok": True}
+
+    monkeypatch.setattr(routes_fleet, "get_partner_token_cached", fake_cached)
+    monkeypatch.setattr(TeslaClient, "status", fake_status)
+    r = TestClient(app).get("/api/fleet/status", params={"region": "na"})
+    assert r.status_code == 200
+    assert seen == {"token_region": "na", "client_region": "na"}
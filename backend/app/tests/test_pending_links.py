@@ -0,0 +1,27 @@
+from app.auth.pending_links import MemoryPendingLinkStore, _negative_cache
+
+
+def test_take_is_one_time_and_most_recent_first():
+    _negative_cache.clear()
+    store = MemoryPendingLinkStore()
+    store.put("old", {"access_token": "a1"})
+    store.put("new", {"access_token": "a2"})
+
+    assert store.take_most_recent()[0] == "new"
+    assert store.take("new") is None
+    assert store.take("old") == {"access_token": "a1"}
+
+
+def test_empty_result_is_cached_until_next_put(monkeypatch):
+    _negative_cache.clear()
+    store = MemoryPendingLinkStore()
+    calls = []
+    real = store._take_most_recent
+    monkeypatch.setattr(store, "_take_most_recent", lambda age: calls.append(age) or real(age))
+
+    assert store.take_most_recent() is None
+    assert store.take_most_recent() is None
+    assert len(calls) == 1
+
+    store.put("s1", {"access_token": "t"})
+    assert store.take_most_recent() == ("s1", {"access_token": "t"})
@@ -0,0 +1,72 @@
+import asyncio
+import time
+import jwt
+import pytest
+from fastapi import HTTPException
+from app.auth import supabase_auth
+from app.auth.supabase_auth import require_supabase_user
+from app.core.settings import settings
+
+
+def make_token(sub="user-1", exp_in=3600):
+    return jwt.encode({"sub": sub, "exp": int(time.time()) + exp_in}, "unused-secret-for-remote-tests!!", algorithm="HS256")
+
+
+@pytest.fixture
+def remote_calls(monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_PRINCIPAL_CACHE_ENABLED", True, raising=False)
+    supabase_auth._principal_cache.clear()
+    calls = []
+
+    async def fake_verify(token):
+        calls.append(token)
+        await asyncio.sleep(0.01)
+        if token == "bad":
+            raise HTTPException(status_code=401, detail="invalide")
+        return {"user": {}, "user_id": jwt.decode(token, options={"verify_signature": False})["sub"], "token": token}
+
+    monkeypatch.setattr(supabase_auth, "_verify_principal", fake_verify)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_verifications_are_merged(remote_calls):
+    token = make_token()
+    results = await asyncio.gather(*(require_supabase_user(token) for _ in range(10)))
+    assert len(remote_calls) == 1
+    assert {r["user_id"] for r in results} == {"user-1"}
+
+    await require_supabase_user(token)
+    assert len(remote_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_entry_bounded_by_token_exp(remote_calls, monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_PRINCIPAL_CACHE_MAX_AGE_SECONDS", 60, raising=False)
+    assert 0 < supabase_auth._principal_ttl(make_token(exp_in=5)) <= 5
+    assert supabase_auth._principal_ttl(make_token(exp_in=3600)) == 60
+    assert supabase_auth._principal_ttl(make_token(exp_in=-10)) == 0
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_cached(remote_calls):
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await require_supabase_user("bad")
+    assert remote_calls == ["bad", "bad"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_fail_coalesced_waiters(remote_calls):
+    token = make_token()
+    leader = asyncio.ensure_future(require_supabase_user(token))
+    await asyncio.sleep(0)
+    waiters = [asyncio.ensure_future(require_supabase_user(token)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    results = await asyncio.gather(*waiters)
+    assert {r["user_id"] for r in results} == {"user-1"}
+    assert len(remote_calls) == 2
+    with pytest.raises(asyncio.CancelledError):
+        await leader
@@ -0,0 +1,123 @@
+import httpx
+import pytest
+from httpx import Request, Response
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth.supabase_auth import require_supabase_user
+from app.services import proxy_cache as proxy_cache_module
+from app.services.proxy_cache import ProxyCacheRule, ProxyResponseCache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    cache = ProxyResponseCache()
+    cache._entries.clear()
+    cache._generations.clear()
+    cache._aliases.clear()
+    monkeypatch.setattr(proxy_cache_module, "proxy_cache", cache)
+    monkeypatch.setattr("app.api.routes_fleet_direct.proxy_cache", cache)
+    monkeypatch.setattr("app.tesla.client.proxy_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+
+    def handler(req: Request) -> Response:
+        calls.append((req.method, req.url.path, dict(req.url.params)))
+        if req.method == "POST":
+            return Response(200, json={"response": {"result": True}})
+        return Response(200, json={"response": {"n": len(calls)}})
+
+    transport = httpx.MockTransport(handler)
+    RealAsyncClient = httpx.AsyncClient
+
+    class FakeAsyncClient:
+        def __init__(self, *args, **kwargs):
+            self._c = RealAsyncClient(transport=transport)
+        async def __aenter__(self): return self._c
+        async def __aexit__(self, et, ev, tb): await self._c.aclose()
+
+    async def fake_token(user_id=None):
+        return "userTok"
+
+    monkeypatch.setattr(httpx, "AsyncClient", FakeAsyncClient)
+    monkeypatch.setattr("app.api.routes_fleet_direct.ensure_user_access_token", fake_token)
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    yield calls
+    app.dependency_overrides.clear()
+
+
+def proxy(client, method, path, **params):
+    return client.post("/api/fleet/direct/proxy", params={"method": method, "path": path}, json={"params": params} if params else None)
+
+
+def test_rule_matching_uses_path_and_params(fresh_cache):
+    rule, vehicle_id = fresh_cache.rule_for("GET", "/api/1/vehicles/42/vehicle_data", {"endpoints": "vehicle_config"})
+    assert vehicle_id == "42" and rule.ttl == 3600 and not rule.invalidate_on
+    rule, _ = fresh_cache.rule_for("GET", "/api/1/vehicles/42/vehicle_data", {"endpoints": "charge_state"})
+    assert rule.invalidated_by("door_unlock")
+    assert fresh_cache.rule_for("POST", "/status", None) is None
+    assert fresh_cache.rule_for("GET", "/api/1/vehicles/42/nearby_charging_sites", None) is None
+
+    custom = ProxyCacheRule.from_dict({"pattern": "/api/1/vehicles/*/release_notes", "ttl": 600, "scope": "shared"})
+    assert custom.match("/api/1/vehicles/42/release_notes", {}) and not custom.match("/api/1/vehicles/42/x/release_notes", {})
+
+
+def test_shared_rule_serves_all_users_from_one_upstream_call(upstream):
+    client = TestClient(app)
+    first = proxy(client, "GET", "/status")
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u2"}
+    second = proxy(client, "GET", "/status")
+
+    assert first.headers["x-proxy-cache"] == "MISS" and second.headers["x-proxy-cache"] == "HIT"
+    assert second.json()["body"] == first.json()["body"]
+    assert len(upstream) == 1
+
+
+def test_user_scope_and_invalidation_by_command(upstream):
+    client = TestClient(app)
+    path = "/api/1/vehicles/42/vehicle_data"
+    proxy(client, "GET", path)
+    assert proxy(client, "GET", path).headers["x-proxy-cache"] == "HIT"
+
+    # Un autre utilisateur ne lit pas l'entrée du premier
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u2"}
+    assert proxy(client, "GET", path).headers["x-proxy-cache"] == "MISS"
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+
+    proxy(client, "POST", "/api/1/vehicles/42/command/door_unlock")
+    after = proxy(client, "GET", path)
+    assert after.headers["x-proxy-cache"] == "MISS"
+    assert [c[0] for c in upstream] == ["GET", "GET", "POST", "GET"]
+
+
+def test_config_survives_commands_and_errors_are_not_cached(fresh_cache, upstream, monkeypatch):
+    client = TestClient(app)
+    fresh_cache.vehicle_command("42", "door_unlock")
+    proxy(client, "GET", "/api/1/vehicles/42/vehicle_data", endpoints="vehicle_config")
+    fresh_cache.vehicle_command("42", "charge_start")
+    assert proxy(client, "GET", "/api/1/vehicles/42/vehicle_data", endpoints="vehicle_config").headers["x-proxy-cache"] == "HIT"
+
+    rule, vehicle_id = fresh_cache.rule_for("GET", "/api/1/vehicles/7", None)
+    key = fresh_cache.key(rule, vehicle_id, user_id="u1", region="eu", path="/api/1/vehicles/7", params=None)
+    fresh_cache.set(key, rule, proxy_cache_module.CachedProxyResponse(408, {}, {"error": "vehicle unavailable"}))
+    assert fresh_cache.get(key, rule) is None
+
+
+def test_command_by_id_invalidates_reads_by_vin(fresh_cache):
+    path = "/api/1/vehicles/5YJ3E7EB0KF000001/vehicle_data"
+    rule, vehicle_id = fresh_cache.rule_for("GET", path, None)
+    before = fresh_cache.key(rule, vehicle_id, user_id="u1", region="eu", path=path, params=None)
+
+    fresh_cache.remember_vehicle(42, "5YJ3E7EB0KF000001")
+    fresh_cache.vehicle_command("42", "door_unlock")
+    assert fresh_cache.key(rule, vehicle_id, user_id="u1", region="eu", path=path, params=None) != before
+
+
+def test_uncached_get_counts_as_bypass(fresh_cache):
+    bypass = proxy_cache_module.PROXY_CACHE_REQUESTS.labels("", "bypass")
+    count = bypass._value.get()
+    assert fresh_cache.rule_for("GET", "/api/1/vehicles/42/nearby_charging_sites", None) is None
+    assert bypass._value.get() == count + 1
@@ -0,0 +1,94 @@
+import httpx
+from httpx import Request, Response
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth.supabase_auth import require_supabase_user
+from app.core.settings import settings
+
+
+def fake_async_client(monkeypatch, handler):
+    transport = httpx.MockTransport(handler)
+    RealAsyncClient = httpx.AsyncClient
+
+    class FakeAsyncClient:
+        def __init__(self, *args, **kwargs):
+            self._c = RealAsyncClient(transport=transport)
+        async def __aenter__(self): return self._c
+        async def __aexit__(self, et, ev, tb): await self._c.aclose()
+
+    monkeypatch.setattr(httpx, "AsyncClient", FakeAsyncClient)
+
+
+async def chunked(data: bytes, size: int = 4096):
+    # Corps en flux (un corps bytes serait déjà lu par httpx)
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def proxy_client(monkeypatch):
+    async def fake_token(user_id=None):
+        return "userTok"
+
+    monkeypatch.setattr("app.api.routes_fleet_direct.ensure_user_access_token", fake_token)
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    return TestClient(app)
+
+
+def test_stream_relays_raw_body_and_filters_hop_by_hop(monkeypatch):
+    base = settings.tesla_audience_for().rstrip("/")
+    payload = b'{"response": [' + b",".join(b'{"id": %d}' % i for i in range(5000)) + b"]}"
+    seen = {}
+
+    def handler(req: Request) -> Response:
+        seen["url"] = str(req.url)
+        seen["accept_encoding"] = req.headers.get("accept-encoding")
+        return Response(
+            200,
+            content=chunked(payload),
+            headers={
+                "content-type": "application/json",
+                "x-txid": "abc",
+                "connection": "keep-alive, x-hop",
+                "keep-alive": "timeout=5",
+                "x-hop": "1",
+            },
+        )
+
+    fake_async_client(monkeypatch, handler)
+    try:
+        r = proxy_client(monkeypatch).post(
+            "/api/fleet/direct/proxy",
+            params={"method": "GET", "path": "/api/1/vehicles", "stream": "true"},
+            headers={"Accept-Encoding": "identity"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert r.status_code == 200
+    assert r.content == payload
+    assert seen == {"url": f"{base}/api/1/vehicles", "accept_encoding": "identity"}
+    assert r.headers["x-txid"] == "abc"
+    assert "keep-alive" not in r.headers and "x-hop" not in r.headers
+
+
+def test_stream_keeps_upstream_status_and_follows_421(monkeypatch):
+    calls = []
+
+    def handler(req: Request) -> Response:
+        calls.append(str(req.url))
+        if len(calls) == 1:
+            return Response(421, headers={"location": "https://other.example/api/1/vehicles/1"})
+        return Response(408, content=chunked(b"vehicle unavailable"), headers={"content-type": "text/plain"})
+
+    fake_async_client(monkeypatch, handler)
+    try:
+        r = proxy_client(monkeypatch).post(
+            "/api/fleet/direct/proxy",
+            params={"method": "GET", "path": "/api/1/vehicles/1", "stream": "true"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert r.status_code == 408
+    assert r.text == "vehicle unavailable"
+    assert calls[1] == "https://other.example/api/1/vehicles/1"
@@ -0,0 +1,85 @@
+import os
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import routes_public
+from app.api.routes_public import PublicKeyCache
+from app.core.settings import settings
+
+URL = "/.well-known/appspecific/com.tesla.3p.public-key.pem"
+
+
+def write_private_key(path):
+    key = ec.generate_private_key(ec.SECP256R1())
+    path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ))
+    return key
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    private_dir = tmp_path / "private"
+    private_dir.mkdir()
+    monkeypatch.setattr(settings, "PRIVATE_KEY_PATH", str(private_dir / "private_key.pem"), raising=False)
+    monkeypatch.setattr(settings, "PUBLIC_KEY_RECHECK_SECONDS", 0, raising=False)
+    monkeypatch.setattr(routes_public, "public_key_cache", PublicKeyCache())
+    app = FastAPI()
+    app.include_router(routes_public.router)
+    return TestClient(app), tmp_path
+
+
+def test_public_key_derived_once_and_served_with_etag(client, monkeypatch):
+    http, tmp_path = client
+    key = write_private_key(tmp_path / "private" / "private_key.pem")
+    calls = []
+    derive = routes_public._public_pem_from_private
+
+    def counting(path):
+        calls.append(path)
+        return derive(path)
+
+    monkeypatch.setattr(routes_public, "_public_pem_from_private", counting)
+
+    first = http.get(URL)
+    second = http.get(URL)
+    assert first.status_code == second.status_code == 200
+    assert first.content == key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    assert len(calls) == 1
+    assert first.headers["etag"] == second.headers["etag"]
+    assert "max-age" in first.headers["cache-control"]
+
+    not_modified = http.get(URL, headers={"If-None-Match": first.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_public_key_reloaded_when_file_changes(client):
+    http, tmp_path = client
+    public_dir = tmp_path / "public"
+    public_dir.mkdir()
+    pem_path = public_dir / "public_key.pem"
+    pem_path.write_bytes(b"-----BEGIN PUBLIC KEY-----\nAAAA\n-----END PUBLIC KEY-----\n")
+
+    first = http.get(URL)
+    pem_path.write_bytes(b"-----BEGIN PUBLIC KEY-----\nBBBB\n-----END PUBLIC KEY-----\n")
+    stat = os.stat(pem_path)
+    os.utime(pem_path, (stat.st_atime, stat.st_mtime + 10))
+    second = http.get(URL)
+
+    assert b"BBBB" in second.content
+    assert first.headers["etag"] != second.headers["etag"]
+    assert http.get(URL, headers={"If-None-Match": first.headers["etag"]}).status_code == 200
+
+
+def test_missing_key_returns_404(client):
+    http, _ = client
+    response = http.get(URL)
+    assert response.status_code == 404
+    assert "PRIVATE_KEY_PATH" in response.json()["detail"]
@@ -0,0 +1,31 @@
+import pytest
+from app.core import redis_client
+from app.core.settings import settings
+
+
+@pytest.fixture(autouse=True)
+def reset_client(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://cache:6379/0", raising=False)
+    monkeypatch.setattr(redis_client, "_client", None)
+    monkeypatch.setattr(redis_client, "_resolved_url", None)
+    monkeypatch.setattr(redis_client, "_failed_at", 0.0)
+
+
+def test_failed_ping_is_retried_after_cooldown(monkeypatch):
+    attempts = []
+
+    class FakeRedis:
+        def ping(self):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ConnectionError("redis pas encore démarré")
+
+    monkeypatch.setattr(redis_client.redis, "from_url", lambda url, **kw: FakeRedis())
+    monkeypatch.setattr(settings, "REDIS_RECONNECT_SECONDS", 3600, raising=False)
+    assert redis_client.get_redis() is None
+    assert redis_client.get_redis() is None
+    assert len(attempts) == 1
+
+    monkeypatch.setattr(settings, "REDIS_RECONNECT_SECONDS", 0, raising=False)
+    assert isinstance(redis_client.get_redis(), FakeRedis)
+    assert len(attempts) == 2
@@ -0,0 +1,39 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import stream_tickets
+from app.auth.stream_tickets import VEHICLE_EVENTS, issue_stream_ticket, require_vehicle_events_principal
+from app.auth.supabase_auth import require_supabase_user
+
+
+@pytest.fixture(autouse=True)
+def clear_tickets():
+    stream_tickets._local.clear()
+
+
+def test_ticket_endpoint_requires_bearer_and_returns_ticket():
+    client = TestClient(app)
+    assert client.post("/api/fleet/events/ticket").status_code == 401
+
+    app.dependency_overrides[require_supabase_user] = lambda: {"user_id": "u1"}
+    try:
+        r = client.post("/api/fleet/events/ticket")
+    finally:
+        app.dependency_overrides.clear()
+    assert r.status_code == 200
+    assert stream_tickets.resolve_stream_ticket(r.json()["ticket"], VEHICLE_EVENTS) == {"user_id": "u1"}
+
+
+@pytest.mark.asyncio
+async def test_ticket_is_scoped_to_its_purpose():
+    ticket = issue_stream_ticket({"user_id": "u1"}, VEHICLE_EVENTS)
+    assert await require_vehicle_events_principal(token=None, ticket=ticket) == {"user_id": "u1"}
+    # Stocké sous son hash uniquement
+    assert all(ticket not in key for key, _ in stream_tickets._local.items())
+
+    other = issue_stream_ticket({"user_id": "u1"}, "other_stream")
+    for candidate in (other, "forged", None):
+        with pytest.raises(HTTPException) as exc:
+            await require_vehicle_events_principal(token=None, ticket=candidate)
+        assert exc.value.status_code == 401
@@ -0,0 +1,96 @@
+import time
+import jwt
+import pytest
+from fastapi import HTTPException
+from app.auth import supabase_auth
+from app.auth.supabase_auth import require_supabase_user
+from app.core.settings import settings
+
+SECRET = "test-jwt-secret-at-least-32-bytes-long"
+
+
+def make_token(secret=SECRET, **overrides):
+    claims = {
+        "sub": "user-1",
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": "a@b.c",
+        "iss": "https://proj.supabase.co/auth/v1",
+        "exp": int(time.time()) + 3600,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+@pytest.fixture(autouse=True)
+def jwt_settings(monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_URL", "https://proj.supabase.co", raising=False)
+    monkeypatch.setattr(settings, "SUPABASE_JWT_SECRET", SECRET, raising=False)
+    monkeypatch.setattr(settings, "SUPABASE_JWT_VERIFICATION", "local_with_fallback", raising=False)
+    supabase_auth._principal_cache.clear()
+
+    async def no_remote(token):
+        raise AssertionError("appel /auth/v1/user inattendu")
+
+    monkeypatch.setattr(supabase_auth, "_verify_remote", no_remote)
+
+
+@pytest.mark.asyncio
+async def test_valid_token_verified_locally():
+    principal = await require_supabase_user(make_token())
+    assert principal["user_id"] == "user-1"
+    assert principal["user"]["email"] == "a@b.c"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token", [
+    make_token(exp=int(time.time()) - 600),
+    make_token(secret="another-secret-of-sufficient-length!"),
+    make_token(aud="anon"),
+    make_token(iss="https://evil.example/auth/v1"),
+])
+async def test_invalid_tokens_rejected_without_remote_call(token):
+    with pytest.raises(HTTPException) as exc:
+        await require_supabase_user(token)
+    assert exc.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_remote_when_no_local_key(monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_JWT_SECRET", None, raising=False)
+    calls = []
+
+    async def fake_remote(token):
+        calls.append(token)
+        return {"id": "user-1"}
+
+    monkeypatch.setattr(supabase_auth, "_verify_remote", fake_remote)
+    token = make_token()
+    principal = await require_supabase_user(token)
+    assert calls == [token]
+    assert principal["user_id"] == "user-1"
+
+
+@pytest.mark.asyncio
+async def test_failed_jwks_download_is_not_retried_on_every_request(monkeypatch):
+    import httpx
+    from app.auth.jwt_verifier import LocalVerificationUnavailable, SupabaseJWTVerifier
+
+    attempts = []
+
+    class DownAsyncClient:
+        def __init__(self, *args, **kwargs):
+            pass
+        async def __aenter__(self):
+            attempts.append(1)
+            raise httpx.ConnectTimeout("jwks down")
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(httpx, "AsyncClient", DownAsyncClient)
+    monkeypatch.setattr(settings, "SUPABASE_JWKS_MIN_REFRESH_SECONDS", 3600, raising=False)
+    verifier = SupabaseJWTVerifier()
+    for _ in range(3):
+        with pytest.raises(LocalVerificationUnavailable):
+            await verifier._key_for("ES256", "kid-1")
+    assert attempts == [1]
@@ -0,0 +1,74 @@
+import time
+import pytest
+from app.auth import supabase_store as ss
+
+
+class FakeQuery:
+    def __init__(self, table):
+        self.table = table
+        self.filters = {}
+        self.op = "select"
+        self.row = None
+    def select(self, *a): return self
+    def eq(self, col, val): self.filters[col] = val; return self
+    def gte(self, *a): return self
+    def limit(self, *a): return self
+    def upsert(self, row): self.op, self.row = "upsert", row; return self
+    def delete(self): self.op = "delete"; return self
+    def execute(self):
+        self.table.calls.append(self.op)
+        if self.op == "upsert":
+            self.table.rows[self.row["key"]] = self.row
+            return type("R", (), {"data": [self.row]})
+        if self.op == "delete":
+            self.table.rows.pop(self.filters.get("key"), None)
+            return type("R", (), {"data": []})
+        row = self.table.rows.get(self.filters.get("key"))
+        return type("R", (), {"data": [row] if row else []})
+
+
+class FakeClient:
+    def __init__(self):
+        self.rows, self.calls = {}, []
+    def table(self, name): return FakeQuery(self)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(ss, "create_client", lambda url, key: client)
+    ss._read_cache.clear()
+    s = ss.SupabaseTokenStore("http://supabase.test", "key")
+    return s, client
+
+
+def test_get_is_served_from_local_cache(store):
+    s, client = store
+    client.rows["user_token:u1"] = {"key": "user_token:u1", "token_data": {"access_token": "a", "expires_at": int(time.time()) + 3600}}
+
+    assert s.get("user_token:u1")["access_token"] == "a"
+    assert s.get("user_token:u1")["access_token"] == "a"
+    assert client.calls == ["select"]
+
+    # bypass_cache force la lecture Supabase
+    s.get("user_token:u1", bypass_cache=True)
+    assert client.calls == ["select", "select"]
+
+
+def test_set_and_delete_write_through(store):
+    s, client = store
+    s.set("user_token:u2", {"access_token": "b"}, ttl=3600)
+    assert s.get("user_token:u2")["access_token"] == "b"
+    assert client.calls == ["upsert"]
+
+    s.delete("user_token:u2")
+    assert s.get("user_token:u2") is None
+    assert client.calls == ["upsert", "delete", "select"]
+
+
+def test_cache_entry_bounded_by_token_expiry(store):
+    s, client = store
+    client.rows["k"] = {"key": "k", "token_data": {"access_token": "c", "expires_at": int(time.time()) - 1}}
+    s.get("k")
+    s.get("k")
+    assert client.calls == ["select", "select"]
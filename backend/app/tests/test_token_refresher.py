@@ -0,0 +1,147 @@
+import asyncio
+import time
+import pytest
+from app.auth.token_refresher import TokenRefresher
+from app.core.settings import settings
+
+
+class FakeStore:
+    def __init__(self):
+        self.data = {}
+    def get(self, k, bypass_cache=False): return self.data.get(k)
+    def set(self, k, token, ttl):
+        token = dict(token)
+        token["expires_at"] = int(time.time()) + ttl
+        self.data[k] = token
+    def valid(self, token):
+        return bool(token and token.get("access_token") and token.get("expires_at", 0) > time.time() + 30)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    s = FakeStore()
+    monkeypatch.setattr("app.auth.supabase_store.get_supabase_store", lambda: s)
+    return s
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refreshes_are_single_flight(monkeypatch, store):
+    calls = []
+
+    async def fake_refresh(refresh_token):
+        calls.append(refresh_token)
+        await asyncio.sleep(0.01)
+        return {"access_token": "new", "refresh_token": "rtok-2", "expires_in": 3600}
+
+    monkeypatch.setattr("app.auth.oauth_third_party.refresh_access_token", fake_refresh)
+    store.data["user_token:u1"] = {"access_token": "old", "refresh_token": "rtok-1", "expires_at": int(time.time()) - 5}
+
+    refresher = TokenRefresher()
+    results = await asyncio.gather(*(refresher.refresh("user_token:u1") for _ in range(5)))
+
+    assert calls == ["rtok-1"]
+    assert all(r["access_token"] == "new" for r in results)
+    assert store.data["user_token:u1"]["refresh_token"] == "rtok-2"
+
+
+@pytest.mark.asyncio
+async def test_background_loop_refreshes_before_expiry(monkeypatch, store):
+    monkeypatch.setattr(settings, "TOKEN_STORE_TYPE", "memory", raising=False)
+    monkeypatch.setattr(settings, "TOKEN_REFRESH_LEAD_SECONDS", 300, raising=False)
+
+    async def fake_refresh(refresh_token):
+        return {"access_token": "fresh", "refresh_token": "rtok-2", "expires_in": 3600}
+
+    monkeypatch.setattr("app.auth.oauth_third_party.refresh_access_token", fake_refresh)
+    # Toujours valide, mais dans la fenêtre d'anticipation
+    store.set("user_token:u2", {"access_token": "soon", "refresh_token": "rtok-1"}, ttl=120)
+
+    refresher = TokenRefresher()
+    await refresher.start()
+    try:
+        refresher.track("user_token:u2", store.get("user_token:u2"))
+        for _ in range(50):
+            if store.get("user_token:u2")["access_token"] == "fresh":
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await refresher.stop()
+
+    assert store.get("user_token:u2")["access_token"] == "fresh"
+
+
+@pytest.mark.asyncio
+async def test_rejected_refresh_untracks_and_other_failures_back_off(monkeypatch, store):
+    import httpx
+    status = {"code": 503}
+    calls = []
+
+    async def failing_refresh(refresh_token):
+        calls.append(refresh_token)
+        request = httpx.Request("POST", "https://auth.example/token")
+        raise httpx.HTTPStatusError("refresh failed", request=request, response=httpx.Response(status["code"], request=request))
+
+    monkeypatch.setattr("app.auth.oauth_third_party.refresh_access_token", failing_refresh)
+    key = "user_token:u3"
+    store.data[key] = {"access_token": "old", "refresh_token": "rtok", "expires_at": int(time.time()) - 5}
+    refresher = TokenRefresher()
+    refresher.track(key, store.data[key])
+
+    delays = []
+    for _ in range(3):
+        await refresher.refresh(key)
+        # Pendant le délai, une requête n'appelle pas /token
+        assert await refresher.refresh(key) is None
+        delays.append(refresher._tracked[key].retry_at - time.time())
+        fingerprint, _ = refresher._blocked[key]
+        refresher._blocked[key] = (fingerprint, 0)  # Délai écoulé
+    assert delays[0] < delays[1] < delays[2]
+    assert len(calls) == 3
+
+    # invalid_grant : le refresh_token est révoqué, inutile de réessayer
+    status["code"] = 400
+    await refresher.refresh(key)
+    assert key not in refresher._tracked
+    assert len(calls) == 4
+
+    # Ni la lecture du token (track) ni une requête ne relancent /token avec ce refresh_token
+    refresher.track(key, store.data[key])
+    assert key not in refresher._tracked
+    assert await refresher.refresh(key) is None
+    assert len(calls) == 4
+
+    # Nouvelle liaison : nouveau refresh_token, de nouveau suivi
+    store.data[key] = {**store.data[key], "refresh_token": "rtok-new"}
+    refresher.track(key, store.data[key])
+    assert key in refresher._tracked
+
+
+@pytest.mark.asyncio
+async def test_refresh_waits_for_another_process_holding_the_lock(monkeypatch, store):
+    from app.auth import distributed_lock
+    calls = []
+
+    async def fake_refresh(refresh_token):
+        calls.append(refresh_token)
+        return {"access_token": "mine", "refresh_token": "rtok-3", "expires_in": 3600}
+
+    monkeypatch.setattr("app.auth.oauth_third_party.refresh_access_token", fake_refresh)
+    monkeypatch.setattr(settings, "TOKEN_REFRESH_LOCK_POLL_SECONDS", 0.01, raising=False)
+    lock = distributed_lock.LocalLock()
+    monkeypatch.setattr(distributed_lock, "get_distributed_lock", lambda: lock)
+    store.data["user_token:u4"] = {"access_token": "old", "refresh_token": "rtok-1", "expires_at": int(time.time()) - 5}
+
+    # Un autre worker détient le verrou et publie le token renouvelé
+    owner = lock.acquire("user_token:u4", 30)
+
+    async def other_worker():
+        await asyncio.sleep(0.05)
+        store.set("user_token:u4", {"access_token": "theirs", "refresh_token": "rtok-2"}, ttl=3600)
+        lock.release("user_token:u4", owner)
+
+    other = asyncio.ensure_future(other_worker())
+    result = await TokenRefresher().refresh("user_token:u4")
+    await other
+
+    assert result["access_token"] == "theirs"
+    assert calls == []  # rtok-1 n'est pas consommé une seconde fois
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import pytest
+import websockets
+from app.core.settings import settings
+from app.tesla import vcp
+from app.tesla.vcp import VehicleCommandProtocol, VCPError
+
+
+class FakeVehicleSocket:
+    """Serveur VCP simulé : répond aux commandes dans l'ordre inverse de réception."""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.sent = []
+        self.closed = False
+        self.incoming.put_nowait(json.dumps({"message_type": "connection_info", "connection_info": {"connection_id": "c1"}}))
+
+    async def recv(self):
+        msg = await self.incoming.get()
+        if msg is None:
+            raise websockets.ConnectionClosedOK(None, None)
+        return msg
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.recv()
+        except websockets.ConnectionClosed:
+            raise StopAsyncIteration
+
+    async def send(self, raw):
+        if self.closed:
+            raise websockets.ConnectionClosedOK(None, None)
+        self.sent.append(json.loads(raw)["command_request"])
+        if len(self.sent) % 2 == 0:
+            for req in reversed(self.sent[-2:]):
+                self.incoming.put_nowait(json.dumps({
+                    "message_type": "command_response",
+                    "command_response": {"request_id": req["request_id"], "status": "success", "command": req["command_name"]},
+                }))
+
+    async def close(self):
+        self.closed = True
+        self.incoming.put_nowait(None)
+
+
+@pytest.fixture
+def sockets(monkeypatch):
+    monkeypatch.setattr(settings, "VCP_SESSION_POOL_ENABLED", True, raising=False)
+    opened = []
+
+    async def fake_connect(self, vehicle_id):
+        ws = FakeVehicleSocket()
+        opened.append(ws)
+        return ws
+
+    monkeypatch.setattr(VehicleCommandProtocol, "_connect", fake_connect)
+    yield opened
+
+
+@pytest.mark.asyncio
+async def test_commands_share_one_socket_and_are_matched_by_request_id(sockets):
+    client = VehicleCommandProtocol(access_token="tok", region="eu")
+    try:
+        lock, charge = await asyncio.gather(
+            client.execute("42", "door_lock", timeout=2),
+            client.execute("42", "charge_start", timeout=2),
+        )
+    finally:
+        await vcp.vcp_session_pool.close_all()
+
+    assert len(sockets) == 1
+    assert lock.raw["command_response"]["command"] == "door_lock"
+    assert charge.raw["command_response"]["command"] == "charge_start"
+
+
+@pytest.mark.asyncio
+async def test_reconnects_after_socket_closed(sockets):
+    client = VehicleCommandProtocol(access_token="tok", region="eu")
+    try:
+        first = [client.execute("42", "door_lock", timeout=2), client.execute("42", "door_unlock", timeout=2)]
+        await asyncio.gather(*first)
+        await sockets[0].close()
+        await asyncio.sleep(0)
+        results = await asyncio.gather(
+            client.execute("42", "charge_start", timeout=2),
+            client.execute("42", "charge_stop", timeout=2),
+        )
+    finally:
+        await vcp.vcp_session_pool.close_all()
+
+    assert len(sockets) == 2
+    assert all(r.success for r in results)
+
+
+@pytest.mark.asyncio
+async def test_inflight_command_fails_when_socket_drops(sockets):
+    client = VehicleCommandProtocol(access_token="tok", region="eu")
+    try:
+        task = asyncio.create_task(client.execute("42", "door_lock", timeout=2))
+        await asyncio.sleep(0.01)
+        await sockets[0].close()
+        with pytest.raises(VCPError):
+            await task
+    finally:
+        await vcp.vcp_session_pool.close_all()
+
+
+@pytest.mark.asyncio
+async def test_phases_are_recorded_per_region_and_command(sockets):
+    from prometheus_client import REGISTRY
+
+    def count(phase):
+        return REGISTRY.get_sample_value(
+            "vcp_phase_seconds_count", {"phase": phase, "region": "na", "command": "honk_horn"}
+        ) or 0
+
+    before = {p: count(p) for p in ("connect", "connection_info", "response")}
+    client = VehicleCommandProtocol(access_token="tok-na", region="na")
+    try:
+        await asyncio.gather(client.execute("7", "honk_horn", timeout=2), client.execute("7", "honk_horn", timeout=2))
+    finally:
+        await vcp.vcp_session_pool.close_all()
+
+    assert count("connect") == before["connect"] + 1
+    assert count("connection_info") == before["connection_info"] + 1
+    assert count("response") == before["response"] + 2
+
+
+class SilentVehicleSocket(FakeVehicleSocket):
+    """Ne répond pas : les réponses sont injectées par le test."""
+
+    async def send(self, raw):
+        if self.closed:
+            raise websockets.ConnectionClosedOK(None, None)
+        self.sent.append(json.loads(raw)["command_request"])
+
+    def respond(self, request, status="success"):
+        self.incoming.put_nowait(json.dumps({
+            "message_type": "command_response",
+            "command_response": {"request_id": request["request_id"], "status": status, "command": request["command_name"]},
+        }))
+
+
+@pytest.mark.asyncio
+async def test_late_response_of_timed_out_command_is_dropped(monkeypatch):
+    monkeypatch.setattr(settings, "VCP_SESSION_POOL_ENABLED", True, raising=False)
+    socket = SilentVehicleSocket()
+
+    async def fake_connect(self, vehicle_id):
+        return socket
+
+    monkeypatch.setattr(VehicleCommandProtocol, "_connect", fake_connect)
+    client = VehicleCommandProtocol(access_token="tok", region="eu")
+    try:
+        with pytest.raises(VCPError):
+            await client.execute("42", "door_unlock", timeout=0.05)
+        second = asyncio.create_task(client.execute("42", "door_lock", timeout=2))
+        await asyncio.sleep(0.01)
+
+        # Réponse tardive de door_unlock : une seule commande en vol, mais pas la bonne
+        socket.respond(socket.sent[0])
+        await asyncio.sleep(0.01)
+        assert not second.done()
+
+        socket.respond(socket.sent[1])
+        result = await second
+    finally:
+        await vcp.vcp_session_pool.close_all()
+
+    assert result.raw["command_response"]["command"] == "door_lock"
+
+
+@pytest.mark.asyncio
+async def test_retired_session_is_never_reconnected(sockets):
+    client = VehicleCommandProtocol(access_token="tok", region="eu")
+    try:
+        stale = vcp.vcp_session_pool.session_for("tok", "eu", "42")
+        await stale.retire()
+        with pytest.raises(vcp._SessionRetired):
+            await stale.execute("door_lock", {}, timeout=2)
+        results = await asyncio.gather(
+            client.execute("42", "door_lock", timeout=2),
+            client.execute("42", "door_unlock", timeout=2),
+        )
+    finally:
+        await vcp.vcp_session_pool.close_all()
+
+    assert all(r.success for r in results)
+    assert len(sockets) == 1
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from app.core.settings import settings
+from app.services.vehicle_events import VehicleEventBus
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    monkeypatch.setattr(settings, "VEHICLE_EVENTS_BUFFER_SIZE", 5, raising=False)
+    monkeypatch.setattr(settings, "VEHICLE_EVENTS_CLIENT_QUEUE_SIZE", 3, raising=False)
+    bus = VehicleEventBus()
+    bus._buffers.clear()
+    return bus
+
+
+async def drain(subscription):
+    await asyncio.sleep(0)  # Livraisons planifiées via call_soon_threadsafe
+    items = []
+    while not subscription.queue.empty():
+        items.append(subscription.queue.get_nowait())
+    return items
+
+
+@pytest.mark.asyncio
+async def test_events_filtered_by_account_and_vehicle(bus):
+    sub = bus.subscribe("acc-1", vehicles=["VIN1"])
+    bus.publish("acc-1", {"type": "vehicle", "tesla_id": 1, "vin": "VIN1"})
+    bus.publish("acc-1", {"type": "vehicle", "tesla_id": 2, "vin": "VIN2"})
+    bus.publish("acc-2", {"type": "vehicle", "tesla_id": 3, "vin": "VIN1"})
+    items = await drain(sub)
+    assert [event["tesla_id"] for _, event in items] == [1]
+    bus.unsubscribe(sub)
+
+
+@pytest.mark.asyncio
+async def test_resume_from_last_event_id(bus):
+    ids = [bus.publish("acc-1", {"type": "vehicle", "tesla_id": i}) for i in range(3)]
+    sub = bus.subscribe("acc-1", last_event_id=bus.format_id(ids[0]))
+    assert not sub.reset
+    assert [event_id for event_id, _ in await drain(sub)] == ids[1:]
+
+    # Plus ancien que le tampon (5 événements) : reset
+    for i in range(10):
+        bus.publish("acc-1", {"type": "vehicle", "tesla_id": i})
+    late = bus.subscribe("acc-1", last_event_id=bus.format_id(ids[0]))
+    assert late.reset
+    # Id inconnu, ou émis par un autre processus (même numéro, autre epoch)
+    assert bus.subscribe("acc-1", last_event_id=bus.format_id(999999)).reset
+    other = VehicleEventBus()
+    assert bus.subscribe("acc-1", last_event_id=other.format_id(ids[1])).reset
+    assert bus.subscribe("acc-1", last_event_id=str(ids[1])).reset
+
+
+@pytest.mark.asyncio
+async def test_slow_client_is_disconnected(bus):
+    sub = bus.subscribe("acc-1")
+    for i in range(5):
+        bus.publish("acc-1", {"type": "vehicle", "tesla_id": i})
+    assert await drain(sub) == [None]
+
+
+@pytest.mark.asyncio
+async def test_remote_listener_retried_until_redis_answers(bus, monkeypatch):
+    attempts = []
+
+    def ensure_listener():
+        attempts.append(1)
+        if len(attempts) == 2:
+            bus._remote._listener = type("Listener", (), {"is_alive": lambda self: True})()  # Redis revenu
+
+    monkeypatch.setattr(bus._remote, "_ensure_listener", ensure_listener)
+    for _ in range(3):
+        bus.unsubscribe(bus.subscribe("acc-1"))
+    assert len(attempts) == 2
+    assert bus._remote._handlers["vehicle_event"] == [bus._on_remote]
@@ -0,0 +1,21 @@
+import pytest
+from app.tesla import vehicles as vehicles_mod
+
+RAW = {"id": 1492931337156, "vehicle_id": 1234567, "vin": "5YJ3E7EB0KF000001", "state": "online"}
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_vehicles_walks_pages_as_plain_dicts():
+    class FakeClient:
+        def __init__(self):
+            self.pages = []
+
+        async def vehicles_list(self, page, page_size):
+            self.pages.append(page)
+            items = [dict(RAW, id=page * 10 + i) for i in range(page_size)]
+            return {"response": items, "pagination": {"next": page + 1 if page < 3 else None}}
+
+    client = FakeClient()
+    result = await vehicles_mod.fetch_all_vehicles(client, page_size=2)
+    assert client.pages == [1, 2, 3]
+    assert [v["id"] for v in result] == [10, 11, 20, 21, 30, 31]
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from httpx import Response, Request
+from app.core.settings import settings
+from app.tesla.wake import WakeCoordinator, _states
+
+
+class FakeFleet:
+    """Véhicule simulé : passe online après `wake_after` interrogations suivant le wake_up."""
+
+    def __init__(self, wake_after=2):
+        self.state = "asleep"
+        self.wake_after = wake_after
+        self.wakes = 0
+        self.polls = 0
+
+    async def request(self, method, path, allow_error=False, **kwargs):
+        req = Request(method, "https://fleet.test" + path)
+        if method == "POST" and path.endswith("/wake_up"):
+            self.wakes += 1
+            return Response(200, json={"response": {"state": self.state}}, request=req)
+        if self.wakes:
+            self.polls += 1
+            if self.polls >= self.wake_after:
+                self.state = "online"
+        return Response(200, json={"response": {"state": self.state}}, request=req)
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(settings, "WAKE_POLL_INITIAL_SECONDS", 0.01, raising=False)
+    monkeypatch.setattr(settings, "WAKE_POLL_MAX_SECONDS", 0.02, raising=False)
+    _states.clear()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_wake():
+    fleet = FakeFleet(wake_after=3)
+    coordinator = WakeCoordinator()
+
+    states = await asyncio.gather(*(coordinator.ensure_online(fleet, "42") for _ in range(5)))
+
+    assert states == ["online"] * 5
+    assert fleet.wakes == 1
+    # État mémorisé : pas de nouvel appel pour la commande suivante
+    calls = fleet.polls
+    assert await coordinator.ensure_online(fleet, "42") == "online"
+    assert fleet.polls == calls
+
+
+@pytest.mark.asyncio
+async def test_online_vehicle_is_not_woken():
+    fleet = FakeFleet()
+    fleet.state = "online"
+    assert await WakeCoordinator().ensure_online(fleet, "7") == "online"
+    assert fleet.wakes == 0
+
+
+@pytest.mark.asyncio
+async def test_wake_times_out(monkeypatch):
+    from app.tesla.vcp import VCPError
+    fleet = FakeFleet(wake_after=10_000)
+    with pytest.raises(VCPError):
+        await WakeCoordinator().ensure_online(fleet, "9", timeout=0.1)
+
+
+@pytest.mark.asyncio
+async def test_send_wake_reports_rejection_without_waiting_for_online():
+    from app.tesla.vcp import VCPError
+
+    class RejectingFleet(FakeFleet):
+        async def request(self, method, path, allow_error=False, **kwargs):
+            if method == "POST":
+                return Response(404, json={"error": "not_found"}, request=Request(method, "https://fleet.test" + path))
+            return await super().request(method, path, allow_error=allow_error, **kwargs)
+
+    with pytest.raises(VCPError):
+        await WakeCoordinator().send_wake(RejectingFleet(), "11")
+
+    fleet = FakeFleet(wake_after=10_000)
+    coordinator = WakeCoordinator()
+    # Accepté par Tesla : rend la main sans attendre l'état online
+    assert await asyncio.wait_for(coordinator.send_wake(fleet, "12"), timeout=1) == "asleep"
+    assert fleet.wakes == 1
+    coordinator._inflight["12"].cancel()
@@ -0,0 +1,55 @@
+-- Migration: Table dédiée aux tokens Tesla en attente de liaison (callback OAuth → utilisateur Supabase)
+-- À exécuter dans l'éditeur SQL de Supabase
+--
+-- Remplace les entrées "temp_token:{state}" de la table tokens : la recherche du
+-- token en attente le plus récent ne fait plus de LIKE sur toute la table tokens,
+-- mais un accès par clé primaire (state) ou un parcours d'index sur created_at.
+
+-- ============================================================================
+-- 1. Table pending_token_links
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS pending_token_links (
+  state TEXT PRIMARY KEY, -- state OAuth du callback
+  token_data JSONB NOT NULL, -- Réponse /token de Tesla (access_token, refresh_token, ...)
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  expires_at TIMESTAMPTZ NOT NULL -- TTL court : un lien non consommé expire
+);
+
+-- Index pour "le lien en attente le plus récent" et pour le nettoyage
+CREATE INDEX IF NOT EXISTS idx_pending_links_created_at ON pending_token_links(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_pending_links_expires_at ON pending_token_links(expires_at);
+
+-- ============================================================================
+-- 2. Nettoyage des liens expirés
+-- ============================================================================
+CREATE OR REPLACE FUNCTION cleanup_expired_pending_links()
+RETURNS void AS $$
+BEGIN
+  DELETE FROM pending_token_links WHERE expires_at < NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- 3. Row Level Security (RLS)
+-- ============================================================================
+ALTER TABLE pending_token_links ENABLE ROW LEVEL SECURITY;
+
+-- Contient des tokens Tesla non liés : accès réservé au service role
+CREATE POLICY "Service role can manage pending links"
+  ON pending_token_links
+  FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+-- ============================================================================
+-- 4. Reprise des anciens tokens temporaires (optionnel)
+-- ============================================================================
+/*
+INSERT INTO pending_token_links (state, token_data, created_at, expires_at)
+SELECT SUBSTRING(key FROM 'temp_token:(.*)'), token_data, updated_at, expires_at
+FROM tokens
+WHERE key LIKE 'temp_token:%' AND expires_at > NOW()
+ON CONFLICT (state) DO NOTHING;
+
+DELETE FROM tokens WHERE key LIKE 'temp_token:%';
+*/
@@ -0,0 +1,16 @@
+-- Migration: ETag des données en cache (réponses conditionnelles If-None-Match / 304)
+-- À exécuter dans l'éditeur SQL de Supabase
+--
+-- L'empreinte du JSON est calculée par l'API à l'écriture (cache_vehicles,
+-- cache_endpoint_response) et relue avec la donnée : une lecture ne re-hash
+-- jamais le corps. Les lignes écrites avant cette migration ont un data_etag
+-- NULL ; l'API le calcule alors à la volée jusqu'à la prochaine synchronisation.
+
+-- ============================================================================
+-- 1. Colonnes data_etag
+-- ============================================================================
+ALTER TABLE vehicles ADD COLUMN IF NOT EXISTS data_etag TEXT;
+ALTER TABLE vehicle_data_cache ADD COLUMN IF NOT EXISTS data_etag TEXT;
+
+COMMENT ON COLUMN vehicles.data_etag IS 'Empreinte de vehicle_data (blake2b), calculée par l''API à l''écriture';
+COMMENT ON COLUMN vehicle_data_cache.data_etag IS 'Empreinte de response_data (blake2b), calculée par l''API à l''écriture';
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark du codec JSON (app/core/json_codec.py) contre json (stdlib).
+
+Usage (depuis backend/) :
+    python scripts/bench_json.py                       # flotte synthétique (vehicle_data complet)
+    python scripts/bench_json.py --vehicles 500
+    python scripts/bench_json.py --file fleet.json     # réponse réelle, ex: GET /api/fleet/supabase/vehicles
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core import json_codec  # noqa: E402
+
+
+def fake_vehicle(i: int) -> dict:
+    """Véhicule avec un vehicle_data proche de celui renvoyé par la Fleet API."""
+    rnd = random.Random(i)
+    vin = f"5YJ3E7EB{i:09d}"
+    return {
+        "id": 1000000000000000 + i,
+        "vehicle_id": 2000000000 + i,
+        "vin": vin,
+        "display_name": f"Model 3 #{i}",
+        "state": rnd.choice(["online", "asleep", "offline"]),
+        "in_service": False,
+        "calendar_enabled": True,
+        "api_version": 71,
+        "tokens": [f"{rnd.getrandbits(64):016x}", f"{rnd.getrandbits(64):016x}"],
+        "vehicle_data": {
+            "charge_state": {
+                "battery_level": rnd.randint(5, 100),
+                "battery_range": round(rnd.uniform(20, 330), 2),
+                "charge_limit_soc": 80,
+                "charge_rate": 0.0,
+                "charger_power": 0,
+                "charging_state": rnd.choice(["Disconnected", "Charging", "Complete", "Stopped"]),
+                "minutes_to_full_charge": 0,
+                "scheduled_charging_pending": False,
+                "timestamp": 1700000000000 + i,
+            },
+            "climate_state": {
+                "inside_temp": round(rnd.uniform(-5, 40), 1),
+                "outside_temp": round(rnd.uniform(-10, 35), 1),
+                "is_climate_on": rnd.random() < 0.2,
+                "driver_temp_setting": 21.0,
+                "passenger_temp_setting": 21.0,
+                "seat_heater_left": 0,
+                "seat_heater_right": 0,
+                "timestamp": 1700000000000 + i,
+            },
+            "drive_state": {
+                "latitude": round(rnd.uniform(43, 51), 6),
+                "longitude": round(rnd.uniform(-4, 8), 6),
+                "heading": rnd.randint(0, 359),
+                "speed": None,
+                "power": 0,
+                "shift_state": None,
+                "timestamp": 1700000000000 + i,
+            },
+            "vehicle_state": {
+                "locked": rnd.random() < 0.8,
+                "odometer": round(rnd.uniform(1000, 150000), 3),
+                "sentry_mode": False,
+                "car_version": "2024.26.7 abcdef012345",
+                "tpms_pressure_fl": 2.9,
+                "tpms_pressure_fr": 2.9,
+                "tpms_pressure_rl": 2.9,
+                "tpms_pressure_rr": 2.9,
+                "df": 0, "dr": 0, "pf": 0, "pr": 0, "ft": 0, "rt": 0,
+                "timestamp": 1700000000000 + i,
+            },
+            "gui_settings": {
+                "gui_distance_units": "km/hr",
+                "gui_temperature_units": "C",
+                "gui_24_hour_time": True,
+            },
+        },
+        "cached_at": "2024-11-14T22:13:20+00:00",
+    }
+
+
+def bench(label: str, func, arg, rounds: int) -> float:
+    func(arg)  # warm-up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    elapsed = (time.perf_counter() - started) / rounds
+    print(f"  {label:<28} {elapsed * 1000:8.3f} ms")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", type=Path, help="Payload JSON réel à utiliser")
+    parser.add_argument("--vehicles", type=int, default=200, help="Taille de la flotte synthétique")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.file:
+        payload = json.loads(args.file.read_text())
+    else:
+        payload = {"vehicles": [fake_vehicle(i) for i in range(args.vehicles)], "count": args.vehicles}
+    encoded = json.dumps(payload).encode()
+    print(f"Payload: {len(encoded) / 1024:.1f} KiB, codec actif: {json_codec.CODEC_NAME}")
+
+    print("Encodage")
+    stdlib_dumps = bench("json.dumps (stdlib)", lambda o: json.dumps(o, default=str).encode(), payload, args.rounds)
+    codec_dumps = bench(f"json_codec.dumps ({json_codec.CODEC_NAME})", json_codec.dumps, payload, args.rounds)
+    print("Décodage")
+    stdlib_loads = bench("json.loads (stdlib)", json.loads, encoded, args.rounds)
+    codec_loads = bench(f"json_codec.loads ({json_codec.CODEC_NAME})", json_codec.loads, encoded, args.rounds)
+
+    print(f"Gain: encodage x{stdlib_dumps / codec_dumps:.1f}, décodage x{stdlib_loads / codec_loads:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,12 @@ import { useEffect, useState } from "react";
 import TelemetryView from "./features/telemetry/TelemetryView";
 import AuthPage from "./components/AuthPage";
 import { apiHealth, type HealthResponse } from "./lib/api";
+import { useAccessToken } from "./lib/session";
 import "./App.css";
 
 function Home() {
   const [health, setHealth] = useState<string>("checking...");
+  const accessToken = useAccessToken();
 
   useEffect(() => {
     apiHealth()
@@ -22,7 +24,7 @@ function Home() {
       </nav>
       <h1>Tesla Fleet Frontend</h1>
       <p>API health: {health}</p>
-      <TelemetryView />
+      <TelemetryView accessToken={accessToken} />
     </div>
   );
 }
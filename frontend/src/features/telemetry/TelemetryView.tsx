@@ -1,27 +1,79 @@
 import { useEffect, useState } from "react";
 
-export default function TelemetryView() {
+const API_BASE = import.meta.env.VITE_API_BASE ?? "http://localhost:8000/api";
+const RETRY_MS = 3000;
+
+interface TelemetryViewProps {
+  // Token Supabase de la session courante : jamais mis dans l'URL, échangé contre un ticket de flux
+  accessToken?: string | null;
+}
+
+async function fetchStreamTicket(accessToken: string): Promise<string> {
+  const res = await fetch(`${API_BASE}/fleet/events/ticket`, {
+    method: "POST",
+    headers: { Authorization: `Bearer ${accessToken}` },
+  });
+  if (!res.ok) throw new Error(`Ticket de flux refusé (${res.status})`);
+  const data = await res.json();
+  return data.ticket;
+}
+
+export default function TelemetryView({ accessToken }: TelemetryViewProps) {
   const [lines, setLines] = useState<string[]>([]);
   const [enabled, setEnabled] = useState(false);
-  
+
   useEffect(() => {
     // Ne se connecter que si VITE_TELEMETRY_URL est explicitement configuré
     const telemetryUrl = import.meta.env.VITE_TELEMETRY_URL;
-    if (!telemetryUrl) {
-      return; // Service de télémetry non configuré, ne rien faire
+    if (!telemetryUrl || !accessToken) {
+      return; // Service de télémetry non configuré ou pas de session, ne rien faire
     }
+    const token = accessToken;
+    const streamUrl = telemetryUrl;
+
+    let es: EventSource | null = null;
+    let lastEventId: string | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let cancelled = false;
 
-    setEnabled(true);
-    const es = new EventSource(telemetryUrl);
-    
-    es.onmessage = (e) => setLines((prev) => [e.data, ...prev].slice(0, 20));
-    es.onerror = () => {
-      console.warn("SSE error - Service de télémetry non disponible");
+    const reconnect = () => {
       setEnabled(false);
+      if (!cancelled) retry = setTimeout(connect, RETRY_MS);
+    };
+
+    // Ticket court et propre au flux : un nouveau à chaque (re)connexion, reprise via last_event_id
+    async function connect() {
+      try {
+        const ticket = await fetchStreamTicket(token);
+        if (cancelled) return;
+        const url = new URL(streamUrl, window.location.href);
+        url.searchParams.set("ticket", ticket);
+        if (lastEventId) url.searchParams.set("last_event_id", lastEventId);
+
+        es = new EventSource(url);
+        setEnabled(true);
+        es.onmessage = (e) => {
+          if (e.lastEventId) lastEventId = e.lastEventId;
+          setLines((prev) => [e.data, ...prev].slice(0, 20));
+        };
+        es.onerror = () => {
+          console.warn("SSE error - Service de télémetry non disponible");
+          es?.close();
+          reconnect();
+        };
+      } catch (err) {
+        console.warn("SSE ticket error:", err);
+        reconnect();
+      }
+    }
+
+    connect();
+    return () => {
+      cancelled = true;
+      clearTimeout(retry);
+      es?.close();
     };
-    
-    return () => es.close();
-  }, []);
+  }, [accessToken]);
 
   // Ne rien afficher si le service n'est pas configuré
   if (!import.meta.env.VITE_TELEMETRY_URL) {
@@ -31,11 +83,13 @@ export default function TelemetryView() {
   return (
     <div style={{ padding: 16 }}>
       <h2>Telemetry (SSE)</h2>
-      {enabled ? (
+      {!accessToken ? (
+        <p style={{ color: "#999" }}>Connectez-vous pour recevoir la télémetry</p>
+      ) : enabled ? (
         <pre>{lines.length > 0 ? lines.join("\n") : "En attente de données..."}</pre>
       ) : (
         <p style={{ color: "#999" }}>Service de télémetry non disponible</p>
       )}
     </div>
   );
-}
\ No newline at end of file
+}
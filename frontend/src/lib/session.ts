@@ -0,0 +1,43 @@
+import { useEffect, useState } from "react";
+
+// Session Supabase telle que supabase-js la persiste : localStorage["sb-<ref>-auth-token"]
+const SUPABASE_URL = import.meta.env.VITE_SUPABASE_URL;
+
+function storageKey(): string | null {
+  if (!SUPABASE_URL) return null;
+  try {
+    return `sb-${new URL(SUPABASE_URL).hostname.split(".")[0]}-auth-token`;
+  } catch {
+    return null;
+  }
+}
+
+export function readAccessToken(): string | null {
+  const key = storageKey();
+  const raw = key ? window.localStorage.getItem(key) : null;
+  if (!raw) return null;
+  try {
+    const session = JSON.parse(raw);
+    // expires_at en secondes : une session expirée n'est pas envoyée au backend
+    if (session?.expires_at && session.expires_at * 1000 <= Date.now()) return null;
+    return session?.access_token ?? null;
+  } catch {
+    return null;
+  }
+}
+
+// Token de la session courante, relu quand supabase-js le renouvelle ou à la déconnexion (autre onglet compris)
+export function useAccessToken(): string | null {
+  const [token, setToken] = useState<string | null>(readAccessToken);
+
+  useEffect(() => {
+    const key = storageKey();
+    const onStorage = (e: StorageEvent) => {
+      if (e.key === null || e.key === key) setToken(readAccessToken());
+    };
+    window.addEventListener("storage", onStorage);
+    return () => window.removeEventListener("storage", onStorage);
+  }, []);
+
+  return token;
+}
@@ -2,6 +2,7 @@
 interface ImportMetaEnv {
   readonly VITE_API_BASE?: string;
   readonly VITE_TELEMETRY_URL?: string;
+  readonly VITE_SUPABASE_URL?: string;
 }
 interface ImportMeta {
   readonly env: ImportMetaEnv;